@@ -0,0 +1,6 @@
+"""オフラインのベンチマーク（Google Sheets / Maps には接続しない）。
+
+    python -m benchmarks.run --scales small,medium --output bench.json
+    python -m benchmarks.compare base.json bench.json
+    python -m benchmarks.load --sessions 200 --concurrency 200   # 同時アクセスの負荷試験（AppTest）
+"""
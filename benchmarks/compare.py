@@ -0,0 +1,43 @@
+"""2つのベンチマーク結果（benchmarks.run の JSON）の中央値を比べる。
+
+    python -m benchmarks.compare base.json new.json --threshold 0.2
+
+threshold を超えて遅くなった項目があれば終了コード 1 を返す。
+"""
+import argparse
+import json
+from typing import Dict, List, Optional, Tuple
+
+
+def load_medians(path: str) -> Dict[Tuple[str, str], float]:
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    return {(row["scale"], row["name"]): row["median_ms"] for row in report["results"]}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description="ベンチマーク結果の比較")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.2, help="遅くなったとみなす比率（0.2 = 20%%）")
+    args = parser.parse_args(argv)
+
+    base = load_medians(args.base)
+    new = load_medians(args.new)
+    regressions = 0
+    print(f"{'scale':>8} {'name':<32} {'base ms':>12} {'new ms':>12} {'change':>8}")
+    for key in sorted(base.keys() & new.keys()):
+        before, after = base[key], new[key]
+        change = (after - before) / before if before > 0 else 0.0
+        mark = ""
+        if change > args.threshold:
+            mark = "  REGRESSION"
+            regressions += 1
+        print(f"{key[0]:>8} {key[1]:<32} {before:12.3f} {after:12.3f} {change:+8.1%}{mark}")
+    for key in sorted(base.keys() - new.keys()):
+        print(f"{key[0]:>8} {key[1]:<32} (missing in {args.new})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
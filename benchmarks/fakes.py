@@ -0,0 +1,171 @@
+"""gspread・googlemaps・写真取得の代わりに使うローカル実装。
+
+latency 秒だけ待ってから決まった値を返し、呼び出し回数を数える。
+error_rate を渡すと、その割合の呼び出しが一時的なエラー（本物なら再試行されるもの）になる。
+"""
+import io
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Sequence
+
+from PIL import Image
+
+from sameshi.places import KEYWORDS
+
+
+class FaultInjector:
+    """latency 秒待ち、error_rate の割合で失敗させる（乱数は seed で再現できる）。"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def wait(self) -> bool:
+        """待ってから、この呼び出しを失敗させるなら True。"""
+        time.sleep(self.latency)
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._rng.random() < self.error_rate
+
+
+class CallCounter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def add(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+    def reset(self) -> None:
+        with self._lock:
+            self.counts.clear()
+
+
+class FakeSpreadsheet:
+    """gspread.Spreadsheet のうち sameshi が使う部分（values_batch_get と get_lastUpdateTime）。"""
+
+    def __init__(
+        self,
+        values: Dict[str, List[List]],
+        latency: float = 0.0,
+        modified_time: str = "2024-01-01T00:00:00Z",
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        self.values = values
+        self.latency = latency
+        self.modified_time = modified_time
+        self.faults = FaultInjector(latency, error_rate, seed)
+        self.calls = CallCounter()
+        self.errors = CallCounter()
+
+    def _call(self, name: str) -> None:
+        self.calls.add(name)
+        if self.faults.wait():
+            self.errors.add(name)
+            raise ConnectionError(f"fake Sheets API error ({name})")
+
+    def get_lastUpdateTime(self) -> str:
+        self._call("get_lastUpdateTime")
+        return self.modified_time
+
+    def values_batch_get(self, ranges: Sequence[str], params: Optional[Dict] = None) -> Dict:
+        self._call("values_batch_get")
+        return {"valueRanges": [{"values": self.values[r.strip("'")]} for r in ranges]}
+
+
+class FakeGspreadClient:
+    def __init__(self, spreadsheet: FakeSpreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key: str) -> FakeSpreadsheet:
+        return self.spreadsheet
+
+
+class FakeGoogleMaps:
+    """googlemaps.Client の places_nearby。
+
+    問い合わせ地点の周り（半径の1.5倍以内）に、地点とキーワードから決まる店を返す。
+    googlemaps.Client の代わりに差し込めるよう key= で作れる。
+    """
+
+    def __init__(
+        self,
+        key: str = "fake-key",
+        latency: float = 0.0,
+        results_per_query: int = 20,
+        seed: int = 0,
+        error_rate: float = 0.0,
+    ):
+        self.key = key
+        self.latency = latency
+        self.results_per_query = results_per_query
+        self.seed = seed
+        self.faults = FaultInjector(latency, error_rate, seed)
+        self.calls = CallCounter()
+        self.errors = CallCounter()
+
+    def places_nearby(self, location=None, radius=None, keyword=None, language=None, page_token=None, **kwargs) -> Dict:
+        self.calls.add("places_nearby")
+        if self.faults.wait():
+            from googlemaps.exceptions import HTTPError
+
+            self.errors.add("places_nearby")
+            raise HTTPError(503)
+        if page_token:
+            return {"results": []}
+        lat, lng = location
+        rng = random.Random(f"{self.seed}:{lat:.4f}:{lng:.4f}:{keyword}")
+        spread = (radius or 200) * 1.5 / 111000
+        results = []
+        for i in range(self.results_per_query):
+            place_id = f"fake-{lat:.4f}-{lng:.4f}-{KEYWORDS.index(keyword) if keyword in KEYWORDS else keyword}-{i}"
+            results.append({
+                "place_id": place_id,
+                "name": f"{keyword}の店{i}",
+                "rating": round(rng.uniform(3.0, 4.8), 1),
+                "geometry": {"location": {
+                    "lat": lat + rng.uniform(-spread, spread),
+                    "lng": lng + rng.uniform(-spread, spread),
+                }},
+                "photos": [{"photo_reference": f"photo-{place_id}"}],
+            })
+        return {"results": results}
+
+
+def sample_jpeg(size: int = 400) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", (size, size), (200, 120, 60)).save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, content: bytes):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakePhotoSession:
+    """requests.Session の代わり（PhotoThumbnailer の session= に渡す）。どの写真にも同じ JPEG を返す。"""
+
+    def __init__(self, latency: float = 0.0, content: Optional[bytes] = None, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.content = content or sample_jpeg()
+        self.faults = FaultInjector(latency, error_rate, seed)
+        self.calls = CallCounter()
+        self.errors = CallCounter()
+
+    def get(self, url: str, timeout=None) -> FakeResponse:
+        self.calls.add("photo")
+        if self.faults.wait():
+            self.errors.add("photo")
+            return FakeResponse(503, b"")
+        return FakeResponse(200, self.content)
@@ -0,0 +1,440 @@
+"""同時アクセスの負荷試験。sameshipassport.py を AppTest で多数のセッションとして同時に動かす。
+
+    python -m benchmarks.load                                         # 50 セッション・同時 20
+    python -m benchmarks.load --sessions 200 --concurrency 200 --scale medium
+    python -m benchmarks.load --places-latency 0.3 --photo-latency 0.1 --error-rate 0.05 --output load.json
+
+Google Sheets・Places・写真は benchmarks.fakes の偽物に差し替える（遅延と失敗率を指定できる）。
+各セッションは「開く → サウナを選ぶ → ガチャを回す → 引き直し × --repulls」を思考時間を挟んで行う。
+全セッションが同じプロセスの中で1つのサービス（カタログ・キャッシュ・スケジューラ）を共有するので、
+Streamlit サーバー1プロセスに同時にアクセスが来たときと同じ条件で測れる。
+
+出すもの:
+- 再実行の応答時間のパーセンタイル（操作ごとと全体）
+- 再実行1回でブラウザに送るバイト数（ForwardMsg の大きさ。ページが数える html.bytes / deck.bytes も）
+- 外部 API の呼び出し回数（偽物が受けた回数・失敗させた回数と、sameshi.metrics のカウンタ）
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from benchmarks.fakes import FakeGoogleMaps, FakePhotoSession, FakeSpreadsheet
+from benchmarks.run import PAGE, REPO_ROOT, git_revision
+from benchmarks.synthetic import SCALES, generate_values
+from sameshi import metrics
+from sameshi.snapshot import write_snapshot
+
+logger = logging.getLogger(__name__)
+
+# sameshi.metrics のカウンタのうち、外部 API まわりとして集計するもの
+OUTBOUND_SUFFIXES = (metrics.REQUEST_SUFFIX, ".coalesced", ".throttled", ".retries", ".stale_served", ".errors")
+
+PHASES = ("open", "select", "pull", "repull")
+
+
+class Rerun(NamedTuple):
+    """ブラウザ側から見た1回の再実行。"""
+
+    session: int
+    phase: str
+    seconds: float
+    bytes: int
+    error: Optional[str]
+
+
+# ------------------ 計測の差し込み ------------------
+class RunCollector(logging.Handler):
+    """sameshi.metrics が再実行ごとに出す JSON 1行を集める。"""
+
+    def __init__(self):
+        super().__init__()
+        self.records: List[Dict] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.records.append(json.loads(record.getMessage()))
+
+
+class ForwardMsgMeter:
+    """AppTest が受け取った ForwardMsg の大きさ（＝本物ならブラウザに送るバイト数）を再実行ごとに測る。
+
+    AppTest.run() は呼び出したスレッドでメッセージを解釈するので、スレッドごとに直近の値を覚えておく。
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def install(self):
+        from streamlit.testing.v1 import local_script_runner
+
+        original = local_script_runner.parse_tree_from_messages
+
+        def parse_tree_from_messages(messages):
+            self._local.bytes = sum(message.ByteSize() for message in messages)
+            return original(messages)
+
+        local_script_runner.parse_tree_from_messages = parse_tree_from_messages
+        return lambda: setattr(local_script_runner, "parse_tree_from_messages", original)
+
+    def take(self) -> int:
+        value = getattr(self._local, "bytes", 0)
+        self._local.bytes = 0
+        return value
+
+
+def share_server_state():
+    """Runtime（の代役）・スクリプトのバイトコード・設定を全セッションで共有させる。戻り値は元に戻す関数。
+
+    AppTest は実行のたびに Runtime._instance を自前のモックに差し替えて終わると None に戻し、
+    スクリプトも毎回コンパイルし直す。同時に動かすと、他のセッションの実行中に None になって
+    落ち、並行した ast.parse も失敗することがある。本物のサーバーでは Runtime もスクリプトの
+    キャッシュもプロセスに1つなので、ここでもそうする。
+    """
+    from unittest.mock import MagicMock
+
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test, local_script_runner
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.dataframe_source_mgr = DataframeSourceManager()
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    script_cache = ScriptCache()
+    saved = Runtime.__dict__["instance"], Runtime.__dict__["exists"], app_test.ScriptCache, config.get_option
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared)
+    Runtime.exists = classmethod(lambda cls: True)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+    # 設定 global.appTest も AppTest が実行ごとに差し替えて戻すので、同時に動かすと他の実行の途中で
+    # False に戻り、ウィジェットの値が AppTest に渡らなくなる。試験の間は常に True にしておく
+    get_option = config.get_option
+    config.get_option = lambda key: True if key == "global.appTest" else get_option(key)
+
+    def restore():
+        Runtime.instance, Runtime.exists, app_test.ScriptCache, config.get_option = saved
+        local_script_runner.ScriptCache = saved[2]
+
+    return restore
+
+
+# ------------------ セッション ------------------
+def find_button(at, *labels: str):
+    for label in labels:
+        for button in at.button:
+            if button.label == label:
+                return button
+    return None
+
+
+def run_session(index: int, args, sauna_names: List[str], meter: ForwardMsgMeter, start_at: float) -> List[Rerun]:
+    """1人ぶんの操作。ページの例外は記録して続け、AppTest 自体の失敗（タイムアウトなど）で打ち切る。"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = random.Random(f"{args.seed}:{index}")
+    delay = start_at - time.perf_counter()
+    if delay > 0:
+        time.sleep(delay)
+
+    at = AppTest.from_file(PAGE, default_timeout=args.timeout)
+    reruns: List[Rerun] = []
+    steps = ["open", "select", "pull"] + ["repull"] * args.repulls
+    for step, phase in enumerate(steps):
+        if step and args.think:
+            time.sleep(rng.uniform(0, 2 * args.think))
+        if phase == "select":
+            selectbox = next((s for s in at.selectbox if s.label == "サウナ施設"), None)
+            if selectbox is not None:
+                selectbox.set_value(rng.choice(sauna_names))
+        elif phase in ("pull", "repull"):
+            button = find_button(at, "もう一度ガチャを回す", "ガチャを回す")
+            if button is not None:
+                button.click()
+        start = time.perf_counter()
+        try:
+            at.run()
+        except Exception as e:
+            logger.exception("session %d aborted during %s", index, phase)
+            reruns.append(Rerun(index, phase, time.perf_counter() - start, meter.take(), f"{type(e).__name__}: {e}"))
+            break
+        seconds = time.perf_counter() - start
+        error = str(at.exception[0].value) if at.exception else None
+        reruns.append(Rerun(index, phase, seconds, meter.take(), error))
+    return reruns
+
+
+# ------------------ 集計 ------------------
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms) if ms else 0.0,
+        "p50_ms": metrics.quantile(ms, 0.5),
+        "p95_ms": metrics.quantile(ms, 0.95),
+        "p99_ms": metrics.quantile(ms, 0.99),
+        "max_ms": ms[-1] if ms else 0.0,
+    }
+
+
+def bytes_summary(samples: List[int]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered) if ordered else 0.0,
+        "p95": metrics.quantile(ordered, 0.95),
+        "max": ordered[-1] if ordered else 0,
+    }
+
+
+def summarize_load(
+    reruns: List[Rerun], records: List[Dict], fakes: Dict, wall: float, sessions: int, steps_per_session: int
+) -> Dict:
+    by_phase: Dict[str, List[Rerun]] = defaultdict(list)
+    for rerun in reruns:
+        by_phase[rerun.phase].append(rerun)
+    phases = {}
+    for phase in PHASES + ("all",):
+        rows = reruns if phase == "all" else by_phase.get(phase, [])
+        if not rows:
+            continue
+        phases[phase] = dict(
+            latency_summary([r.seconds for r in rows]),
+            forward_msg_bytes=bytes_summary([r.bytes for r in rows]),
+            page_errors=sum(1 for r in rows if r.error),
+        )
+
+    # ページ側の計測（sameshi.metrics）: 再実行の種類ごとの件数と、送った HTML・地図の大きさ
+    counters: Dict[str, int] = defaultdict(int)
+    runs_by_kind: Dict[str, int] = defaultdict(int)
+    for record in records:
+        runs_by_kind[record["kind"]] += 1
+        for name, n in record["counters"].items():
+            counters[name] += n
+    page_runs = max(1, len(records))
+    outbound = {name: n for name, n in sorted(counters.items()) if name.endswith(OUTBOUND_SUFFIXES)}
+    fake_calls = {name: dict(fake.calls.counts) for name, fake in fakes.items()}
+    fake_errors = {name: dict(fake.errors.counts) for name, fake in fakes.items()}
+    total_calls = sum(fake.calls.total() for fake in fakes.values())
+    errors = [r for r in reruns if r.error]
+    steps: Dict[int, int] = defaultdict(int)
+    for rerun in reruns:
+        steps[rerun.session] += 1
+    return {
+        "sessions": sessions,
+        "completed_sessions": sum(1 for n in steps.values() if n == steps_per_session),
+        "reruns": len(reruns),
+        "wall_seconds": round(wall, 3),
+        "reruns_per_second": round(len(reruns) / wall, 2) if wall else 0.0,
+        "phases": phases,
+        "page_runs": dict(runs_by_kind),
+        "page_bytes_per_run": {
+            "html": round(counters.get("html.bytes", 0) / page_runs, 1),
+            "deck": round(counters.get("deck.bytes", 0) / page_runs, 1),
+        },
+        "outbound": {
+            "fake_calls": fake_calls,
+            "fake_errors": fake_errors,
+            "calls_per_rerun": round(total_calls / max(1, len(reruns)), 3),
+            "metrics": outbound,
+        },
+        "error_samples": sorted({r.error for r in errors})[:5],
+    }
+
+
+def print_summary(summary: Dict) -> None:
+    out = sys.stderr
+    print(
+        f"{summary['completed_sessions']}/{summary['sessions']} sessions, {summary['reruns']} reruns in {summary['wall_seconds']} s"
+        f" ({summary['reruns_per_second']} reruns/s)",
+        file=out,
+    )
+    for phase, row in summary["phases"].items():
+        print(
+            f"{phase:>8}  n {row['n']:5d}  p50 {row['p50_ms']:9.1f} ms  p95 {row['p95_ms']:9.1f} ms"
+            f"  p99 {row['p99_ms']:9.1f} ms  max {row['max_ms']:9.1f} ms"
+            f"  bytes {row['forward_msg_bytes']['mean']:10.0f}  errors {row['page_errors']}",
+            file=out,
+        )
+    outbound = summary["outbound"]
+    for name, calls in outbound["fake_calls"].items():
+        errors = outbound["fake_errors"][name]
+        print(f"{name:>8}  calls {calls}  errors {errors}", file=out)
+    print(f"outbound calls per rerun: {outbound['calls_per_rerun']}", file=out)
+    for name, n in outbound["metrics"].items():
+        print(f"{'':>8}  {name} {n}", file=out)
+    for sample in summary["error_samples"]:
+        print(f"  error: {sample}", file=out)
+
+
+# ------------------ 実行 ------------------
+def run(args) -> Dict:
+    import googlemaps
+    import streamlit as st
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import AppTest
+
+    import sameshi.photos
+    import sameshi.refresh
+    import sameshi.sheets
+
+    values = generate_values(SCALES[args.scale], seed=args.seed)
+    sauna_names = [row[1] for row in values["Saunas"][1:]]
+    spreadsheet = FakeSpreadsheet(
+        values, latency=args.sheets_latency, error_rate=args.error_rate, seed=args.seed,
+        # 手元のスナップショットより新しい版がシートにある状態から始める
+        modified_time="2099-01-01T00:00:00Z",
+    )
+    gmaps = FakeGoogleMaps(latency=args.places_latency, error_rate=args.error_rate, seed=args.seed)
+    photo_session = FakePhotoSession(latency=args.photo_latency, error_rate=args.error_rate, seed=args.seed)
+    fakes = {"sheets": spreadsheet, "places": gmaps, "photos": photo_session}
+
+    collector = RunCollector()
+    meter = ForwardMsgMeter()
+    saved = {
+        "client": googlemaps.Client,
+        "session": sameshi.photos.make_session,
+        "open_spreadsheet": sameshi.refresh.open_spreadsheet,
+        "credentials": sameshi.sheets.service_account_credentials,
+        "secrets": st.secrets,
+        "level": metrics.logger.level,
+        "propagate": metrics.logger.propagate,
+        "environ": dict(os.environ),
+    }
+    workdir = tempfile.mkdtemp(prefix="sameshi-load-")
+    cwd = os.getcwd()
+    uninstall_meter = meter.install()
+    restore_server_state = share_server_state()
+    try:
+        snapshot_path = os.path.join(workdir, "snapshot.sqlite")
+        write_snapshot(snapshot_path, values, modified_time="2024-01-01T00:00:00Z")
+        googlemaps.Client = lambda key=None, **kwargs: gmaps
+        sameshi.photos.make_session = lambda pool_size=16: photo_session
+        sameshi.refresh.open_spreadsheet = lambda sheet_id, creds: spreadsheet
+        sameshi.sheets.service_account_credentials = lambda info=None, keyfile=None: object()
+        os.environ.update({"SAMESHI_SNAPSHOT": snapshot_path, "SAMESHI_CACHE_DIR": os.path.join(workdir, "cache")})
+        os.environ.pop("SAMESHI_CACHE_URL", None)
+        os.environ.pop("SAMESHI_NEARBY_TABLE", None)
+        if args.offline:
+            os.environ["SAMESHI_OFFLINE"] = "1"
+        else:
+            os.environ.pop("SAMESHI_OFFLINE", None)
+        # AppTest は実行ごとに st.secrets を差し替えて戻すので、同時に動かすと取り違える。
+        # 全セッション共通の値を先に置いておき、AppTest には渡さない
+        secrets = Secrets()
+        secrets._secrets = {"gcp_service_account": {}, "env": {"GOOGLE_API_KEY": "fake-key"}}
+        st.secrets = secrets
+        metrics.logger.addHandler(collector)
+        metrics.logger.setLevel(logging.INFO)
+        metrics.logger.propagate = False
+        os.chdir(REPO_ROOT)
+        st.cache_resource.clear()
+
+        # 起動済みのサーバーに来た想定にする: 1人ぶん開いてスクリプトのコンパイル・遅延 import・
+        # シートの取り込みを済ませてから、計測をやり直す（Places・写真のキャッシュは空のまま）
+        warmup = AppTest.from_file(PAGE, default_timeout=args.timeout)
+        warmup.run()
+        if warmup.exception:
+            raise RuntimeError(f"page raised during warmup: {warmup.exception[0].value}")
+        if not args.offline:
+            # 最初の表示で始まるバックグラウンドのシート取り込みを待つ
+            deadline = time.perf_counter() + args.timeout
+            while time.perf_counter() < deadline and not (
+                spreadsheet.calls.counts.get("values_batch_get") or spreadsheet.errors.total()
+            ):
+                time.sleep(0.05)
+        for fake in fakes.values():
+            fake.calls.reset()
+            fake.errors.reset()
+        collector.records.clear()
+        meter.take()
+
+        start = time.perf_counter()
+        spacing = args.ramp / args.sessions
+        with ThreadPoolExecutor(max_workers=args.concurrency, thread_name_prefix="sameshi-load") as executor:
+            futures = [
+                executor.submit(run_session, i, args, sauna_names, meter, start + i * spacing)
+                for i in range(args.sessions)
+            ]
+            reruns = [rerun for future in futures for rerun in future.result()]
+        wall = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+        uninstall_meter()
+        restore_server_state()
+        metrics.logger.removeHandler(collector)
+        metrics.logger.setLevel(saved["level"])
+        metrics.logger.propagate = saved["propagate"]
+        googlemaps.Client = saved["client"]
+        sameshi.photos.make_session = saved["session"]
+        sameshi.refresh.open_spreadsheet = saved["open_spreadsheet"]
+        sameshi.sheets.service_account_credentials = saved["credentials"]
+        st.secrets = saved["secrets"]
+        os.environ.clear()
+        os.environ.update(saved["environ"])
+        st.cache_resource.clear()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize_load(reruns, collector.records, fakes, wall, args.sessions, 3 + args.repulls)
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k != "output"},
+            "scale": dict(SCALES[args.scale]._asdict(), menu_rows=SCALES[args.scale].menu_rows),
+        },
+        "summary": summary,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.load", description="同時アクセスの負荷試験（AppTest）")
+    parser.add_argument("--scale", default="small", choices=list(SCALES))
+    parser.add_argument("--sessions", type=int, default=50, help="セッション（利用者）の数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時に動かすセッションの数")
+    parser.add_argument("--repulls", type=int, default=2, help="1セッションあたりの引き直しの回数")
+    parser.add_argument("--think", type=float, default=0.0, help="操作の間の思考時間の平均（秒）")
+    parser.add_argument("--ramp", type=float, default=0.0, help="全セッションが開き終わるまでの時間（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="Sheets API 1回あたりの遅延（秒）")
+    parser.add_argument("--places-latency", type=float, default=0.0, help="Places API 1回あたりの遅延（秒）")
+    parser.add_argument("--photo-latency", type=float, default=0.0, help="写真1枚の取得の遅延（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="偽の Google が一時的なエラーを返す割合")
+    parser.add_argument("--offline", action="store_true", help="Google Sheets にアクセスしない（SAMESHI_OFFLINE=1）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="再実行1回のタイムアウト（秒）")
+    parser.add_argument("--output", help="結果の JSON の書き出し先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+    if args.sessions < 1 or args.concurrency < 1:
+        parser.error("--sessions and --concurrency must be positive")
+    if not 0.0 <= args.error_rate <= 1.0:
+        parser.error("--error-rate must be between 0 and 1")
+
+    report = run(args)
+    print_summary(report["summary"])
+    payload = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,393 @@
+"""ベンチマークの実行。結果は JSON（--output）と表で出す。
+
+    python -m benchmarks.run                                  # tiny, small
+    python -m benchmarks.run --scales medium,large --repeat 3
+    python -m benchmarks.run --render --places-latency 0.2 --output bench.json
+    python -m benchmarks.run --api                            # JSON API（ASGI アプリを直接呼ぶ）
+    python -m benchmarks.run --precompute                     # 周辺のお店の事前計算と、その表からの表示
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fakes import FakeGoogleMaps, FakePhotoSession, FakeSpreadsheet
+from benchmarks.synthetic import SCALES, Scale, generate_values
+from sameshi import gacha, places
+from sameshi.cache import SqliteTTLCache
+from sameshi.outbound import OutboundScheduler
+from sameshi.sheets import SHEET_NAMES, fetch_values
+from sameshi.snapshot import build_snapshot, load_snapshot, write_snapshot
+from sameshi.tags import TagFilter, TagIndex, parse_tag_filter
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE = os.path.join(REPO_ROOT, "sameshipassport.py")
+
+# 検索系は1回が短いので、まとめて呼んだ時間を呼び出し回数で割る
+LOOKUP_BATCH = 1000
+
+
+def summarize(samples: List[float], per_call: int = 1) -> Dict[str, float]:
+    ms = sorted(s * 1000 / per_call for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": statistics.fmean(ms),
+        "median_ms": statistics.median(ms),
+        "p95_ms": ms[min(len(ms) - 1, round(0.95 * (len(ms) - 1)))],
+        "min_ms": ms[0],
+        "max_ms": ms[-1],
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int, warmup: int = 1) -> List[float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class Results:
+    def __init__(self):
+        self.rows: List[Dict] = []
+
+    def add(self, scale: str, name: str, samples: List[float], per_call: int = 1, **extra) -> None:
+        row = {"scale": scale, "name": name, **summarize(samples, per_call)}
+        if per_call > 1:
+            row["calls_per_sample"] = per_call
+        row.update(extra)
+        self.rows.append(row)
+        print(f"{scale:>8} {name:<32} median {row['median_ms']:10.3f} ms  p95 {row['p95_ms']:10.3f} ms", file=sys.stderr)
+
+
+# ------------------ 各ベンチマーク ------------------
+def bench_catalog(results: Results, scale_name: str, values: Dict[str, List[List]], args, workdir: str):
+    spreadsheet = FakeSpreadsheet(values, latency=args.sheets_latency)
+
+    def load_from_sheets():
+        return build_snapshot(fetch_values(spreadsheet, SHEET_NAMES), spreadsheet.get_lastUpdateTime())
+
+    results.add(scale_name, "catalog_load_sheets", measure(load_from_sheets, args.repeat, warmup=0))
+
+    path = os.path.join(workdir, f"{scale_name}.sqlite")
+    samples = measure(lambda: write_snapshot(path, values), args.repeat, warmup=0)
+    results.add(scale_name, "snapshot_write", samples, bytes=os.path.getsize(path))
+    results.add(scale_name, "catalog_load_snapshot", measure(lambda: load_snapshot(path), args.repeat, warmup=0))
+    return load_snapshot(path).catalog, path
+
+
+def bench_lookups(results: Results, scale_name: str, catalog, args):
+    rng = random.Random(args.seed)
+    sauna_ids = [s.id for s in catalog.saunas]
+    restaurant_ids = [r.id for r in catalog.restaurants]
+    menu_ids = [m.id for m in catalog.menu_items]
+    sample_saunas = [rng.choice(sauna_ids) for _ in range(LOOKUP_BATCH)]
+    sample_restaurants = [rng.choice(restaurant_ids) for _ in range(LOOKUP_BATCH)]
+    sample_menus = [rng.choice(menu_ids) for _ in range(LOOKUP_BATCH)]
+
+    lookups = {
+        "get_restaurants_by_sauna": (catalog.get_restaurants_by_sauna, sample_saunas),
+        "get_menu_items_by_restaurant": (catalog.get_menu_items_by_restaurant, sample_restaurants),
+        "get_tags_for_menu_item": (catalog.get_tags_for_menu_item, sample_menus),
+        "get_all_menu_items_for_sauna": (catalog.get_all_menu_items_for_sauna, sample_saunas),
+    }
+    for name, (fn, keys) in lookups.items():
+        results.add(scale_name, name, measure(lambda: [fn(k) for k in keys], args.repeat), per_call=LOOKUP_BATCH)
+
+    draw_rng = random.Random(args.seed)
+    candidates = [catalog.get_all_menu_items_for_sauna(s) for s in sample_saunas[:100]]
+    results.add(
+        scale_name, "get_random_menus_by_category",
+        measure(lambda: [gacha.get_random_menus_by_category(c, draw_rng) for c in candidates], args.repeat),
+        per_call=len(candidates),
+    )
+    engine = gacha.GachaEngine(catalog, seed=args.seed)
+    results.add(
+        scale_name, "gacha_engine_pull",
+        measure(lambda: [engine.pull(s) for s in sample_saunas], args.repeat),
+        per_call=LOOKUP_BATCH,
+    )
+
+    # タグでの絞り込み: 転置インデックスの構築と、絞り込みありのガチャ（OR と NOT の組み合わせ）
+    results.add(scale_name, "tag_index_build", measure(lambda: TagIndex(catalog), args.repeat))
+    tag_names = [t.name for t in catalog.tags]
+    filters = [
+        parse_tag_filter(f"{rng.choice(tag_names)}|{rng.choice(tag_names)}|{rng.choice(tag_names)} -{rng.choice(tag_names)}")
+        for _ in range(20)
+    ] if tag_names else [TagFilter()]
+    sample_filters = [rng.choice(filters) for _ in range(LOOKUP_BATCH)]
+    filtered_engine = gacha.GachaEngine(catalog, seed=args.seed)
+    results.add(
+        scale_name, "gacha_engine_pull_filtered",
+        measure(lambda: [filtered_engine.pull(s, tag_filter=f) for s, f in zip(sample_saunas, sample_filters)], args.repeat),
+        per_call=LOOKUP_BATCH,
+    )
+
+    # 予算内ガチャ: 入浴料 + 1,500円（合成データのメニューは300〜1,500円なので、かなり厳しい予算）
+    budgets = {s.id: s.price + 1500 for s in catalog.saunas}
+    plan_saunas = list(dict.fromkeys(sample_saunas))[:100]
+
+    def build_plans():
+        cold = gacha.GachaEngine(catalog, seed=args.seed)
+        return [cold.budget_plan(s, budgets[s]) for s in plan_saunas]
+
+    results.add(scale_name, "gacha_budget_plan_build", measure(build_plans, args.repeat), per_call=len(plan_saunas))
+    budget_engine = gacha.GachaEngine(catalog, seed=args.seed)
+    results.add(
+        scale_name, "gacha_engine_pull_budget",
+        measure(lambda: [budget_engine.pull(s, budget=budgets[s]) for s in sample_saunas], args.repeat),
+        per_call=LOOKUP_BATCH,
+    )
+
+
+def bench_nearby(results: Results, scale_name: str, catalog, args, workdir: str):
+    rng = random.Random(args.seed)
+    targets = [rng.choice(catalog.saunas) for _ in range(args.repeat)]
+    gmaps = FakeGoogleMaps(latency=args.places_latency, seed=args.seed)
+    # 偽の Google なので速度制限はかけない（既定のスケジューラだとトークン待ちを測ってしまう）
+    scheduler = OutboundScheduler("places", rate=1e9, burst=10**9)
+
+    samples = []
+    for i, sauna in enumerate(targets):
+        cache = SqliteTTLCache(os.path.join(workdir, f"places-{scale_name}-{i}.sqlite"))
+        start = time.perf_counter()
+        places.find_nearby_good_food(gmaps, sauna.latitude, sauna.longitude, cache=cache, scheduler=scheduler)
+        samples.append(time.perf_counter() - start)
+        cache.close()
+    results.add(scale_name, "find_nearby_good_food_cold", samples, places_calls=gmaps.calls.total())
+
+    cache = SqliteTTLCache(os.path.join(workdir, f"places-{scale_name}-warm.sqlite"))
+    sauna = targets[0]
+    gmaps.calls.reset()
+    warm = measure(
+        lambda: places.find_nearby_good_food(gmaps, sauna.latitude, sauna.longitude, cache=cache, scheduler=scheduler),
+        args.repeat,
+    )
+    results.add(scale_name, "find_nearby_good_food_warm", warm, places_calls=gmaps.calls.total() - len(places.KEYWORDS))
+    cache.close()
+
+
+def bench_precompute(results: Results, scale_name: str, snapshot_path: str, args, workdir: str):
+    """sameshi.nearby の表を全サウナぶん作り、差分更新と表からの読み出しを測る。"""
+    from sameshi.nearby import NearbyTable, refresh_table
+    from sameshi.service import SameshiService, open_catalog_store
+
+    gmaps = FakeGoogleMaps(latency=args.places_latency, seed=args.seed)
+    table_path = os.path.join(workdir, f"nearby-{scale_name}.sqlite")
+    service = SameshiService(
+        open_catalog_store(snapshot_path=snapshot_path),
+        api_key="fake-key",
+        cache_dir=os.path.join(workdir, f"precompute-{scale_name}"),
+        gmaps=gmaps,
+        photo_session=FakePhotoSession(latency=args.photo_latency),
+        nearby_table=table_path,
+        # 偽の Google なので速度制限はかけない
+        places_scheduler=OutboundScheduler("places", rate=1e9, burst=10**9),
+        photo_scheduler=OutboundScheduler("photos", rate=1e9, burst=10**9),
+    )
+    catalog = service.catalog
+    table = NearbyTable(table_path)
+    start = time.perf_counter()
+    stats = refresh_table(table, catalog, service)
+    results.add(scale_name, "nearby_precompute_full", [time.perf_counter() - start], saunas=stats.refreshed,
+                places_calls=gmaps.calls.total(),
+                bytes=sum(os.path.getsize(p) for p in (table_path, table_path + "-wal") if os.path.exists(p)))
+
+    gmaps.calls.reset()
+    results.add(scale_name, "nearby_precompute_incremental",
+                measure(lambda: refresh_table(table, catalog, service), args.repeat, warmup=0),
+                places_calls=gmaps.calls.total())
+
+    rng = random.Random(args.seed)
+    saunas = [rng.choice(catalog.saunas) for _ in range(100)]
+    gmaps.calls.reset()
+    results.add(scale_name, "nearby_for_sauna_table",
+                measure(lambda: [service.nearby_for_sauna(s) for s in saunas], args.repeat),
+                per_call=len(saunas), places_calls=gmaps.calls.total())
+    table.close()
+
+
+def bench_render(results: Results, scale_name: str, snapshot_path: str, args, workdir: str):
+    """AppTest でページ全体を実行する（初回表示・初回ガチャ・引き直し）。"""
+    import googlemaps
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import sameshi.photos
+
+    gmaps = FakeGoogleMaps(latency=args.places_latency, seed=args.seed)
+    photo_session = FakePhotoSession(latency=args.photo_latency)
+    original_client, original_session = googlemaps.Client, sameshi.photos.make_session
+    googlemaps.Client = lambda key=None, **kwargs: gmaps
+    sameshi.photos.make_session = lambda pool_size=16: photo_session
+    os.environ.update({
+        "SAMESHI_SNAPSHOT": snapshot_path,
+        "SAMESHI_OFFLINE": "1",
+        "SAMESHI_CACHE_DIR": os.path.join(workdir, f"render-{scale_name}"),
+    })
+    cwd = os.getcwd()
+    os.chdir(REPO_ROOT)
+    try:
+        phases: Dict[str, List[float]] = {"initial": [], "first_pull": [], "repull": []}
+        html_bytes: Dict[str, int] = {}
+        for _ in range(args.repeat):
+            st.cache_resource.clear()
+            at = AppTest.from_file(PAGE, default_timeout=600)
+            at.secrets["env"] = {"GOOGLE_API_KEY": "fake-key"}
+            for phase in phases:
+                if phase != "initial":
+                    label = "ガチャを回す" if phase == "first_pull" else "もう一度ガチャを回す"
+                    next(b for b in at.button if b.label == label).click()
+                start = time.perf_counter()
+                at.run()
+                phases[phase].append(time.perf_counter() - start)
+                if at.exception:
+                    raise RuntimeError(f"page raised during {phase}: {at.exception[0].value}")
+                html_bytes[phase] = sum(len(m.value) for m in at.markdown)
+        for phase, samples in phases.items():
+            results.add(scale_name, f"render_{phase}", samples, html_bytes=html_bytes[phase])
+        results.rows[-1]["places_calls"] = gmaps.calls.total()
+        results.rows[-1]["photo_calls"] = photo_session.calls.total()
+    finally:
+        os.chdir(cwd)
+        googlemaps.Client, sameshi.photos.make_session = original_client, original_session
+
+
+# ------------------ 実行 ------------------
+async def asgi_get(app, path: str, query: str = "", headers=()) -> Dict:
+    """ASGI アプリに GET を1回送り、status・ヘッダー・本文を返す（サーバーを立てずに測る）。"""
+    scope = {
+        "type": "http", "method": "GET", "path": path, "query_string": query.encode(),
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    }
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = dict(message["headers"])
+        else:
+            response["body"] += message.get("body", b"")
+
+    await app(scope, receive, send)
+    return response
+
+
+def bench_api(results: Results, scale_name: str, snapshot_path: str, args, workdir: str):
+    from sameshi.api import create_app
+
+    gmaps = FakeGoogleMaps(latency=args.places_latency, seed=args.seed)
+    app = create_app(snapshot_path=snapshot_path, cache_dir=os.path.join(workdir, f"api-{scale_name}"), gmaps=gmaps)
+    catalog = app.service.catalog
+    rng = random.Random(args.seed)
+    sauna_ids = [rng.choice(catalog.saunas).id for _ in range(LOOKUP_BATCH)]
+
+    async def batch(paths, query="", headers=()):
+        for path in paths:
+            await asgi_get(app, path, query, headers)
+
+    def timed_batch(paths, query="", headers=()):
+        return lambda: asyncio.run(batch(paths, query, headers))
+
+    gacha_batch = [f"/saunas/{s}/gacha" for s in sauna_ids]
+    results.add(scale_name, "api_gacha", measure(timed_batch(gacha_batch), args.repeat), per_call=LOOKUP_BATCH)
+    menus_batch = [f"/saunas/{s}/menus" for s in sauna_ids]
+    results.add(scale_name, "api_menus", measure(timed_batch(menus_batch), args.repeat), per_call=LOOKUP_BATCH)
+    results.add(scale_name, "api_saunas", measure(timed_batch(["/saunas"]), args.repeat))
+    etag = asyncio.run(asgi_get(app, "/saunas"))["headers"][b"etag"].decode()
+    results.add(
+        scale_name, "api_saunas_not_modified",
+        measure(timed_batch(["/saunas"] * LOOKUP_BATCH, headers=[("if-none-match", etag)]), args.repeat),
+        per_call=LOOKUP_BATCH,
+    )
+    nearby = [f"/saunas/{s}/nearby" for s in sauna_ids[:args.repeat]]
+    gmaps.calls.reset()
+    results.add(scale_name, "api_nearby_cold", measure(timed_batch(nearby), 1, warmup=0), per_call=len(nearby),
+                places_calls=gmaps.calls.total())
+    gmaps.calls.reset()
+    results.add(scale_name, "api_nearby_warm", measure(timed_batch(nearby), args.repeat), per_call=len(nearby),
+                places_calls=gmaps.calls.total())
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> Dict:
+    results = Results()
+    with tempfile.TemporaryDirectory(prefix="sameshi-bench-") as workdir:
+        for scale_name in args.scales:
+            scale: Scale = SCALES[scale_name]
+            values = generate_values(scale, seed=args.seed)
+            catalog, snapshot_path = bench_catalog(results, scale_name, values, args, workdir)
+            bench_lookups(results, scale_name, catalog, args)
+            bench_nearby(results, scale_name, catalog, args, workdir)
+            if args.render:
+                bench_render(results, scale_name, snapshot_path, args, workdir)
+            if args.precompute:
+                bench_precompute(results, scale_name, snapshot_path, args, workdir)
+            if args.api:
+                bench_api(results, scale_name, snapshot_path, args, workdir)
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k != "output"},
+            "scales": {name: dict(SCALES[name]._asdict(), menu_rows=SCALES[name].menu_rows) for name in args.scales},
+        },
+        "results": results.rows,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="オフラインのベンチマーク")
+    parser.add_argument("--scales", default="tiny,small", type=lambda s: s.split(","),
+                        help=f"カンマ区切り（{', '.join(SCALES)}）")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sheets-latency", type=float, default=0.0, help="Sheets API 1回あたりの遅延（秒）")
+    parser.add_argument("--places-latency", type=float, default=0.0, help="Places API 1回あたりの遅延（秒）")
+    parser.add_argument("--photo-latency", type=float, default=0.0, help="写真1枚の取得の遅延（秒）")
+    parser.add_argument("--render", action="store_true", help="AppTest でページ全体の描画も測る")
+    parser.add_argument("--precompute", action="store_true", help="周辺のお店の事前計算（sameshi.nearby）も測る")
+    parser.add_argument("--api", action="store_true", help="JSON API（sameshi.api）の応答時間も測る")
+    parser.add_argument("--output", help="結果の JSON の書き出し先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+    unknown = [s for s in args.scales if s not in SCALES]
+    if unknown:
+        parser.error(f"unknown scales: {unknown}")
+
+    report = run(args)
+    payload = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+"""ベンチマーク用の合成ワークシート。
+
+本番のシートと同じ列構成の生の値（1行目がヘッダー）を、件数を指定して作る。
+同じ seed なら同じ値になる。
+"""
+import random
+from typing import Dict, List, NamedTuple
+
+from sameshi.sheets import SHEET_NAMES
+
+
+class Scale(NamedTuple):
+    saunas: int
+    restaurants_per_sauna: int
+    menus_per_restaurant: int
+    tags: int
+    tags_per_menu: int
+
+    @property
+    def menu_rows(self) -> int:
+        return self.saunas * self.restaurants_per_sauna * self.menus_per_restaurant
+
+
+# large はメニュー100万行・タグ関連100万行
+SCALES = {
+    "tiny": Scale(10, 2, 10, 20, 1),
+    "small": Scale(100, 3, 15, 50, 1),
+    "medium": Scale(1000, 5, 20, 200, 1),
+    "large": Scale(10000, 5, 20, 500, 1),
+}
+
+# 東京周辺に散らばせる
+CENTER = (35.68, 139.76)
+SPREAD_DEGREES = 0.5
+
+CATEGORIES = ["main", "main", "drink", "drink", "drink"]
+RARITIES = ["n", "n", "n", "r", "sr", "ssr"]
+IMAGE_FILES = ["3curry.jpg", "3superdry.jpg", "1lemonsour.png", "2chashu.jpg", ""]
+
+
+def generate_values(scale: Scale, seed: int = 0) -> Dict[str, List[List]]:
+    rng = random.Random(seed)
+    saunas = [["id", "name", "latitude", "longitude", "price"]]
+    for i in range(1, scale.saunas + 1):
+        saunas.append([
+            i,
+            f"サウナ{i:05d}",
+            round(CENTER[0] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 6),
+            round(CENTER[1] + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES), 6),
+            f"{rng.choice([800, 1000, 1200, 1500, 2000, 2800]):,}",
+        ])
+
+    restaurants = [["id", "sauna_id", "name"]]
+    menus = [["id", "restaurant_id", "name", "price", "description", "category", "image_file", "rarity"]]
+    relations = [["menuitemid", "tag_id"]]
+    restaurant_id = menu_id = 0
+    for sauna_id in range(1, scale.saunas + 1):
+        for _ in range(scale.restaurants_per_sauna):
+            restaurant_id += 1
+            restaurants.append([restaurant_id, sauna_id, f"食堂{restaurant_id}"])
+            for _ in range(scale.menus_per_restaurant):
+                menu_id += 1
+                menus.append([
+                    menu_id,
+                    restaurant_id,
+                    f"メニュー{menu_id}",
+                    rng.randrange(300, 1500, 10),
+                    "サウナ後にぴったりの一品",
+                    rng.choice(CATEGORIES),
+                    rng.choice(IMAGE_FILES),
+                    rng.choice(RARITIES),
+                ])
+                for tag_id in rng.sample(range(1, scale.tags + 1), scale.tags_per_menu):
+                    relations.append([menu_id, tag_id])
+
+    tags = [["id", "name"]] + [[i, f"タグ{i}"] for i in range(1, scale.tags + 1)]
+    values = {
+        "Saunas": saunas,
+        "Restaurants": restaurants,
+        "Menu": menus,
+        "MenuTags": tags,
+        "MenuTagRelation": relations,
+    }
+    return {name: values[name] for name in SHEET_NAMES}
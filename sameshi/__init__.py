@@ -0,0 +1 @@
+"""サ飯パスポートのコアロジック（Streamlit 非依存）。"""
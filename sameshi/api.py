@@ -0,0 +1,334 @@
+"""JSON API（ASGI アプリ。Streamlit 非依存）。
+
+Streamlit のページと同じ SameshiService（メモリ上の索引付きカタログ）を使い、
+サウナ一覧・メニュー・ガチャ・周辺検索を JSON で返す。フレームワークには依存しない
+素の ASGI アプリなので、uvicorn などの ASGI サーバーでそのまま動く。
+
+    GET /saunas                      サウナ一覧
+    GET /saunas/{id}/menus           そのサウナで出るメニュー（タグ付き）
+    GET /saunas/{id}/gacha?n=1       main 1品 + drink 2品を n 回引き、回ごとのリストで返す（n=1 でも [[...]]）
+                          &tags=     タグで絞り込む（"辛い ご当地|限定 -甘い" = AND / OR / NOT）
+                          &budget=   入浴料込みの予算（円）。収まる組み合わせが無ければ 422
+    GET /tags                        メニューが1つ以上あるタグ
+    GET /saunas/{id}/nearby?radius=  徒歩圏内の高評価なお店（キャッシュ付きの周辺検索）
+    GET /healthz, GET /metrics
+
+カタログ由来の応答には版（catalog.version）の ETag を付け、If-None-Match が
+一致すれば 304 を返す。JSON はカタログの版ごとに組み立てて使い回すので、
+ガチャ1回のコストは抽選と bytes の連結だけになる。カタログの読み込みと版ごとの索引
+（タグのビット集合・ガチャの候補）の組み立て、ガチャの抽選、Google を呼ぶことがある
+周辺検索はスレッドプールで実行し、イベントループを止めない。索引は起動時（lifespan）にも作っておく。
+
+    python -m sameshi.api --snapshot sameshi.sqlite --offline --port 8000
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from sameshi import metrics
+from sameshi.catalog import Catalog
+from sameshi.records import MenuItem, Sauna
+from sameshi.service import SameshiService, open_catalog_store, open_snapshot_cache
+from sameshi.sheets import SHEET_ID, service_account_credentials
+from sameshi.tags import TagFilter, parse_tag_filter
+
+logger = logging.getLogger(__name__)
+
+# 周辺検索の半径（m）の既定値と上限
+NEARBY_RADIUS = 200
+MAX_NEARBY_RADIUS = 1000
+
+# 1リクエストで引けるガチャの回数の上限
+MAX_PULLS = 100
+
+# メニュー一覧の JSON を覚えておくサウナ数（版ごと）
+MENU_CACHE_SIZE = 4096
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def dumps(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class CatalogView:
+    """カタログ1版ぶんの JSON の断片。版が変わったら作り直す。"""
+
+    def __init__(self, catalog: Catalog):
+        self.catalog = catalog
+        self.version = catalog.version
+        self.etag = '"{}"'.format(catalog.version or "0")
+        self.saunas = dumps([s._asdict() for s in catalog.saunas])
+        self._tags: Optional[bytes] = None
+        self._items: Dict[int, bytes] = {}
+        self._menus: Dict[int, bytes] = {}
+        self._lock = threading.Lock()
+
+    def item(self, menu: MenuItem) -> bytes:
+        body = self._items.get(menu.id)
+        if body is None:
+            record = menu._asdict()
+            record["tags"] = list(self.catalog.get_tags_for_menu_item(menu.id))
+            body = self._items[menu.id] = dumps(record)
+        return body
+
+    def items(self, menus) -> bytes:
+        return b"[" + b",".join(self.item(m) for m in menus) + b"]"
+
+    def tags(self) -> bytes:
+        if self._tags is None:
+            self._tags = dumps(self.catalog.tag_index.tag_names)
+        return self._tags
+
+    def menus(self, sauna_id: int) -> bytes:
+        body = self._menus.get(sauna_id)
+        if body is None:
+            body = self.items(self.catalog.get_all_menu_items_for_sauna(sauna_id))
+            with self._lock:
+                if len(self._menus) >= MENU_CACHE_SIZE:
+                    self._menus.clear()
+                self._menus[sauna_id] = body
+        return body
+
+
+class ApiApp:
+    """SameshiService を JSON で公開する ASGI アプリ。"""
+
+    def __init__(self, service: SameshiService, nearby_workers: int = 8):
+        self.service = service
+        self._view: Optional[CatalogView] = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=nearby_workers, thread_name_prefix="sameshi-api")
+
+    async def _run(self, fn, *args):
+        """fn(*args) をスレッドプールで実行して待つ（イベントループは止めない）。"""
+        return await asyncio.wrap_future(metrics.submit(self._executor, fn, *args))
+
+    def prepare(self) -> CatalogView:
+        """今の版の CatalogView と、ガチャ・タグ一覧が使う索引を作っておく（ブロックする）。"""
+        view = self.view()
+        view.tags()
+        self.service.gacha_engine(view.catalog)
+        return view
+
+    async def current_view(self) -> CatalogView:
+        """今の版の CatalogView。起動直後や版が変わった直後はスレッドプールで作る。"""
+        view = self._view
+        # 一度読み込んだ後の service.catalog はメモリ上の参照を返すだけ（更新の確認は別スレッド）
+        if view is None or view.catalog is not self.service.catalog:
+            view = await self._run(self.prepare)
+        return view
+
+    def view(self) -> CatalogView:
+        catalog = self.service.catalog
+        view = self._view
+        if view is None or view.catalog is not catalog:
+            with self._lock:
+                view = self._view
+                if view is None or view.catalog is not catalog:
+                    view = self._view = CatalogView(catalog)
+        return view
+
+    # ------------------ ASGI ------------------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        headers = {}
+        with metrics.run_scope("api"):
+            try:
+                if scope["method"] not in ("GET", "HEAD"):
+                    raise HTTPError(405, "method not allowed")
+                status, body, headers = await self.handle(scope)
+            except HTTPError as e:
+                status, body = e.status, dumps({"error": e.message})
+            metrics.count(f"api.status_{status}")
+        await self._respond(send, scope, status, body, headers)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self._run(self.prepare)
+                except Exception:
+                    # カタログがまだ読めなくても起動はする（最初のリクエストでもう一度試す）
+                    logger.exception("failed to prepare the catalog at startup")
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _respond(self, send, scope, status: int, body: bytes, headers: Dict[str, str]):
+        content_type = headers.pop("content-type", "application/json; charset=utf-8")
+        raw_headers = [(b"content-type", content_type.encode())]
+        if status != 304:
+            raw_headers.append((b"content-length", str(len(body)).encode()))
+        raw_headers += [(k.encode(), v.encode()) for k, v in headers.items()]
+        await send({"type": "http.response.start", "status": status, "headers": raw_headers})
+        send_body = status != 304 and scope["method"] != "HEAD"
+        await send({"type": "http.response.body", "body": body if send_body else b""})
+
+    # ------------------ ルーティング ------------------
+    async def handle(self, scope) -> Tuple[int, bytes, Dict[str, str]]:
+        parts = [p for p in scope["path"].split("/") if p]
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+        if parts == ["metrics"]:
+            body = metrics.REGISTRY.prometheus_text().encode("utf-8")
+            return 200, body, {"content-type": "text/plain; version=0.0.4; charset=utf-8"}
+
+        view = await self.current_view()
+        if parts == ["healthz"]:
+            return 200, dumps({"status": "ok", "version": view.version}), {"cache-control": "no-store"}
+        if parts == ["saunas"]:
+            return self._cacheable(scope, view.etag, lambda: view.saunas)
+        if parts == ["tags"]:
+            return self._cacheable(scope, view.etag, view.tags)
+        if len(parts) == 3 and parts[0] == "saunas":
+            sauna = view.catalog.get_sauna(_int_param(parts[1], "sauna id"))
+            if sauna is None:
+                raise HTTPError(404, "sauna not found")
+            action = parts[2]
+            if action == "menus":
+                return self._cacheable(scope, view.etag, lambda: view.menus(sauna.id))
+            if action == "gacha":
+                n = _int_param(_first(query, "n", "1"), "n")
+                if not 1 <= n <= MAX_PULLS:
+                    raise HTTPError(400, f"n must be between 1 and {MAX_PULLS}")
+                tag_filter = parse_tag_filter(_first(query, "tags", ""))
+                budget = _int_param(_first(query, "budget", ""), "budget") if "budget" in query else None
+                # 初めての条件・予算では候補や予算表を作るので、抽選ごとスレッドプールで行う
+                body = await self._run(self.gacha, view, sauna, n, tag_filter, budget)
+                return 200, body, {"cache-control": "no-store"}
+            if action == "nearby":
+                if sauna.latitude is None or sauna.longitude is None:
+                    raise HTTPError(404, "sauna has no location")
+                radius = _int_param(_first(query, "radius", str(NEARBY_RADIUS)), "radius")
+                if not 1 <= radius <= MAX_NEARBY_RADIUS:
+                    raise HTTPError(400, f"radius must be between 1 and {MAX_NEARBY_RADIUS}")
+                stores = await self.find_nearby(sauna, radius)
+                body = dumps(stores)
+                etag = '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+                return self._cacheable(scope, etag, lambda: body)
+        raise HTTPError(404, "not found")
+
+    def gacha(self, view: CatalogView, sauna: Sauna, n: int, tag_filter: TagFilter, budget: Optional[int]) -> bytes:
+        """n 回引いた結果の JSON（常に回ごとのリスト）。予算に収まる組み合わせが無ければ 422。"""
+        engine = self.service.gacha_engine(view.catalog)
+        if budget is not None:
+            plan = engine.budget_plan(sauna.id, budget, tag_filter)
+            if not plan:
+                raise HTTPError(422, f"no combination fits within {budget} yen (cheapest is {plan.cheapest} yen)")
+        if n == 1:
+            pulls = [engine.pull(sauna.id, tag_filter=tag_filter, budget=budget)]
+        else:
+            pulls = engine.pull_many(sauna.id, n, tag_filter=tag_filter, budget=budget)
+        return b"[" + b",".join(view.items(pull) for pull in pulls) + b"]"
+
+    async def find_nearby(self, sauna: Sauna, radius: int) -> List[Dict]:
+        """事前計算の表にあればそれを、無ければ検索した結果を返す。"""
+        future = metrics.submit(self._executor, self.service.nearby_for_sauna, sauna, radius, False)
+        stores, _ = await asyncio.wrap_future(future)
+        return stores
+
+    def _cacheable(self, scope, etag: str, body) -> Tuple[int, bytes, Dict[str, str]]:
+        headers = {"etag": etag, "cache-control": "no-cache"}
+        if etag in _if_none_match(scope):
+            return 304, b"", headers
+        return 200, body(), headers
+
+
+def _first(query: Dict[str, List[str]], name: str, default: str) -> str:
+    values = query.get(name)
+    return values[0] if values else default
+
+
+def _int_param(value: str, name: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        raise HTTPError(400, f"{name} must be an integer") from None
+
+
+def _if_none_match(scope) -> List[str]:
+    for key, value in scope.get("headers", ()):
+        if key == b"if-none-match":
+            # 弱い比較（W/ は無視する）
+            return [tag.strip().replace("W/", "", 1) for tag in value.decode("latin-1").split(",")]
+    return []
+
+
+def create_app(
+    snapshot_path: Optional[str] = None,
+    credentials: Optional[str] = None,
+    sheet_id: str = SHEET_ID,
+    api_key: Optional[str] = None,
+    cache_dir: Optional[str] = None,
+    cache_url: Optional[str] = None,
+    nearby_table: Optional[str] = None,
+    gmaps=None,
+) -> ApiApp:
+    """ページと同じ構成（スナップショット + バックグラウンド更新）で ApiApp を作る。
+
+    credentials が None ならシートには一切アクセスしない。gmaps を渡せば Google Maps の代わりに使う。
+    cache_url（SAMESHI_CACHE_URL）を渡すとスナップショット・周辺検索・写真を他のレプリカと共有する。
+    """
+    creds = service_account_credentials(keyfile=credentials) if credentials else None
+    cache_dir = cache_dir or os.getenv("SAMESHI_CACHE_DIR", ".cache")
+    cache_url = cache_url or os.getenv("SAMESHI_CACHE_URL")
+    service = SameshiService(
+        open_catalog_store(
+            sheet_id, creds, snapshot_path=snapshot_path, shared=open_snapshot_cache(cache_url, cache_dir)
+        ),
+        api_key=api_key,
+        cache_dir=cache_dir,
+        gmaps=gmaps,
+        cache_url=cache_url,
+        nearby_table=nearby_table or os.getenv("SAMESHI_NEARBY_TABLE", os.path.join(cache_dir, "nearby.sqlite")),
+    )
+    return ApiApp(service)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sameshi.api", description="サ飯パスポートの JSON API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--snapshot", default=os.getenv("SAMESHI_SNAPSHOT"), help="ローカルスナップショット")
+    parser.add_argument("--credentials", default="credentials.json", help="サービスアカウントの JSON キー")
+    parser.add_argument("--offline", action="store_true", help="Google Sheets にアクセスしない")
+    parser.add_argument("--sheet-id", default=SHEET_ID)
+    args = parser.parse_args(argv)
+
+    try:
+        import uvicorn
+    except ImportError:
+        parser.error("uvicorn is required to serve the API (pip install uvicorn)")
+
+    app = create_app(
+        snapshot_path=args.snapshot,
+        credentials=None if args.offline else args.credentials,
+        sheet_id=args.sheet_id,
+        api_key=os.getenv("GOOGLE_API_KEY"),
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
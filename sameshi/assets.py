@@ -0,0 +1,258 @@
+"""画像アセットのビルド（縮小・最適化 → コンテンツハッシュ付きファイル名で static/ に配置）。
+
+Streamlit の静的配信（server.enableStaticServing）で app/static/<ファイル名> として配信する。
+ファイル名に中身のハッシュを含めるので、ブラウザは長期キャッシュしてよい。
+
+    python -m sameshi.assets          # デプロイ時に事前ビルドする
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageOps
+
+STATIC_DIR = "static"
+STATIC_URL_PREFIX = "app/static"
+MANIFEST_NAME = "manifest.json"
+
+MIME_TYPES = {"WEBP": "image/webp", "PNG": "image/png", "JPEG": "image/jpeg"}
+EXTENSIONS = {"WEBP": "webp", "PNG": "png", "JPEG": "jpg"}
+
+
+class ImageVariant(NamedTuple):
+    source: str
+    size: int  # 長辺（crop=True なら一辺）のピクセル数
+    format: str = "WEBP"
+    quality: int = 80
+    crop: bool = False  # True なら中央で正方形に切り抜く（object-fit: cover 相当）
+
+
+class StaticAsset(NamedTuple):
+    filename: str
+    url: str
+    mime: str
+    path: str
+
+    def data_uri(self) -> str:
+        """静的配信が無効な環境向けのフォールバック。"""
+        with open(self.path, "rb") as f:
+            return f"data:{self.mime};base64,{base64.b64encode(f.read()).decode()}"
+
+
+# ロゴは 195px 表示（2倍密度で作る）、透かしは 400px・不透明度5%なので画質を落としてよい
+LOGO_VARIANTS = {
+    "logo": ImageVariant("sameshi_logo.png", 390),
+    "watermark": ImageVariant("sameshi_logo.png", 400, quality=40),
+}
+
+
+def render_variant(variant: ImageVariant) -> bytes:
+    with Image.open(variant.source) as image:
+        image = ImageOps.exif_transpose(image)
+        if variant.format == "JPEG":
+            image = image.convert("RGB")
+        if variant.crop:
+            image = ImageOps.fit(image, (variant.size, variant.size), Image.LANCZOS)
+        else:
+            image = image.copy()
+            image.thumbnail((variant.size, variant.size), Image.LANCZOS)
+    out = io.BytesIO()
+    if variant.format == "PNG":
+        image.save(out, format="PNG", optimize=True)
+    elif variant.format == "WEBP":
+        image.save(out, format="WEBP", quality=variant.quality, method=4)
+    else:
+        image.save(out, format="JPEG", quality=variant.quality, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def _variant_key(variant: ImageVariant) -> str:
+    mtime = os.stat(variant.source).st_mtime_ns
+    return f"{variant.source}:{mtime}:{variant.size}:{variant.format}:{variant.quality}:{variant.crop}"
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+
+
+class AssetBuilder:
+    """アセットを必要なときだけビルドする。
+
+    元画像の mtime と変換パラメータを manifest.json に記録し、変わっていなければ
+    既存のファイルをそのまま使う（再起動のたびにエンコードし直さない）。
+    """
+
+    def __init__(self, static_dir: str = STATIC_DIR, url_prefix: str = STATIC_URL_PREFIX):
+        self.static_dir = static_dir
+        self.url_prefix = url_prefix
+        os.makedirs(static_dir, exist_ok=True)
+        self._manifest_path = os.path.join(static_dir, MANIFEST_NAME)
+        self._manifest = self._read_manifest()
+        self._lock = threading.Lock()
+
+    def _read_manifest(self) -> Dict[str, str]:
+        try:
+            with open(self._manifest_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _asset(self, filename: str, fmt: str) -> StaticAsset:
+        return StaticAsset(
+            filename,
+            f"{self.url_prefix}/{filename}",
+            MIME_TYPES[fmt],
+            os.path.join(self.static_dir, filename),
+        )
+
+    def build(self, name: str, variant: ImageVariant) -> StaticAsset:
+        key = _variant_key(variant)
+        filename = self._manifest.get(key)
+        if filename and os.path.exists(os.path.join(self.static_dir, filename)):
+            return self._asset(filename, variant.format)
+        with self._lock:
+            return self._build_locked(name, variant, key)
+
+    def _build_locked(self, name: str, variant: ImageVariant, key: str) -> StaticAsset:
+        filename = self._manifest.get(key)
+        if filename and os.path.exists(os.path.join(self.static_dir, filename)):
+            return self._asset(filename, variant.format)
+        asset = self.publish(name, render_variant(variant), variant.format)
+        self._manifest[key] = asset.filename
+        _write_atomic(self._manifest_path, json.dumps(self._manifest, ensure_ascii=False, indent=1).encode("utf-8"))
+        return asset
+
+    def publish(self, name: str, data: bytes, fmt: str) -> StaticAsset:
+        """ビルド済みのバイト列をハッシュ付きファイル名で配置する（同じ中身なら書き込まない）。"""
+        digest = hashlib.sha1(data).hexdigest()[:12]
+        filename = f"{name}.{digest}.{EXTENSIONS[fmt]}"
+        path = os.path.join(self.static_dir, filename)
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return self._asset(filename, fmt)
+
+    def build_all(self, variants: Dict[str, ImageVariant]) -> Dict[str, StaticAsset]:
+        return {name: self.build(name, variant) for name, variant in variants.items()}
+
+
+# メニュー画像は 150×150 のカードに object-fit: cover で表示する（2倍密度で作る）
+MENU_IMAGE_DIR = "images"
+MENU_THUMBNAIL_SIZE = 300
+
+
+class ThumbnailStore:
+    """images/ 以下のメニュー画像のサムネイル。
+
+    (パス, mtime) をキーに、ビルド済みアセットの src（URL かデータURI）をメモリに持つ。
+    画像を差し替えれば mtime が変わるので自動的に作り直される。
+    """
+
+    def __init__(
+        self,
+        builder: AssetBuilder,
+        image_dir: str = MENU_IMAGE_DIR,
+        size: int = MENU_THUMBNAIL_SIZE,
+        to_src: Callable[[StaticAsset], str] = lambda asset: asset.url,
+    ):
+        self.builder = builder
+        self.image_dir = image_dir
+        self.size = size
+        self.to_src = to_src
+        self._srcs: Dict[Tuple[str, int], str] = {}
+
+    def get(self, image_file: str) -> Optional[str]:
+        if not image_file:
+            return None
+        path = os.path.join(self.image_dir, image_file)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        key = (path, stat.st_mtime_ns)
+        src = self._srcs.get(key)
+        if src is None:
+            name = "menu-" + os.path.splitext(os.path.basename(image_file))[0]
+            asset = self.builder.build(name, ImageVariant(path, self.size, quality=75, crop=True))
+            src = self._srcs[key] = self.to_src(asset)
+        return src
+
+    def prepare_all(self) -> int:
+        """マップ用のピン（pin_*）以外の画像をまとめてビルドしておく。"""
+        count = 0
+        for image_file in sorted(os.listdir(self.image_dir)):
+            if image_file.startswith("pin_"):
+                continue
+            if self.get(image_file) is not None:
+                count += 1
+        return count
+
+
+# マップのピン画像（キー → ファイル）。キーはマーカーの "icon" 列から参照する
+PIN_ICONS = {
+    "sauna": "images/pin_sauna.png",
+    "curry": "images/pin_curry.png",
+    "ramen": "images/pin_ramen.png",
+    "gyudon": "images/pin_gyudon.png",
+    "burger": "images/pin_burger.png",
+}
+PIN_SIZE = 64
+DEFAULT_PIN = "default"
+
+
+class IconAtlas(NamedTuple):
+    asset: StaticAsset
+    mapping: Dict[str, Dict]  # deck.gl IconLayer の iconMapping
+
+
+def render_icon_atlas(icons: Dict[str, str], size: int = PIN_SIZE) -> Tuple[bytes, Dict[str, Dict]]:
+    """ピン画像を横一列に並べた1枚の PNG と、その切り出し位置を作る。
+
+    画像が見つからないキーと DEFAULT_PIN には、代わりに赤い丸を描く。
+    """
+    keys = list(icons) + [DEFAULT_PIN]
+    atlas = Image.new("RGBA", (size * len(keys), size), (0, 0, 0, 0))
+    mapping = {}
+    for i, key in enumerate(keys):
+        path = icons.get(key)
+        if path and os.path.exists(path):
+            with Image.open(path) as pin:
+                pin = pin.convert("RGBA")
+                pin.thumbnail((size, size), Image.LANCZOS)
+                atlas.paste(pin, (i * size, 0))
+        else:
+            ImageDraw.Draw(atlas).ellipse(
+                (i * size + size // 4, size // 4, i * size + size * 3 // 4, size * 3 // 4),
+                fill=(255, 0, 80, 255),
+            )
+        mapping[key] = {"x": i * size, "y": 0, "width": size, "height": size, "anchorY": size, "mask": False}
+    out = io.BytesIO()
+    atlas.save(out, format="PNG", optimize=True)
+    return out.getvalue(), mapping
+
+
+def build_icon_atlas(builder: AssetBuilder, icons: Dict[str, str] = PIN_ICONS) -> IconAtlas:
+    data, mapping = render_icon_atlas(icons)
+    return IconAtlas(builder.publish("pins", data, "PNG"), mapping)
+
+
+def build_logo_assets(static_dir: str = STATIC_DIR, builder: Optional[AssetBuilder] = None) -> Dict[str, StaticAsset]:
+    return (builder or AssetBuilder(static_dir)).build_all(LOGO_VARIANTS)
+
+
+if __name__ == "__main__":
+    builder = AssetBuilder()
+    for name, asset in build_logo_assets(builder=builder).items():
+        print(f"{name}: {asset.url} ({os.path.getsize(asset.path)} bytes)")
+    print(f"menu thumbnails: {ThumbnailStore(builder).prepare_all()}")
+    print(f"pin atlas: {build_icon_atlas(builder).asset.url}")
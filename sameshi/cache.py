@@ -0,0 +1,292 @@
+"""プロセス・レプリカ間で共有できるキャッシュ。
+
+CacheBackend が共通のインターフェース（bytes の get / set と prefix での列挙）で、
+ローカルの SQLite（SqliteTTLCache）と Redis（RedisCache）の実装がある。
+同じ SQLite ファイルは同じホストの複数プロセスから、Redis は複数ホストから共有できる。
+どれを使うかは open_cache に渡す URL（SAMESHI_CACHE_URL）で選ぶ。
+
+stale_ttl を指定すると、期限切れのエントリもその秒数だけ消さずに残し、get_stale で
+読める（外部 API が使えないときに古い結果で代用するため。sameshi.outbound を参照）。
+"""
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import struct
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+
+class CacheBackend(ABC):
+    """キャッシュのインターフェース。値は bytes で、JSON 用のメソッドはその上に載せる。"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def items(self, prefix: str = "") -> Iterator[Tuple[str, bytes]]:
+        """期限内のエントリを (key, value) で返す。"""
+
+    def get_stale(self, key: str) -> Optional[bytes]:
+        """期限切れでも消さずに残っていれば返す（最終アクセス時刻は更新しない）。"""
+        return self.get(key)
+
+    def close(self) -> None:
+        pass
+
+    def get_json(self, key: str) -> Optional[Any]:
+        value = self.get(key)
+        return None if value is None else json.loads(value)
+
+    def get_stale_json(self, key: str) -> Optional[Any]:
+        value = self.get_stale(key)
+        return None if value is None else json.loads(value)
+
+    def set_json(self, key: str, value: Any) -> None:
+        self.set(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def items_json(self, prefix: str = "") -> Iterator[Tuple[str, Any]]:
+        return ((key, json.loads(value)) for key, value in self.items(prefix))
+
+
+class SqliteTTLCache(CacheBackend):
+    """SQLite に置く TTL 付き・件数上限付きのキャッシュ（上限を超えたら最後に使われた順で追い出す）。
+
+    再起動してもエントリが残る。1プロセス内ではスレッド間で1つの接続を共有する。
+    WAL モードなので、同じファイルを同じホストの複数プロセスから開いて共有できる。
+    ttl が None なら期限切れにしない。期限切れのエントリは stale_ttl 秒たつまで get_stale で読める。
+
+    読み込みのたびに書き込みトランザクションにならないよう、最終アクセス時刻は
+    touch_interval 秒以上たったときだけ更新する（LRU の順序はその粒度になる）。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = 24 * 3600,
+        max_entries: int = 5000,
+        table: str = "entries",
+        clock: Callable[[], float] = time.time,
+        touch_interval: float = 60.0,
+        stale_ttl: float = 0.0,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.touch_interval = touch_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_accessed_at ON {table} (accessed_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[bytes]:
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at, accessed_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at, accessed_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                if now - created_at > self.ttl + self.stale_ttl:
+                    self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                    self._conn.commit()
+                return None
+            if now - accessed_at >= self.touch_interval:
+                self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+            return value
+
+    def get_stale(self, key: str) -> Optional[bytes]:
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        value, created_at = row
+        if self.ttl is not None and now - created_at > self.ttl + self.stale_ttl:
+            return None
+        return value
+
+    def set(self, key: str, value: bytes) -> None:
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def items(self, prefix: str = "") -> Iterator[Tuple[str, bytes]]:
+        """期限内のエントリを (key, value) で返す（最終アクセス時刻は更新しない）。"""
+        oldest = float("-inf") if self.ttl is None else self._clock() - self.ttl
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, value FROM {self.table} WHERE key >= ? AND key < ? AND created_at >= ?",
+                (prefix, prefix + "\U0010ffff", oldest),
+            ).fetchall()
+        return iter(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self, now: float) -> None:
+        if self.ttl is not None:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE created_at < ?", (now - self.ttl - self.stale_ttl,)
+            )
+        overflow = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0] - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+
+
+class RedisCache(CacheBackend):
+    """Redis に置くキャッシュ（複数ホストのレプリカで共有する）。
+
+    キーには namespace を前置きし、値の先頭に書き込んだ時刻を付ける。消すのは Redis の EX
+    （ttl + stale_ttl）に任せ、ttl を過ぎたかどうかは読むときにその時刻で判定する。件数の上限は
+    Redis 側の maxmemory-policy（allkeys-lru など）で決める。redis は使うときに import する。
+    """
+
+    def __init__(
+        self,
+        url: str,
+        namespace: str = "sameshi:",
+        ttl: Optional[float] = 24 * 3600,
+        client=None,
+        stale_ttl: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._clock = clock
+
+    def _unpack(self, raw: Optional[bytes], stale: bool = False) -> Optional[bytes]:
+        if raw is None:
+            return None
+        (created_at,) = _REDIS_HEADER.unpack_from(raw)
+        if not stale and self.ttl is not None and self._clock() - created_at > self.ttl:
+            return None
+        return raw[_REDIS_HEADER.size:]
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._unpack(self.client.get(self.namespace + key))
+
+    def get_stale(self, key: str) -> Optional[bytes]:
+        return self._unpack(self.client.get(self.namespace + key), stale=True)
+
+    def set(self, key: str, value: bytes) -> None:
+        ex = None if self.ttl is None else max(1, int(self.ttl + self.stale_ttl))
+        self.client.set(self.namespace + key, _REDIS_HEADER.pack(self._clock()) + value, ex=ex)
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.namespace + key)
+
+    def items(self, prefix: str = "") -> Iterator[Tuple[str, bytes]]:
+        start = len(self.namespace)
+        for full_key in self.client.scan_iter(match=_redis_glob(self.namespace + prefix) + "*", count=500):
+            value = self._unpack(self.client.get(full_key))
+            if value is not None:
+                key = full_key.decode("utf-8") if isinstance(full_key, bytes) else full_key
+                yield key[start:], value
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self.client.scan_iter(match=_redis_glob(self.namespace) + "*", count=500))
+
+    def clear(self) -> None:
+        for full_key in self.client.scan_iter(match=_redis_glob(self.namespace) + "*", count=500):
+            self.client.delete(full_key)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+# RedisCache の値の先頭に付ける書き込み時刻（UNIX 時間、big-endian の double）
+_REDIS_HEADER = struct.Struct(">d")
+
+
+def _redis_glob(text: str) -> str:
+    return "".join("\\" + c if c in "*?[]\\" else c for c in text)
+
+
+def open_cache(
+    url: Optional[str],
+    name: str,
+    ttl: Optional[float] = 24 * 3600,
+    max_entries: int = 5000,
+    cache_dir: str = ".cache",
+    stale_ttl: float = 0.0,
+) -> CacheBackend:
+    """URL からキャッシュを開く。name ごとに別のファイル（Redis ではキーの名前空間）になる。
+
+    None / ""         → cache_dir/<name>.sqlite
+    sqlite:<dir>      → <dir>/<name>.sqlite（同じディレクトリを使うプロセス同士で共有）
+    redis://host/db   → Redis のキー sameshi:<name>:...
+    """
+    options = dict(ttl=ttl, max_entries=max_entries, stale_ttl=stale_ttl)
+    if not url:
+        return SqliteTTLCache(os.path.join(cache_dir, f"{name}.sqlite"), **options)
+    if url.startswith("sqlite:"):
+        directory = url[len("sqlite:"):]
+        if directory.startswith("//"):
+            directory = directory[2:]
+        return SqliteTTLCache(os.path.join(directory or cache_dir, f"{name}.sqlite"), **options)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url, namespace=f"sameshi:{name}:", ttl=ttl, stale_ttl=stale_ttl)
+    raise ValueError(f"unsupported cache URL: {url!r} (expected sqlite:<dir> or redis://...)")
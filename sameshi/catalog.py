@@ -0,0 +1,142 @@
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sameshi.geo import GridIndex
+from sameshi.records import MenuItem, MenuTag, Restaurant, Sauna, Tag, parse_sheets
+from sameshi.tags import TagFilter, TagIndex
+
+
+class Catalog:
+    """サウナ → 店舗 → メニュー → タグ の索引。
+
+    シート読み込みごとに一度だけ構築し、以降の検索は辞書引きで済ませる。
+    行は sameshi.records の型付きレコード（NamedTuple）で持ち、検索結果はタプルで返す。
+    Streamlit のセッション間で共有されるため、構築後は読み取り専用として扱う。
+    """
+
+    def __init__(
+        self,
+        saunas: Iterable[Sauna],
+        restaurants: Iterable[Restaurant],
+        menu_items: Iterable[MenuItem],
+        tags: Iterable[Tag],
+        menu_item_tags: Iterable[MenuTag],
+        version: str = "",
+    ):
+        # スナップショットの識別子（シートの内容が変われば変わる）
+        self.version = version
+        self.saunas: Tuple[Sauna, ...] = tuple(saunas)
+        self.restaurants: Tuple[Restaurant, ...] = tuple(restaurants)
+        self.menu_items: Tuple[MenuItem, ...] = tuple(menu_items)
+        self.tags: Tuple[Tag, ...] = tuple(tags)
+        self.menu_item_tags: Tuple[MenuTag, ...] = tuple(menu_item_tags)
+
+        self._sauna_by_id: Dict[int, Sauna] = {}
+        self._sauna_by_name: Dict[str, Sauna] = {}
+        for s in self.saunas:
+            self._sauna_by_id.setdefault(s.id, s)
+            self._sauna_by_name.setdefault(s.name, s)
+
+        # sauna_id → 店舗
+        restaurants_by_sauna = defaultdict(list)
+        for r in self.restaurants:
+            restaurants_by_sauna[r.sauna_id].append(r)
+        self._restaurants_by_sauna = {k: tuple(v) for k, v in restaurants_by_sauna.items()}
+
+        # restaurant_id → メニュー
+        menus_by_restaurant = defaultdict(list)
+        for m in self.menu_items:
+            menus_by_restaurant[m.restaurant_id].append(m)
+        self._menus_by_restaurant = {k: tuple(v) for k, v in menus_by_restaurant.items()}
+
+        # menu_id → タグ名（MenuTags シートの並び順を保つ）
+        tag_position = {}
+        tag_name = {}
+        for pos, t in enumerate(self.tags):
+            if t.id not in tag_position:
+                tag_position[t.id] = pos
+                tag_name[t.id] = t.name
+        tag_ids_by_menu = defaultdict(set)
+        for rel in self.menu_item_tags:
+            if rel.tag_id in tag_position:
+                tag_ids_by_menu[rel.menu_item_id].add(rel.tag_id)
+        self._tags_by_menu: Dict[int, Tuple[str, ...]] = {
+            menu_id: tuple(tag_name[tid] for tid in sorted(tag_ids, key=tag_position.__getitem__))
+            for menu_id, tag_ids in tag_ids_by_menu.items()
+        }
+
+        # sauna_id → 全メニュー（ガチャの候補）
+        self._menus_by_sauna: Dict[int, Tuple[MenuItem, ...]] = {}
+        for sauna_id, rests in self._restaurants_by_sauna.items():
+            menus = []
+            for rest in rests:
+                menus.extend(self._menus_by_restaurant.get(rest.id, ()))
+            self._menus_by_sauna[sauna_id] = tuple(menus)
+
+        # サウナの位置の空間インデックス（座標が空の行は入らない）
+        located = [s for s in self.saunas if s.latitude is not None and s.longitude is not None]
+        self.sauna_index = GridIndex(
+            located, [s.latitude for s in located], [s.longitude for s in located], cell_size=1000.0
+        )
+
+        # タグの転置インデックスは絞り込みが初めて使われたときに作る
+        self._tag_index: Optional[TagIndex] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_tables(cls, tables: Dict[str, Sequence], version: str = "") -> "Catalog":
+        """parse_sheets の戻り値（シート名 → レコード）から構築する。"""
+        return cls(
+            tables["Saunas"],
+            tables["Restaurants"],
+            tables["Menu"],
+            tables["MenuTags"],
+            tables["MenuTagRelation"],
+            version=version,
+        )
+
+    @classmethod
+    def from_values(cls, values: Dict[str, List[List]], version: str = "") -> "Catalog":
+        """シートの生の値（fetch_values の戻り値）から構築する。"""
+        return cls.from_tables(parse_sheets(values), version=version)
+
+    # ------------------ 検索 ------------------
+    def get_sauna(self, sauna_id: int) -> Optional[Sauna]:
+        return self._sauna_by_id.get(sauna_id)
+
+    def get_sauna_by_name(self, name: str) -> Optional[Sauna]:
+        return self._sauna_by_name.get(name)
+
+    def get_restaurants_by_sauna(self, sauna_id: int) -> Tuple[Restaurant, ...]:
+        return self._restaurants_by_sauna.get(sauna_id, ())
+
+    def get_menu_items_by_restaurant(self, restaurant_id: int) -> Tuple[MenuItem, ...]:
+        return self._menus_by_restaurant.get(restaurant_id, ())
+
+    def get_tags_for_menu_item(self, menu_item_id: int) -> Tuple[str, ...]:
+        return self._tags_by_menu.get(menu_item_id, ())
+
+    def get_all_menu_items_for_sauna(self, sauna_id: int) -> Tuple[MenuItem, ...]:
+        return self._menus_by_sauna.get(sauna_id, ())
+
+    @property
+    def tag_index(self) -> TagIndex:
+        if self._tag_index is None:
+            with self._lock:
+                if self._tag_index is None:
+                    self._tag_index = TagIndex(self)
+        return self._tag_index
+
+    def get_menu_items_by_tags(self, sauna_id: int, tag_filter: TagFilter) -> List[MenuItem]:
+        """サウナの候補のうちタグの条件（AND / OR / NOT）を満たすもの。"""
+        if not tag_filter:
+            return list(self.get_all_menu_items_for_sauna(sauna_id))
+        return self.tag_index.filter_sauna(sauna_id, tag_filter)
+
+    def saunas_within(self, lat: float, lng: float, radius: float) -> List[Tuple[Sauna, float]]:
+        """半径 radius（m）以内のサウナを近い順に (sauna, 距離) で返す。"""
+        return self.sauna_index.within(lat, lng, radius)
+
+    def nearest_saunas(self, lat: float, lng: float, k: int = 5) -> List[Tuple[Sauna, float]]:
+        return self.sauna_index.nearest(lat, lng, k)
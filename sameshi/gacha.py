@@ -0,0 +1,323 @@
+import bisect
+import itertools
+import random
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sameshi.records import MenuItem
+from sameshi.tags import TagFilter, TagIndex
+
+if TYPE_CHECKING:
+    from sameshi.catalog import Catalog
+
+# カテゴリごとに引く品数（main 1品 + drink 2品）
+DRAW_COUNTS = {"main": 1, "drink": 2}
+
+# タグで絞り込んだ候補を覚えておく (サウナ, 条件) の数
+FILTERED_CACHE_SIZE = 4096
+
+# 予算内ガチャの抽選表を覚えておく (サウナ, 条件, 予算) の数
+BUDGET_CACHE_SIZE = 4096
+
+# Menu シートの rarity 列 → 出やすさ。weight 列に数値があればそちらを優先する
+RARITY_WEIGHTS = {"n": 1.0, "r": 0.5, "sr": 0.2, "ssr": 0.05}
+
+
+def item_weight(item: MenuItem) -> float:
+    if item.weight is not None and item.weight > 0:
+        return item.weight
+    return RARITY_WEIGHTS.get(item.rarity, 1.0)
+
+
+class AliasTable:
+    """Vose の alias 法。重み付きの1回の抽選が O(1)。"""
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("weights must not be empty")
+        total = float(sum(weights))
+        if total <= 0:
+            raise ValueError("weights must sum to a positive value")
+        self.n = n
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+        scaled = [w * n / total for w in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            self.prob[s] = scaled[s]
+            self.alias[s] = l
+            scaled[l] = scaled[l] + scaled[s] - 1.0
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in large + small:
+            self.prob[i] = 1.0
+
+    def sample(self, rng: random.Random) -> int:
+        i = int(rng.random() * self.n)
+        return i if rng.random() < self.prob[i] else self.alias[i]
+
+
+class Bucket:
+    """1サウナ・1カテゴリの抽選候補。重みがすべて同じなら一様に引く。"""
+
+    def __init__(self, items: List[MenuItem]):
+        self.items = items
+        weights = [item_weight(item) for item in items]
+        self.weights = weights
+        self.table = AliasTable(weights) if items and len(set(weights)) > 1 else None
+
+    def draw(self, k: int, rng: random.Random) -> List[MenuItem]:
+        """重複なしで最大 k 品を引く。候補が k 品以下なら全部を返す。"""
+        if len(self.items) <= k:
+            return list(self.items)
+        if self.table is None:
+            if k == 1:
+                return [rng.choice(self.items)]
+            return rng.sample(self.items, k)
+        picked: List[int] = []
+        attempts = 0
+        while len(picked) < k and attempts < 32 * k:
+            i = self.table.sample(rng)
+            attempts += 1
+            if i not in picked:
+                picked.append(i)
+        while len(picked) < k:
+            # 重みが極端に偏っていて重複ばかり出る場合は残りから線形に引く
+            rest = [i for i in range(len(self.items)) if i not in picked]
+            picked.append(rng.choices(rest, weights=[self.weights[i] for i in rest])[0])
+        return [self.items[i] for i in picked]
+
+
+def build_buckets(menu_items: Iterable[MenuItem]) -> Dict[str, Bucket]:
+    grouped: Dict[str, List[MenuItem]] = {category: [] for category in DRAW_COUNTS}
+    for item in menu_items:
+        if item.category in grouped:
+            grouped[item.category].append(item)
+    return {category: Bucket(items) for category, items in grouped.items()}
+
+
+def draw_from_buckets(buckets: Dict[str, Bucket], rng: random.Random) -> List[MenuItem]:
+    selected = []
+    for category, count in DRAW_COUNTS.items():
+        selected.extend(buckets[category].draw(count, rng))
+    return selected
+
+
+def get_random_menus_by_category(
+    menu_items: List[MenuItem],
+    rng: Optional[random.Random] = None,
+    tag_filter: Optional[TagFilter] = None,
+    tag_index: Optional[TagIndex] = None,
+) -> List[MenuItem]:
+    """main から1品、drink から重複なしで2品（1品しかなければその1品だけ）。
+
+    tag_filter と tag_index を渡すと、条件を満たす候補だけから引く。
+    """
+    if tag_filter and tag_index is not None:
+        menu_items = tag_index.filter_items(menu_items, tag_filter)
+    return draw_from_buckets(build_buckets(menu_items), rng or random)
+
+
+class PriceList:
+    """1カテゴリの候補を価格の安い順に並べたものと、重みの累積和（重みが同じなら個数）。"""
+
+    def __init__(self, bucket: Bucket):
+        order = sorted(range(len(bucket.items)), key=lambda i: bucket.items[i].price)
+        self.items = [bucket.items[i] for i in order]
+        self.prices = [item.price for item in self.items]
+        # 一様なら整数の個数で数え、抽選も整数で行う（浮動小数の誤差が出ない）
+        self.weights = [bucket.weights[i] for i in order] if bucket.table is not None else [1] * len(order)
+        self.cumulative = list(itertools.accumulate(self.weights, initial=0))
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+
+def _pick(cumulative: Sequence[float], lo: int, hi: int, rng: random.Random) -> int:
+    """累積和 cumulative から、lo 以上 hi 未満の添字を重みに比例して1つ選ぶ。"""
+    low, high = cumulative[lo], cumulative[hi]
+    if isinstance(low, int) and isinstance(high, int):
+        target = low + rng.randrange(high - low)
+    else:
+        target = low + rng.random() * (high - low)
+    i = bisect.bisect_right(cumulative, target, lo, hi + 1) - 1
+    return min(max(i, lo), hi - 1)
+
+
+class DrinkCombos:
+    """予算 budget 以内に収まる drink の組（2品。候補が2品未満なら全部で1組）。
+
+    安い順の j 番目と組める相手は j より後ろで price <= budget - price[j] のものなので、
+    bisect で上限 end[j] を求めれば、j を含む組の重みの和は累積和の差で求まる。
+    """
+
+    def __init__(self, drinks: PriceList, budget: int):
+        self.drinks = drinks
+        count = DRAW_COUNTS["drink"]
+        self.fixed = len(drinks) < count
+        if self.fixed:
+            # 通常のガチャと同じく、候補が足りなければあるものを全部出す
+            self.total = 1 if sum(drinks.prices) <= budget else 0
+            return
+        prices, weights, cumulative = drinks.prices, drinks.weights, drinks.cumulative
+        self.ends: List[int] = []
+        masses = []
+        for j, price in enumerate(prices):
+            end = bisect.bisect_right(prices, budget - price)
+            if end <= j + 1:
+                # 価格順なので、これより後ろの j はもう組を作れない
+                break
+            self.ends.append(end)
+            masses.append(weights[j] * (cumulative[end] - cumulative[j + 1]))
+        self.cumulative = list(itertools.accumulate(masses, initial=0))
+        self.total = self.cumulative[-1]
+
+    def draw(self, rng: random.Random) -> List[MenuItem]:
+        if self.fixed:
+            return list(self.drinks.items)
+        j = _pick(self.cumulative, 0, len(self.ends), rng)
+        k = _pick(self.drinks.cumulative, j + 1, self.ends[j], rng)
+        pair = [self.drinks.items[j], self.drinks.items[k]]
+        if rng.random() < 0.5:
+            pair.reverse()
+        return pair
+
+
+class BudgetPlan:
+    """合計（入浴料 fee + main 1品 + drink 2品）が budget 以内の組み合わせだけから引く抽選表。
+
+    組み合わせの重みは各品の重みの積（すべて同じなら一様）。main を安い順に見て、
+    残りの予算で組める drink の組の重みの和を DrinkCombos で数え、その累積和から main を、
+    続けて drink の組を選ぶので、1回の抽選は bisect 数回で済む。
+    total が 0 なら収まる組み合わせは無く、cheapest がいちばん安い組み合わせの合計。
+    """
+
+    def __init__(self, buckets: Dict[str, Bucket], budget: int, fee: int = 0):
+        self.budget = budget
+        self.fee = fee
+        self.mains = PriceList(buckets["main"])
+        self.drinks = PriceList(buckets["drink"])
+        cheapest_drinks = sum(self.drinks.prices[: DRAW_COUNTS["drink"]])
+        cheapest_main = self.mains.prices[0] if self.mains.prices else 0
+        self.cheapest = fee + cheapest_main + cheapest_drinks
+
+        food_budget = budget - fee
+        # main が無いサウナは drink だけの組（通常のガチャと同じ）
+        main_prices = self.mains.prices or [0]
+        main_weights = self.mains.weights or [1]
+        self._combos: Dict[int, DrinkCombos] = {}
+        self.combos: List[DrinkCombos] = []
+        masses = []
+        if self.cheapest <= budget:
+            for price, weight in zip(main_prices, main_weights):
+                rest = food_budget - price
+                combos = self._combos.get(rest)
+                if combos is None:
+                    combos = self._combos[rest] = DrinkCombos(self.drinks, rest)
+                if not combos.total:
+                    # main も安い順なので、これより高い main も収まらない
+                    break
+                self.combos.append(combos)
+                masses.append(weight * combos.total)
+        self.cumulative = list(itertools.accumulate(masses, initial=0))
+        self.total = self.cumulative[-1]
+
+    def __bool__(self) -> bool:
+        return bool(self.total)
+
+    def draw(self, rng: random.Random) -> List[MenuItem]:
+        """予算内の組み合わせを1つ引く。収まる組み合わせが無ければ空のリスト。"""
+        if not self.total:
+            return []
+        i = _pick(self.cumulative, 0, len(self.combos), rng)
+        main = [self.mains.items[i]] if self.mains.items else []
+        return main + self.combos[i].draw(rng)
+
+
+class GachaEngine:
+    """カタログ1版ごとに作るガチャ。サウナごとのカテゴリ別候補を一度だけ用意しておく。
+
+    tag_filter を渡すと、タグの転置インデックスでサウナの候補を絞ってから引く。
+    絞り込んだ候補も (サウナ, 条件) ごとに覚えておくので、2回目以降は絞り込みなしと同じ手間で引ける。
+    budget（円・入浴料込み）を渡すと、合計が予算に収まる組み合わせだけから引く（BudgetPlan）。
+    seed を渡すと結果が再現できる（テスト用）。
+    """
+
+    def __init__(self, catalog: "Catalog", seed: Optional[int] = None, rng: Optional[random.Random] = None):
+        self.catalog = catalog
+        self.version = catalog.version
+        self.rng = rng or random.Random(seed)
+        self._buckets: Dict = {}
+        self._filtered: "OrderedDict[Tuple[int, TagFilter], Dict[str, Bucket]]" = OrderedDict()
+        self._plans: "OrderedDict[Tuple[int, Optional[TagFilter], int], BudgetPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def buckets(self, sauna_id, tag_filter: Optional[TagFilter] = None) -> Dict[str, Bucket]:
+        if tag_filter:
+            return self._filtered_buckets(sauna_id, tag_filter)
+        buckets = self._buckets.get(sauna_id)
+        if buckets is None:
+            buckets = self._buckets[sauna_id] = build_buckets(self.catalog.get_all_menu_items_for_sauna(sauna_id))
+        return buckets
+
+    def _filtered_buckets(self, sauna_id, tag_filter: TagFilter) -> Dict[str, Bucket]:
+        key = (sauna_id, tag_filter)
+        with self._lock:
+            buckets = self._filtered.get(key)
+            if buckets is not None:
+                self._filtered.move_to_end(key)
+                return buckets
+        buckets = build_buckets(self.catalog.get_menu_items_by_tags(sauna_id, tag_filter))
+        with self._lock:
+            self._filtered[key] = buckets
+            while len(self._filtered) > FILTERED_CACHE_SIZE:
+                self._filtered.popitem(last=False)
+        return buckets
+
+    def budget_plan(self, sauna_id, budget: int, tag_filter: Optional[TagFilter] = None) -> BudgetPlan:
+        """入浴料込みで budget 円以内の組み合わせの抽選表（(サウナ, 条件, 予算) ごとに覚えておく）。"""
+        key = (sauna_id, tag_filter or None, budget)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self._plans.move_to_end(key)
+                return plan
+        sauna = self.catalog.get_sauna(sauna_id)
+        plan = BudgetPlan(self.buckets(sauna_id, tag_filter), budget, sauna.price if sauna else 0)
+        with self._lock:
+            self._plans[key] = plan
+            while len(self._plans) > BUDGET_CACHE_SIZE:
+                self._plans.popitem(last=False)
+        return plan
+
+    def pull(
+        self,
+        sauna_id,
+        rng: Optional[random.Random] = None,
+        tag_filter: Optional[TagFilter] = None,
+        budget: Optional[int] = None,
+    ) -> List[MenuItem]:
+        """1回分を引く。budget を渡したとき、予算に収まる組み合わせが無ければ空のリスト。"""
+        if budget is not None:
+            return self.budget_plan(sauna_id, budget, tag_filter).draw(rng or self.rng)
+        return draw_from_buckets(self.buckets(sauna_id, tag_filter), rng or self.rng)
+
+    def pull_many(
+        self,
+        sauna_id,
+        n: int,
+        rng: Optional[random.Random] = None,
+        tag_filter: Optional[TagFilter] = None,
+        budget: Optional[int] = None,
+    ) -> List[List[MenuItem]]:
+        """独立な n 回分（10連など）をまとめて引く。"""
+        rng = rng or self.rng
+        if budget is not None:
+            plan = self.budget_plan(sauna_id, budget, tag_filter)
+            return [plan.draw(rng) for _ in range(n)]
+        buckets = self.buckets(sauna_id, tag_filter)
+        return [draw_from_buckets(buckets, rng) for _ in range(n)]
@@ -0,0 +1,158 @@
+import math
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS = 6371000
+# 緯度1度あたりの距離（m）
+METERS_PER_DEGREE = EARTH_RADIUS * math.pi / 180
+
+
+def haversine_many(lat, lng, lats, lngs) -> np.ndarray:
+    """1点から複数点までの距離（m）をまとめて計算する。lat/lng も配列ならブロードキャストする。"""
+    phi1 = np.radians(np.asarray(lat, dtype=float))
+    phi2 = np.radians(np.asarray(lats, dtype=float))
+    d_phi = phi2 - phi1
+    d_lambda = np.radians(np.asarray(lngs, dtype=float) - np.asarray(lng, dtype=float))
+    a = np.sin(d_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(d_lambda / 2) ** 2
+    return EARTH_RADIUS * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def coordinates(items: Sequence[Dict], lat_key: str = "latitude", lng_key: str = "longitude"):
+    """数値として読める座標を持つものだけを (items, lats, lngs) で返す。"""
+    kept, lats, lngs = [], [], []
+    for item in items:
+        try:
+            lat = float(item.get(lat_key))
+            lng = float(item.get(lng_key))
+        except (TypeError, ValueError):
+            continue
+        if math.isnan(lat) or math.isnan(lng):
+            continue
+        kept.append(item)
+        lats.append(lat)
+        lngs.append(lng)
+    return kept, np.array(lats, dtype=float), np.array(lngs, dtype=float)
+
+
+class GridIndex:
+    """緯度経度を cell_size（m）四方のマス目に分けて引く空間インデックス。
+
+    半径検索・近傍 k 件の検索は、問い合わせ地点の周りのマスだけを見て
+    候補を絞ってから haversine_many で正確な距離を測る。
+    """
+
+    def __init__(
+        self,
+        items: Sequence[Any],
+        lats: Sequence[float],
+        lngs: Sequence[float],
+        cell_size: float = 500.0,
+    ):
+        self.items = list(items)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        if not (len(self.items) == len(self.lats) == len(self.lngs)):
+            raise ValueError("items, lats and lngs must have the same length")
+        self.cell_size = cell_size
+        self._dlat = cell_size / METERS_PER_DEGREE
+        # 経度方向のマス幅はデータの最も高緯度側でも cell_size 以上になるようにとる
+        max_abs_lat = float(np.abs(self.lats).max()) if len(self.lats) else 0.0
+        self._dlng = cell_size / (METERS_PER_DEGREE * max(math.cos(math.radians(min(max_abs_lat, 89.0))), 1e-6))
+        rows = np.floor(self.lats / self._dlat).astype(np.int64)
+        cols = np.floor(self.lngs / self._dlng).astype(np.int64)
+        buckets = defaultdict(list)
+        for i, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            buckets[cell].append(i)
+        self._cells = {cell: np.array(ids, dtype=np.int64) for cell, ids in buckets.items()}
+        if len(self.items):
+            self._row_range = (int(rows.min()), int(rows.max()))
+            self._col_range = (int(cols.min()), int(cols.max()))
+
+    @classmethod
+    def from_records(
+        cls,
+        records: Sequence[Dict],
+        lat_key: str = "latitude",
+        lng_key: str = "longitude",
+        cell_size: float = 500.0,
+    ) -> "GridIndex":
+        items, lats, lngs = coordinates(records, lat_key, lng_key)
+        return cls(items, lats, lngs, cell_size=cell_size)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def _cell_of(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self._dlat), math.floor(lng / self._dlng)
+
+    def _candidates(self, row: int, col: int, ring_rows: int, ring_cols: int) -> np.ndarray:
+        if (2 * ring_rows + 1) * (2 * ring_cols + 1) > len(self._cells):
+            # 範囲が広いときは空でないマスを総なめにするほうが速い
+            found = [
+                ids for (r, c), ids in self._cells.items()
+                if abs(r - row) <= ring_rows and abs(c - col) <= ring_cols
+            ]
+        else:
+            found = [
+                self._cells[(r, c)]
+                for r in range(row - ring_rows, row + ring_rows + 1)
+                for c in range(col - ring_cols, col + ring_cols + 1)
+                if (r, c) in self._cells
+            ]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _ring_cols(self, lat: float, ring_rows: int) -> int:
+        # 低緯度ではマスの横幅が cell_size より広いので、縦より少ない列数で足りる。
+        # 探す範囲のうち最も高緯度側の幅で見積もる
+        edge_lat = min(abs(lat) + ring_rows * self._dlat, 89.0)
+        width = self._dlng * METERS_PER_DEGREE * math.cos(math.radians(edge_lat))
+        return max(1, math.ceil(ring_rows * self.cell_size / max(width, 1e-6)))
+
+    def within(self, lat: float, lng: float, radius: float) -> List[Tuple[Any, float]]:
+        """半径 radius（m）以内を近い順に (item, 距離) で返す。"""
+        if not len(self.items):
+            return []
+        row, col = self._cell_of(lat, lng)
+        # ring マス分の範囲で取りこぼしがないのは (ring - 1) * cell_size まで
+        ring_rows = math.ceil(radius / self.cell_size) + 1
+        ids = self._candidates(row, col, ring_rows, self._ring_cols(lat, ring_rows))
+        if not len(ids):
+            return []
+        distances = haversine_many(lat, lng, self.lats[ids], self.lngs[ids])
+        mask = distances <= radius
+        ids, distances = ids[mask], distances[mask]
+        order = np.argsort(distances, kind="stable")
+        return [(self.items[i], float(d)) for i, d in zip(ids[order].tolist(), distances[order].tolist())]
+
+    def nearest(self, lat: float, lng: float, k: int = 1, max_distance: Optional[float] = None) -> List[Tuple[Any, float]]:
+        """近い順に最大 k 件を (item, 距離) で返す。"""
+        if k <= 0 or not len(self.items):
+            return []
+        row, col = self._cell_of(lat, lng)
+        max_ring = max(
+            abs(row - self._row_range[0]), abs(row - self._row_range[1]),
+            abs(col - self._col_range[0]), abs(col - self._col_range[1]),
+        ) + 1
+        ring = 1
+        while True:
+            if ring >= max_ring:
+                # 全マスを見るのと変わらないので全件で測る
+                ids = np.arange(len(self.items))
+                distances = haversine_many(lat, lng, self.lats, self.lngs)
+                break
+            ids = self._candidates(row, col, ring, self._ring_cols(lat, ring))
+            distances = haversine_many(lat, lng, self.lats[ids], self.lngs[ids])
+            # ring マス分の半径までは取りこぼしがない
+            covered = (ring - 1) * self.cell_size
+            if max_distance is not None and covered >= max_distance:
+                break
+            if np.count_nonzero(distances <= covered) >= k:
+                break
+            ring = min(ring * 2, max_ring)
+        if max_distance is not None:
+            mask = distances <= max_distance
+            ids, distances = ids[mask], distances[mask]
+        order = np.argsort(distances, kind="stable")[:k]
+        return [(self.items[i], float(d)) for i, d in zip(ids[order].tolist(), distances[order].tolist())]
@@ -0,0 +1,57 @@
+from typing import TYPE_CHECKING, Dict, List
+
+from sameshi.assets import DEFAULT_PIN
+
+if TYPE_CHECKING:
+    import pandas as pd
+    import pydeck as pdk
+
+SAUNA_TYPE = "サウナ"
+
+# マーカー種別 → アイコンアトラス上のピンのキー
+TYPE_ICONS = {
+    SAUNA_TYPE: "sauna",
+    "カレー": "curry",
+    "ラーメン": "ramen",
+    "牛丼": "gyudon",
+    "ハンバーガー": "burger",
+}
+
+TOOLTIP = {
+    "html": "<b>{name}</b><br>{type}<br>評価: {rating}",
+    "style": {"backgroundColor": "white", "color": "black"}
+}
+
+
+def build_map_data(lat, lng, nearby_foods: List[Dict]) -> "pd.DataFrame":
+    """サウナ1件 + 周辺の店舗のマーカー。行ごとの処理はせず列単位で組み立てる。"""
+    import pandas as pd
+
+    places = pd.DataFrame.from_records(
+        nearby_foods, columns=["latitude", "longitude", "name", "keyword", "rating"]
+    ).rename(columns={"latitude": "lat", "longitude": "lon", "keyword": "type"})
+    sauna = pd.DataFrame({"lat": [lat], "lon": [lng], "name": ["サウナ"], "type": [SAUNA_TYPE], "rating": [0]})
+    map_data = pd.concat([sauna, places], ignore_index=True)
+    map_data["rating"] = map_data["rating"].fillna(0)
+    # アイコン画像そのものではなくアトラス上のキーだけを持たせる
+    map_data["icon"] = map_data["type"].map(TYPE_ICONS).fillna(DEFAULT_PIN)
+    return map_data
+
+
+def build_deck(lat, lng, map_data: "pd.DataFrame", icon_atlas_src: str, icon_mapping: Dict[str, Dict]) -> "pdk.Deck":
+    import pydeck as pdk
+
+    layer = pdk.Layer(
+        "IconLayer",
+        data=map_data,
+        # 引用符で囲むと pydeck はローカルファイルとして読み込まず、URL/データURI をそのまま渡す
+        icon_atlas=f'"{icon_atlas_src}"',
+        icon_mapping=icon_mapping,
+        get_icon="icon",
+        get_size=4,
+        size_scale=15,
+        get_position='[lon, lat]',
+        pickable=True
+    )
+    view_state = pdk.ViewState(latitude=lat, longitude=lng, zoom=16)
+    return pdk.Deck(layers=[layer], initial_view_state=view_state, tooltip=TOOLTIP, map_style="mapbox://styles/mapbox/light-v9")
@@ -0,0 +1,266 @@
+"""1回の再実行（ページビュー）ごとの計測。
+
+処理時間のスパンと回数のカウンタを、実行中の RunMetrics と
+プロセス全体の集計（REGISTRY）の両方に記録する。実行中の RunMetrics は
+contextvars で引き回すので、関数の引数を増やさずにどこからでも記録できる。
+スレッドプールに投げる処理は submit() を使うと同じ実行に数えられる。
+
+集計は JSON のログ1行（logger "sameshi.metrics"）と、Prometheus 形式の
+テキスト（prometheus_text / serve_prometheus）で外に出す。
+"""
+import contextvars
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 外部 API への呼び出しとして数えるカウンタ（名前が .requests で終わるもの）
+REQUEST_SUFFIX = ".requests"
+
+# パーセンタイルを出すために覚えておく直近の件数
+WINDOW = 1024
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class RunMetrics:
+    """1回の再実行ぶんのスパンとカウンタ。"""
+
+    def __init__(self, kind: str = "page", session_id: str = ""):
+        self.kind = kind
+        self.session_id = session_id
+        self.run_id = uuid.uuid4().hex[:12]
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: Dict[str, List[float]] = defaultdict(list)
+        self.counters: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.duration is not None
+
+    def record_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name].append(seconds)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def outbound_requests(self) -> int:
+        return sum(n for name, n in self.counters.items() if name.endswith(REQUEST_SUFFIX))
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            spans = {
+                name: {"count": len(values), "total_ms": round(sum(values) * 1000, 3), "max_ms": round(max(values) * 1000, 3)}
+                for name, values in self.spans.items()
+            }
+            counters = dict(self.counters)
+        duration = self.duration if self.duration is not None else time.perf_counter() - self.started
+        return {
+            "kind": self.kind,
+            "session": self.session_id,
+            "run": self.run_id,
+            "duration_ms": round(duration * 1000, 3),
+            "outbound_requests": self.outbound_requests(),
+            "spans": spans,
+            "counters": counters,
+        }
+
+
+def quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, round(q * (len(sorted_values) - 1)))]
+
+
+class Registry:
+    """プロセス全体の集計。カウンタは累計、スパンと実行ごとの値は直近 WINDOW 件の分布を持つ。"""
+
+    def __init__(self, window: int = WINDOW):
+        self.window = window
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.spans: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self.span_totals: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0])  # [回数, 合計秒]
+        self.runs: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+        self.run_count: Dict[str, int] = defaultdict(int)
+
+    def record_span(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.spans[name].append(seconds)
+            totals = self.span_totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def observe_run(self, run: RunMetrics) -> None:
+        """実行1回ぶんの所要時間・HTML バイト数・外部呼び出し回数を分布に加える。"""
+        with self._lock:
+            self.run_count[run.kind] += 1
+            self.runs[f"{run.kind}_duration_seconds"].append(run.duration or 0.0)
+            self.runs[f"{run.kind}_html_bytes"].append(run.counters.get("html.bytes", 0))
+            self.runs[f"{run.kind}_outbound_requests"].append(run.outbound_requests())
+
+    def reset(self) -> None:
+        with self._lock:
+            for table in (self.counters, self.spans, self.span_totals, self.runs, self.run_count):
+                table.clear()
+
+    def prometheus_text(self, prefix: str = "sameshi") -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self.counters):
+                metric = f"{prefix}_{_metric_name(name)}_total"
+                lines += [f"# TYPE {metric} counter", f"{metric} {self.counters[name]}"]
+
+            metric = f"{prefix}_runs_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f'{metric}{{kind="{kind}"}} {n}' for kind, n in sorted(self.run_count.items())]
+
+            metric = f"{prefix}_span_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name in sorted(self.spans):
+                values = sorted(self.spans[name])
+                label = f'span="{name}"'
+                lines += [f'{metric}{{{label},quantile="{q}"}} {quantile(values, q):.6f}' for q in QUANTILES]
+                count, total = self.span_totals[name]
+                lines += [f"{metric}_count{{{label}}} {count}", f"{metric}_sum{{{label}}} {total:.6f}"]
+
+            for name in sorted(self.runs):
+                metric = f"{prefix}_{name}"
+                values = sorted(self.runs[name])
+                lines.append(f"# TYPE {metric} summary")
+                lines += [f'{metric}{{quantile="{q}"}} {quantile(values, q):g}' for q in QUANTILES]
+                lines += [f"{metric}_count {len(values)}", f"{metric}_sum {sum(values):g}"]
+        return "\n".join(lines) + "\n"
+
+
+def _metric_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+REGISTRY = Registry()
+
+_current: contextvars.ContextVar[Optional[RunMetrics]] = contextvars.ContextVar("sameshi_run_metrics", default=None)
+
+
+# ------------------ 記録 ------------------
+def current() -> Optional[RunMetrics]:
+    return _current.get()
+
+
+def count(name: str, n: int = 1) -> None:
+    REGISTRY.count(name, n)
+    run = _current.get()
+    if run is not None:
+        run.count(name, n)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        REGISTRY.record_span(name, elapsed)
+        run = _current.get()
+        if run is not None:
+            run.record_span(name, elapsed)
+
+
+def timed(name: str) -> Callable:
+    """関数全体をスパンで包むデコレータ。"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def submit(executor: Executor, fn: Callable, *args, **kwargs) -> Future:
+    """executor.submit と同じだが、呼び出し元の実行（RunMetrics）を引き継ぐ。"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# ------------------ 実行の開始・終了 ------------------
+def start_run(kind: str = "page", session_id: str = "") -> RunMetrics:
+    run = RunMetrics(kind, session_id)
+    _current.set(run)
+    return run
+
+
+def finish_run(run: RunMetrics, totals: Optional[Dict[str, int]] = None, log: bool = True) -> Dict:
+    """実行を締めて集計に加え、JSON のログ1行を出す。
+
+    totals（セッションごとの累計など）を渡すと、この実行のカウンタを足し込む。
+    """
+    if run.finished:
+        return run.to_dict()
+    run.duration = time.perf_counter() - run.started
+    REGISTRY.observe_run(run)
+    record = run.to_dict()
+    if totals is not None:
+        totals["runs"] = totals.get("runs", 0) + 1
+        for name, n in record["counters"].items():
+            totals[name] = totals.get(name, 0) + n
+    if log and logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+    return record
+
+
+@contextmanager
+def run_scope(kind: str, session_id: str = "", totals: Optional[Dict[str, int]] = None) -> Iterator[RunMetrics]:
+    """実行中の RunMetrics があればそれに記録し、なければ新しく始めて抜けるときに締める。
+
+    Streamlit のフラグメントは単独で再実行されることがあるので、その場合だけ別の実行として数える。
+    """
+    run = _current.get()
+    if run is not None and not run.finished:
+        yield run
+        return
+    run = start_run(kind, session_id)
+    try:
+        yield run
+    finally:
+        finish_run(run, totals)
+
+
+# ------------------ Prometheus ------------------
+def serve_prometheus(port: int, host: str = "0.0.0.0", registry: Registry = REGISTRY) -> ThreadingHTTPServer:
+    """/metrics で Prometheus 形式のテキストを返す HTTP サーバーをデーモンスレッドで起動する。"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="sameshi-metrics", daemon=True).start()
+    return server
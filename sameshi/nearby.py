@@ -0,0 +1,358 @@
+"""サウナごとの「徒歩圏内のお店」を前もって計算しておく表（SQLite）。
+
+周辺のお店は日によってほとんど変わらないので、バッチで全サウナぶんを計算し、
+絞り込み済みの店舗一覧とカード用のサムネイルを1つのファイルに書いておく。
+ページはこの表を直接読むので、ふだんは Google を一度も呼ばない（表に無いサウナ・
+座標が変わったサウナだけその場で検索する）。
+
+バッチは差分更新で、座標が変わったサウナ・max_age より古いサウナ・表に無いサウナだけを
+検索し直す。カタログから消えたサウナの行は削除する。
+
+    python -m sameshi.nearby refresh --snapshot sameshi.sqlite --offline
+    python -m sameshi.nearby refresh --max-age-days 3 --force
+    python -m sameshi.nearby info
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from sameshi.records import Sauna
+
+if TYPE_CHECKING:
+    from sameshi.catalog import Catalog
+    from sameshi.service import SameshiService
+
+logger = logging.getLogger(__name__)
+
+# 表の形式を変えたら上げる（違う版のファイルは読まずに作り直す）
+SCHEMA_VERSION = 1
+
+DEFAULT_PATH = os.path.join(".cache", "nearby.sqlite")
+DEFAULT_RADIUS = 200
+DEFAULT_MAX_AGE = 7 * 24 * 3600
+
+# 座標の一致とみなす誤差（度。約1cm）
+COORD_TOLERANCE = 1e-7
+
+
+class NearbyEntry(NamedTuple):
+    sauna_id: int
+    radius: int
+    latitude: float
+    longitude: float
+    computed_at: float
+    generation: int
+    stores: List[Dict]
+
+
+class RefreshStats(NamedTuple):
+    checked: int
+    refreshed: int
+    removed: int
+    failed: int
+    generation: int
+
+
+class NearbyTable:
+    """sauna_id・半径ごとの周辺のお店と、photo_reference ごとのサムネイル（JPEG）。
+
+    1プロセス内ではスレッド間で1つの接続を共有する。WAL なのでバッチの書き込み中もページは読める。
+    readonly=True（ページ・API）は表を作り直さない。スキーマの版が違えば事前計算は無いものとして
+    扱い、呼び出し側はその場の検索に戻る（版の移行は書き込み側のバッチだけが行う）。
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, clock: Callable[[], float] = time.time, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._mismatch_logged = False
+        if not readonly:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if not readonly:
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode = WAL")
+                self._ensure_schema()
+
+    def _ensure_schema(self) -> None:
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is not None and row[0] != str(SCHEMA_VERSION):
+            logger.warning("nearby table %s has schema version %s; rebuilding", self.path, row[0])
+            self._conn.executescript("DROP TABLE IF EXISTS nearby; DROP TABLE IF EXISTS thumbnails; DELETE FROM meta;")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS nearby (
+                sauna_id INTEGER NOT NULL,
+                radius INTEGER NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                computed_at REAL NOT NULL,
+                generation INTEGER NOT NULL,
+                stores TEXT NOT NULL,
+                PRIMARY KEY (sauna_id, radius)
+            );
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                photo_reference TEXT PRIMARY KEY,
+                jpeg BLOB NOT NULL
+            );
+            """
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('generation', '0')")
+        self._conn.commit()
+
+    def _readable(self) -> bool:
+        """このコードと同じ版の表か（書き込み側は開いたときに移行済み）。ロックを持って呼ぶ。"""
+        if not self.readonly:
+            return True
+        try:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        except sqlite3.OperationalError:
+            row = None
+        if row is not None and row[0] == str(SCHEMA_VERSION):
+            return True
+        if not self._mismatch_logged:
+            self._mismatch_logged = True
+            logger.warning(
+                "nearby table %s has schema version %s (expected %s); ignoring it",
+                self.path, row[0] if row else None, SCHEMA_VERSION,
+            )
+        return False
+
+    # ------------------ 読み込み ------------------
+    @property
+    def generation(self) -> int:
+        with self._lock:
+            if not self._readable():
+                return 0
+            return int(self._conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()[0])
+
+    def meta(self) -> Dict[str, str]:
+        with self._lock:
+            if not self._readable():
+                return {}
+            return dict(self._conn.execute("SELECT key, value FROM meta"))
+
+    def get(self, sauna_id: int, radius: int = DEFAULT_RADIUS) -> Optional[NearbyEntry]:
+        with self._lock:
+            if not self._readable():
+                return None
+            row = self._conn.execute(
+                "SELECT sauna_id, radius, latitude, longitude, computed_at, generation, stores "
+                "FROM nearby WHERE sauna_id = ? AND radius = ?",
+                (sauna_id, radius),
+            ).fetchone()
+        if row is None:
+            return None
+        return NearbyEntry(*row[:6], json.loads(row[6]))
+
+    def lookup(self, sauna: Sauna, radius: int = DEFAULT_RADIUS) -> Optional[NearbyEntry]:
+        """サウナの今の座標で計算済みの行（古くても返す。座標が変わっていれば None）。"""
+        entry = self.get(sauna.id, radius)
+        if entry is None or not _same_location(entry, sauna):
+            return None
+        return entry
+
+    def thumbnails(self, photo_references: Iterable[Optional[str]]) -> Dict[str, bytes]:
+        refs = list(dict.fromkeys(ref for ref in photo_references if ref))
+        if not refs:
+            return {}
+        with self._lock:
+            if not self._readable():
+                return {}
+            rows = self._conn.execute(
+                f"SELECT photo_reference, jpeg FROM thumbnails WHERE photo_reference IN ({','.join('?' * len(refs))})",
+                refs,
+            ).fetchall()
+        return dict(rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            if not self._readable():
+                return 0
+            return self._conn.execute("SELECT COUNT(*) FROM nearby").fetchone()[0]
+
+    # ------------------ 書き込み ------------------
+    def _check_writable(self) -> None:
+        if self.readonly:
+            raise RuntimeError(f"nearby table {self.path} is opened read-only")
+
+    def needs_refresh(self, sauna: Sauna, radius: int = DEFAULT_RADIUS, max_age: float = DEFAULT_MAX_AGE) -> bool:
+        entry = self.get(sauna.id, radius)
+        return entry is None or not _same_location(entry, sauna) or self._clock() - entry.computed_at > max_age
+
+    def put(
+        self,
+        sauna: Sauna,
+        radius: int,
+        stores: List[Dict],
+        thumbnails: Dict[str, bytes],
+        generation: int,
+        catalog_version: str = "",
+    ) -> None:
+        self._check_writable()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nearby "
+                "(sauna_id, radius, latitude, longitude, computed_at, generation, stores) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (sauna.id, radius, sauna.latitude, sauna.longitude, self._clock(), generation,
+                 json.dumps(stores, ensure_ascii=False)),
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO thumbnails (photo_reference, jpeg) VALUES (?, ?)", thumbnails.items()
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                [("generation", str(generation)), ("catalog_version", catalog_version),
+                 ("updated_at", str(int(self._clock())))],
+            )
+            self._conn.commit()
+
+    def remove_except(self, sauna_ids: Iterable[int]) -> int:
+        """sauna_ids 以外の行と、どの行からも参照されないサムネイルを消し、消した行数を返す。"""
+        self._check_writable()
+        keep = set(sauna_ids)
+        with self._lock:
+            stale = [(sid,) for (sid,) in self._conn.execute("SELECT DISTINCT sauna_id FROM nearby") if sid not in keep]
+            self._conn.executemany("DELETE FROM nearby WHERE sauna_id = ?", stale)
+            # 行を消さなくても、検索し直して店が入れ替わった行のサムネイルは参照されなくなっている
+            referenced = set()
+            for (stores,) in self._conn.execute("SELECT stores FROM nearby"):
+                referenced.update(s.get("photo_reference") for s in json.loads(stores))
+            orphans = [
+                (ref,) for (ref,) in self._conn.execute("SELECT photo_reference FROM thumbnails")
+                if ref not in referenced
+            ]
+            self._conn.executemany("DELETE FROM thumbnails WHERE photo_reference = ?", orphans)
+            self._conn.commit()
+        return len(stale)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _same_location(entry: NearbyEntry, sauna: Sauna) -> bool:
+    if sauna.latitude is None or sauna.longitude is None:
+        return False
+    return (
+        abs(entry.latitude - sauna.latitude) <= COORD_TOLERANCE
+        and abs(entry.longitude - sauna.longitude) <= COORD_TOLERANCE
+    )
+
+
+# ------------------ バッチ ------------------
+def refresh_table(
+    table: NearbyTable,
+    catalog: "Catalog",
+    service: "SameshiService",
+    radius: int = DEFAULT_RADIUS,
+    max_age: float = DEFAULT_MAX_AGE,
+    force: bool = False,
+    limit: Optional[int] = None,
+    progress: Optional[Callable[[int, int, Sauna], None]] = None,
+) -> RefreshStats:
+    """座標が変わった・古い・未計算のサウナだけ検索し直す（force なら全部）。
+
+    1件の失敗でバッチ全体は止めない（その行は前の結果のまま残す）。limit は1回で検索し直す上限。
+    速度はサービスの places_scheduler に従う（バッチでは待ってでもクォータ内に収める）。
+    """
+    located = [s for s in catalog.saunas if s.latitude is not None and s.longitude is not None]
+    targets = [s for s in located if force or table.needs_refresh(s, radius, max_age)]
+    if limit is not None:
+        targets = targets[:limit]
+    generation = table.generation + 1
+    refreshed = failed = 0
+    for i, sauna in enumerate(targets):
+        if progress is not None:
+            progress(i, len(targets), sauna)
+        try:
+            # 一部のキーワードだけ失敗した結果は書かない（前の行を残して次回やり直す）
+            stores = service.find_nearby_good_food(sauna.latitude, sauna.longitude, radius=radius, skip_errors=False)
+            thumbnails = service.thumbnailer.get_many(store.get("photo_reference") for store in stores)
+        except Exception:
+            logger.exception("failed to precompute nearby food for sauna %s", sauna.id)
+            failed += 1
+            continue
+        thumbnails = {ref: jpeg for ref, jpeg in thumbnails.items() if jpeg}
+        table.put(sauna, radius, stores, thumbnails, generation, catalog.version)
+        refreshed += 1
+    # 座標が消えたサウナの行も消す（残すと lookup が古い座標の結果を返し続ける）。
+    # どの行からも参照されなくなったサムネイルもここで消す
+    removed = table.remove_except(s.id for s in located)
+    return RefreshStats(len(located), refreshed, removed, failed, table.generation)
+
+
+# ------------------ CLI ------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    from sameshi.outbound import OutboundScheduler
+    from sameshi.photos import PHOTO_RATE
+    from sameshi.places import PLACES_RATE
+    from sameshi.service import SameshiService, open_catalog_store, open_snapshot_cache
+    from sameshi.sheets import SHEET_ID, service_account_credentials
+
+    parser = argparse.ArgumentParser(prog="python -m sameshi.nearby", description="徒歩圏内のお店の事前計算")
+    parser.add_argument("--table", default=os.getenv("SAMESHI_NEARBY_TABLE", DEFAULT_PATH))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    refresh = sub.add_parser("refresh", help="座標が変わった・古いサウナだけ検索し直す")
+    refresh.add_argument("--snapshot", default=os.getenv("SAMESHI_SNAPSHOT"), help="ローカルスナップショット")
+    refresh.add_argument("--credentials", default="credentials.json", help="サービスアカウントの JSON キー")
+    refresh.add_argument("--offline", action="store_true", help="Google Sheets にアクセスしない")
+    refresh.add_argument("--sheet-id", default=SHEET_ID)
+    refresh.add_argument("--radius", type=int, default=DEFAULT_RADIUS)
+    refresh.add_argument("--max-age-days", type=float, default=DEFAULT_MAX_AGE / 86400)
+    refresh.add_argument("--force", action="store_true", help="全サウナを検索し直す")
+    refresh.add_argument("--limit", type=int, help="1回で検索し直すサウナ数の上限")
+    refresh.add_argument("--rate", type=float, default=PLACES_RATE, help="Places API の呼び出し速度（件/秒）")
+
+    sub.add_parser("info", help="表の中身を表示する")
+
+    args = parser.parse_args(argv)
+    table = NearbyTable(args.table)
+    if args.command == "info":
+        meta = table.meta()
+        for key in ("schema_version", "generation", "catalog_version", "updated_at"):
+            print(f"{key + ':':<16}{meta.get(key, '')}")
+        print(f"{'saunas:':<16}{len(table)}")
+        return 0
+
+    cache_dir = os.getenv("SAMESHI_CACHE_DIR", ".cache")
+    cache_url = os.getenv("SAMESHI_CACHE_URL")
+    creds = None if args.offline else service_account_credentials(keyfile=args.credentials)
+    service = SameshiService(
+        open_catalog_store(
+            args.sheet_id, creds, snapshot_path=args.snapshot, shared=open_snapshot_cache(cache_url, cache_dir)
+        ),
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        cache_dir=cache_dir,
+        cache_url=cache_url,
+        # バッチはスロットルで諦めず、トークンが貯まるまで待つ
+        places_scheduler=OutboundScheduler("places", rate=args.rate, burst=1, max_wait=float("inf")),
+        photo_scheduler=OutboundScheduler("photos", rate=PHOTO_RATE, burst=1, max_wait=float("inf")),
+    )
+
+    def progress(i: int, total: int, sauna: Sauna) -> None:
+        print(f"[{i + 1}/{total}] {sauna.name}", flush=True)
+
+    stats = refresh_table(
+        table, service.catalog, service,
+        radius=args.radius, max_age=args.max_age_days * 86400, force=args.force, limit=args.limit,
+        progress=progress,
+    )
+    print(
+        f"checked {stats.checked}, refreshed {stats.refreshed}, removed {stats.removed}, "
+        f"failed {stats.failed} (generation {stats.generation})"
+    )
+    return 1 if stats.failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
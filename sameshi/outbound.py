@@ -0,0 +1,217 @@
+"""Google への呼び出し（Places の周辺検索・写真）の交通整理。
+
+OutboundScheduler は1つの外部 API につき1つ作り、プロセス内の全セッションで共有する。
+
+- 同じキーの呼び出しが実行中なら、後から来た呼び出しはその結果を待つ（singleflight）
+- トークンバケットでクォータに合わせた速度に抑える。max_wait 秒待ってもトークンが
+  取れなければ「スロットル」として扱う
+- 一時的なエラーは上限回数まで、ジッター付きの指数バックオフで再試行する。
+  API のクォータ超過（OVER_QUERY_LIMIT / 429）は再試行しない
+- スロットル・再試行切れのときは、同じキーで最後に成功した結果を返す。このプロセスで
+  覚えていなければ呼び出し側の stale()（キャッシュの期限切れのエントリなど）で代用し、
+  それも無ければ例外
+
+アクセスが集中するのは同じサウナを同時に開いたときなので、クォータを使い切る原因の
+大半は同一の検索の重複で、singleflight だけでほとんど消える。
+"""
+import logging
+import random
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sameshi import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Throttled(Exception):
+    """レート制限（自前のトークンバケット、または API のクォータ超過）で呼べなかった。"""
+
+
+class Retryable(Exception):
+    """再試行すれば通るかもしれないエラー（5xx など）を呼び出し側が示すための例外。"""
+
+
+class TokenBucket:
+    """rate 個/秒で補充され、最大 burst 個まで貯まるトークンバケット（スレッドセーフ）。"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """トークンを1つ予約し、使えるようになるまでの待ち時間（秒）を返す。"""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, max_wait: float = 0.0) -> bool:
+        """トークンを1つ取る。max_wait 秒以内に取れないなら何も消費せずに False。"""
+        with self._lock:
+            wait = self._reserve()
+            if wait > max_wait:
+                self._tokens += 1
+                return False
+        if wait > 0:
+            self._sleep(wait)
+        return True
+
+
+class OutboundScheduler:
+    """1つの外部 API への呼び出しをまとめる（singleflight + レート制限 + 再試行 + 最後の成功結果）。
+
+    classify(e) は例外を "throttled"（クォータ超過）/ "retry"（一時的）/ None（再試行しない）に分ける。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float,
+        burst: int,
+        max_wait: float = 2.0,
+        retries: int = 2,
+        backoff: float = 0.25,
+        max_backoff: float = 2.0,
+        classify: Optional[Callable[[BaseException], Optional[str]]] = None,
+        stale_entries: int = 2048,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+        rng: Optional[random.Random] = None,
+    ):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.max_wait = max_wait
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.classify = classify or default_classify
+        self.stale_entries = stale_entries
+        self._sleep = sleep
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._last_good: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def call(self, key: Hashable, fn: Callable[[], Any], stale: Optional[Callable[[], Any]] = None) -> Any:
+        """key ごとに fn() を高々1つだけ実行し、その結果（またはエラー）を待っている全員に返す。
+
+        stale は fn() が失敗し、このプロセスに最後の成功結果も無いときの代わりを返す関数
+        （無ければ None を返す）。再起動しても残るキャッシュの期限切れのエントリを渡す。
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = Future()
+        if not leader:
+            metrics.count(f"{self.name}.coalesced")
+            return future.result()
+        try:
+            result = self._call_with_fallback(key, fn, stale)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def last_good(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return self._last_good.get(key, default)
+
+    def _remember(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._last_good[key] = value
+            self._last_good.move_to_end(key)
+            while len(self._last_good) > self.stale_entries:
+                self._last_good.popitem(last=False)
+
+    def _call_with_fallback(
+        self, key: Hashable, fn: Callable[[], Any], stale: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        try:
+            result = self._call_with_retries(fn)
+        except Exception as e:
+            with self._lock:
+                found = key in self._last_good
+                last_good = self._last_good.get(key)
+            if not found and stale is not None:
+                try:
+                    last_good = stale()
+                except Exception:
+                    logger.warning("%s: failed to read the stale result for %s", self.name, key, exc_info=True)
+                    last_good = None
+                found = last_good is not None
+            if not found:
+                raise
+            metrics.count(f"{self.name}.stale_served")
+            logger.warning("%s: serving the last good result for %s (%s)", self.name, key, e)
+            return last_good
+        self._remember(key, result)
+        return result
+
+    def _call_with_retries(self, fn: Callable[[], Any]) -> Any:
+        attempt = 0
+        while True:
+            if not self.bucket.acquire(self.max_wait):
+                metrics.count(f"{self.name}.throttled")
+                raise Throttled(f"{self.name}: rate limit reached")
+            try:
+                return fn()
+            except Exception as e:
+                kind = self.classify(e)
+                if kind == "throttled":
+                    # クォータ超過中に再送しても枠を食うだけなので、すぐ前回の結果に切り替える
+                    metrics.count(f"{self.name}.throttled")
+                    raise
+                if kind != "retry" or attempt >= self.retries:
+                    raise
+            attempt += 1
+            metrics.count(f"{self.name}.retries")
+            # full jitter: [0, min(上限, base * 2^n)) の一様乱数だけ待つ
+            self._sleep(self._rng.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+
+def default_classify(e: BaseException) -> Optional[str]:
+    """Throttled / Retryable と googlemaps の例外を分類する（googlemaps は読み込み済みのときだけ見る）。"""
+    if isinstance(e, Throttled):
+        return "throttled"
+    if isinstance(e, (Retryable, TimeoutError, ConnectionError)):
+        return "retry"
+    exceptions = _googlemaps_exceptions()
+    if exceptions is not None:
+        if isinstance(e, exceptions.ApiError):
+            if e.status in ("OVER_QUERY_LIMIT", "RESOURCE_EXHAUSTED"):
+                return "throttled"
+            return "retry" if e.status == "UNKNOWN_ERROR" else None
+        if isinstance(e, exceptions.HTTPError):
+            if e.status_code == 429:
+                return "throttled"
+            return "retry" if e.status_code >= 500 else None
+        if isinstance(e, (exceptions.Timeout, exceptions.TransportError)):
+            return "retry"
+    return None
+
+
+def _googlemaps_exceptions():
+    return sys.modules.get("googlemaps.exceptions")
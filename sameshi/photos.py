@@ -0,0 +1,143 @@
+import base64
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from PIL import Image, ImageOps
+
+from sameshi import metrics
+from sameshi.cache import CacheBackend
+from sameshi.outbound import OutboundScheduler, Retryable, Throttled
+
+if TYPE_CHECKING:
+    import requests
+
+logger = logging.getLogger(__name__)
+
+PHOTO_API_URL = "https://maps.googleapis.com/maps/api/place/photo"
+
+# カードの表示サイズは 150×150。高密度ディスプレイ向けに2倍で作る
+CARD_SIZE = 150
+THUMBNAIL_PIXELS = CARD_SIZE * 2
+THUMBNAIL_QUALITY = 80
+
+# (接続, 読み込み) のタイムアウト秒。遅い1枚でページ全体を止めない
+REQUEST_TIMEOUT = (3.05, 8)
+
+# 写真の取得速度の上限（件/秒）と瞬間的に許す件数
+PHOTO_RATE = 20.0
+PHOTO_BURST = 40
+
+
+def photo_url(photo_reference: str, api_key: str, maxwidth: int = 400) -> str:
+    return f"{PHOTO_API_URL}?maxwidth={maxwidth}&photoreference={photo_reference}&key={api_key}"
+
+
+def make_thumbnail(data: bytes, size: int = THUMBNAIL_PIXELS) -> bytes:
+    """object-fit: cover と同じく中央で正方形に切り抜いて縮小し、JPEG にする。"""
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        thumb = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    out = io.BytesIO()
+    thumb.save(out, format="JPEG", quality=THUMBNAIL_QUALITY, optimize=True, progressive=True)
+    return out.getvalue()
+
+
+def make_session(pool_size: int = 16) -> "requests.Session":
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class PhotoThumbnailer:
+    """Places の写真をサムネイルにして返す。
+
+    接続を使い回すセッションで並列に取得し、縮小済みの JPEG を photo_reference を
+    キーにディスク上の LRU キャッシュへ保存する。取得に失敗した写真は None。
+    同じ写真の同時取得は1回にまとめ、速度制限・再試行は scheduler（sameshi.outbound）に任せる。
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        cache: Optional[CacheBackend] = None,
+        size: int = THUMBNAIL_PIXELS,
+        timeout=REQUEST_TIMEOUT,
+        max_workers: int = 8,
+        session: Optional["requests.Session"] = None,
+        scheduler: Optional[OutboundScheduler] = None,
+    ):
+        self.api_key = api_key
+        self.cache = cache
+        self.size = size
+        self.timeout = timeout
+        self.session = session or make_session(pool_size=max_workers * 2)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="sameshi-photos")
+        self.scheduler = scheduler or OutboundScheduler(
+            "photos", rate=PHOTO_RATE, burst=PHOTO_BURST, stale_entries=256
+        )
+
+    def cache_key(self, photo_reference: str) -> str:
+        return f"photo:{self.size}:{photo_reference}"
+
+    def get_thumbnail(self, photo_reference: str) -> Optional[bytes]:
+        key = self.cache_key(photo_reference)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                metrics.count("photos.cache_hit")
+                return cached
+            metrics.count("photos.cache_miss")
+        from requests import RequestException
+
+        try:
+            stale = None if self.cache is None else (lambda: self.cache.get_stale(key))
+            return self.scheduler.call(key, lambda: self._fetch(photo_reference, key), stale)
+        except (RequestException, OSError, Retryable, Throttled):
+            logger.warning("failed to fetch place photo %s", photo_reference[:16], exc_info=True)
+            metrics.count("photos.errors")
+            return None
+
+    def _fetch(self, photo_reference: str, key: str) -> bytes:
+        import requests
+
+        metrics.count("photos.requests")
+        try:
+            with metrics.span("photos.fetch"):
+                response = self.session.get(photo_url(photo_reference, self.api_key), timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise Retryable(str(e)) from e
+        if response.status_code == 429:
+            raise Throttled("photo API quota exceeded")
+        if response.status_code >= 500:
+            raise Retryable(f"photo API returned {response.status_code}")
+        if response.status_code != 200:
+            raise requests.HTTPError(f"photo API returned {response.status_code}")
+        thumbnail = make_thumbnail(response.content, self.size)
+        if self.cache is not None:
+            self.cache.set(key, thumbnail)
+        return thumbnail
+
+    def get_base64(self, photo_reference: str) -> Optional[str]:
+        thumbnail = self.get_thumbnail(photo_reference)
+        return base64.b64encode(thumbnail).decode() if thumbnail else None
+
+    @metrics.timed("photos.get_many")
+    def get_many(self, photo_references: Iterable[Optional[str]]) -> Dict[str, Optional[bytes]]:
+        """複数の写真をまとめて並列に取得する。戻り値は photo_reference → サムネイルの JPEG。"""
+        refs = list(dict.fromkeys(ref for ref in photo_references if ref))
+        futures = [metrics.submit(self._executor, self.get_thumbnail, ref) for ref in refs]
+        return {ref: future.result() for ref, future in zip(refs, futures)}
+
+    def get_many_base64(self, photo_references: Iterable[Optional[str]]) -> Dict[str, Optional[str]]:
+        """get_many と同じだが、値を base64 にして返す。"""
+        return {
+            ref: base64.b64encode(thumbnail).decode() if thumbnail else None
+            for ref, thumbnail in self.get_many(photo_references).items()
+        }
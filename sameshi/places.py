@@ -0,0 +1,175 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from sameshi import metrics
+from sameshi.cache import CacheBackend
+from sameshi.geo import GridIndex, haversine_many
+from sameshi.outbound import OutboundScheduler
+
+logger = logging.getLogger(__name__)
+
+# 徒歩圏内で探すジャンル
+KEYWORDS = ["ラーメン", "牛丼", "カレー", "ハンバーガー"]
+
+# キャッシュキーの座標の丸め桁数（小数4桁 ≒ 11m）
+LOCATION_PRECISION = 4
+
+# next_page_token が使えるようになるまでの待ち時間（秒）
+NEXT_PAGE_DELAY = 2.0
+
+# キーワード検索を並列に投げるためのスレッドプール（スレッドは最初の submit で起動する）
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sameshi-places")
+
+# Places API の呼び出し速度の上限（件/秒）と瞬間的に許す件数（クォータに合わせる）
+PLACES_RATE = 5.0
+PLACES_BURST = 20
+
+# プロセス内の全セッションで共有する。同じ検索の同時実行は1回にまとめ、
+# クォータ超過のときは同じ検索で最後に取れた結果を返す
+_scheduler = OutboundScheduler("places", rate=PLACES_RATE, burst=PLACES_BURST)
+
+
+def places_cache_key(location: Tuple[float, float], radius: int, keyword: str, language: str) -> str:
+    lat, lng = location
+    return "nearby:{:.{p}f}:{:.{p}f}:{}:{}:{}".format(
+        lat, lng, radius, keyword, language, p=LOCATION_PRECISION
+    )
+
+
+def cached_places_nearby(
+    gmaps,
+    location: Tuple[float, float],
+    radius: int,
+    keyword: str,
+    language: str = "ja",
+    cache: Optional[CacheBackend] = None,
+    max_pages: int = 1,
+    scheduler: Optional[OutboundScheduler] = None,
+) -> List[Dict]:
+    """places_nearby の results を返す。cache があれば (丸めた座標, 半径, キーワード, 言語) で引く。
+
+    max_pages > 1 なら next_page_token を辿って最大 max_pages ページ分（1ページ20件）を連結する。
+    キャッシュに無いときは scheduler（省略時はプロセス共有のもの）を通して呼ぶ。
+    """
+    key = places_cache_key(location, radius, keyword, language)
+    if max_pages > 1:
+        key += f":pages{max_pages}"
+    if cache is not None:
+        cached = cache.get_json(key)
+        if cached is not None:
+            metrics.count("places.cache_hit")
+            return cached
+        metrics.count("places.cache_miss")
+
+    def fetch() -> List[Dict]:
+        metrics.count("places.requests")
+        response = gmaps.places_nearby(
+            location=location,
+            radius=radius,
+            keyword=keyword,
+            language=language
+        )
+        results = list(response.get("results", []))
+        pages = 1
+        while response.get("next_page_token") and pages < max_pages:
+            # next_page_token は発行直後だと INVALID_REQUEST になるので少し待つ
+            time.sleep(NEXT_PAGE_DELAY)
+            metrics.count("places.requests")
+            response = gmaps.places_nearby(page_token=response["next_page_token"])
+            results.extend(response.get("results", []))
+            pages += 1
+        if cache is not None:
+            cache.set_json(key, results)
+        return results
+
+    # Google が使えないときは期限切れでも残っている前回の結果で代用する
+    stale = None if cache is None else (lambda: cache.get_stale_json(key))
+    return (scheduler or _scheduler).call(key, fetch, stale)
+
+
+@metrics.timed("places.find_nearby")
+def find_nearby_good_food(
+    gmaps,
+    lat,
+    lng,
+    radius=200,
+    cache: Optional[CacheBackend] = None,
+    max_pages: int = 1,
+    scheduler: Optional[OutboundScheduler] = None,
+    skip_errors: bool = True,
+):
+    """評価3.5以上・半径以内のお店。skip_errors=False なら検索に失敗したキーワードがあると例外にする。"""
+    # キーワードごとの検索は並列に投げ、待ち時間を一番遅い1件分に抑える
+    futures = [
+        metrics.submit(
+            _executor, cached_places_nearby, gmaps, (lat, lng), radius, keyword, "ja", cache, max_pages, scheduler
+        )
+        for keyword in KEYWORDS
+    ]
+    found_places = []
+    seen_place_ids = set()
+
+    for keyword, future in zip(KEYWORDS, futures):
+        try:
+            results = future.result()
+        except Exception as e:
+            if not skip_errors:
+                raise
+            # クォータ超過などで取れず、前回の結果も無いキーワードは飛ばしてページは出す
+            logger.warning("nearby search for %s failed: %r", keyword, e)
+            metrics.count("places.errors")
+            continue
+        if not results:
+            continue
+        distances = haversine_many(
+            lat, lng,
+            [place["geometry"]["location"]["lat"] for place in results],
+            [place["geometry"]["location"]["lng"] for place in results],
+        )
+
+        for place, distance in zip(results, distances.tolist()):
+            # 複数キーワードに引っかかった店は最初のキーワードで1回だけ出す
+            if place["place_id"] in seen_place_ids:
+                continue
+            rating = place.get("rating", 0)
+            name = place.get("name")
+            place_lat = place["geometry"]["location"]["lat"]
+            place_lng = place["geometry"]["location"]["lng"]
+            if rating >= 3.5 and distance <= radius:
+                seen_place_ids.add(place["place_id"])
+                photo_ref = None
+                if "photos" in place and place["photos"]:
+                    photo_ref = place["photos"][0]["photo_reference"]
+
+                found_places.append({
+                    "name": name,
+                    "rating": rating,
+                    "keyword": keyword,
+                    "latitude": place_lat,
+                    "longitude": place_lng,
+                    "maps_url": f"https://www.google.com/maps/place/?q=place_id:{place['place_id']}",
+                    "photo_reference": photo_ref
+                })
+    return found_places
+
+
+def cached_places(cache: CacheBackend) -> List[Dict]:
+    """キャッシュ済みの周辺検索結果に含まれる店舗（place_id で重複除去）。"""
+    places = {}
+    for _, results in cache.items_json(prefix="nearby:"):
+        for place in results:
+            places.setdefault(place["place_id"], {
+                "place_id": place["place_id"],
+                "name": place.get("name"),
+                "rating": place.get("rating", 0),
+                "latitude": place["geometry"]["location"]["lat"],
+                "longitude": place["geometry"]["location"]["lng"],
+            })
+    return list(places.values())
+
+
+def build_place_index(cache: CacheBackend, cell_size: float = 200.0) -> GridIndex:
+    """キャッシュ済みの店舗の空間インデックス（「このサウナから 200m 以内の店」などに使う）。"""
+    return GridIndex.from_records(cached_places(cache), cell_size=cell_size)
@@ -0,0 +1,239 @@
+"""シートの行を型付きのレコードに変換する（取り込み時に1回だけ）。
+
+シートの生の値（1行目がヘッダー）をスキーマに沿って解釈し、ID は int、金額は
+円単位の int、座標は float、カテゴリやタグ名は intern した str にそろえる。
+レコードは NamedTuple なので、行ごとの dict より小さく、描画時に型変換し直す必要もない。
+
+必須列が無いシートは SchemaError。必須列の値が読めない行は読み飛ばし、任意列の値が
+読めないときは空のときと同じ値（DEFAULTS）にして行は残す。どちらも件数をログに出す。
+"""
+import logging
+import math
+import sys
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaError(ValueError):
+    pass
+
+
+class Sauna(NamedTuple):
+    id: int
+    name: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+    price: int  # 入浴料（円）
+
+
+class Restaurant(NamedTuple):
+    id: int
+    sauna_id: int
+    name: str
+
+
+class MenuItem(NamedTuple):
+    id: int
+    restaurant_id: int
+    name: str
+    price: int  # 円
+    description: str = ""
+    category: str = ""  # 小文字（main / drink）
+    image_file: str = ""
+    image_url: str = ""
+    rarity: str = ""  # 小文字（n / r / sr / ssr）
+    weight: Optional[float] = None
+
+
+class Tag(NamedTuple):
+    id: int
+    name: str
+
+
+class MenuTag(NamedTuple):
+    menu_item_id: int
+    tag_id: int
+
+
+# ------------------ 値の変換 ------------------
+def _is_blank(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, float) and math.isnan(value):
+        return True
+    return isinstance(value, str) and not value.strip()
+
+
+def to_int(value: Any) -> int:
+    if isinstance(value, bool):
+        raise ValueError(f"not an integer: {value!r}")
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f"not an integer: {value!r}")
+        return int(value)
+    return int(str(value).strip())
+
+
+def to_yen(value: Any) -> int:
+    """"1,000" / "￥1,000" / "1000円" / 1000.0 → 1000"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return to_int(value)
+    text = str(value).strip().replace(",", "").replace("，", "")
+    text = text.lstrip("¥￥").rstrip("円").strip()
+    return to_int(float(text)) if "." in text else int(text)
+
+
+def to_float(value: Any) -> float:
+    number = float(str(value).strip()) if isinstance(value, str) else float(value)
+    if math.isnan(number):
+        raise ValueError("NaN")
+    return number
+
+
+def to_str(value: Any) -> str:
+    return str(value).strip()
+
+
+def to_label(value: Any) -> str:
+    """カテゴリ・レア度など、種類の少ない文字列は小文字にして intern する。"""
+    return sys.intern(str(value).strip().lower())
+
+
+def to_interned(value: Any) -> str:
+    return sys.intern(str(value).strip())
+
+
+class Column(NamedTuple):
+    field: str
+    parse: Callable[[Any], Any]
+    required: bool = True
+    # シート上の列名（normalize_header 後）。先頭から見て最初に値が入っている列を使う
+    aliases: Tuple[str, ...] = ()
+
+    @property
+    def sources(self) -> Tuple[str, ...]:
+        return self.aliases or (self.field,)
+
+
+class Schema(NamedTuple):
+    record: type
+    columns: Tuple[Column, ...]  # 並びはレコードのフィールド順と同じにする
+    # 必須列の値が空の行を、エラーとして数えずに黙って読み飛ばす（末尾の空行など）
+    skip_blank: Tuple[str, ...] = ()
+
+
+SCHEMAS: Dict[str, Schema] = {
+    "Saunas": Schema(Sauna, (
+        Column("id", to_int),
+        Column("name", to_str),
+        Column("latitude", to_float, required=False),
+        Column("longitude", to_float, required=False),
+        Column("price", to_yen, required=False, aliases=("entry_fee", "entryfee", "price")),
+    ), skip_blank=("name",)),
+    "Restaurants": Schema(Restaurant, (
+        Column("id", to_int),
+        Column("sauna_id", to_int),
+        Column("name", to_str, required=False),
+    )),
+    "Menu": Schema(MenuItem, (
+        Column("id", to_int),
+        Column("restaurant_id", to_int),
+        Column("name", to_str),
+        Column("price", to_yen),
+        Column("description", to_str, required=False),
+        Column("category", to_label, required=False),
+        Column("image_file", to_interned, required=False),
+        Column("image_url", to_str, required=False),
+        Column("rarity", to_label, required=False),
+        Column("weight", to_float, required=False),
+    )),
+    "MenuTags": Schema(Tag, (
+        Column("id", to_int),
+        Column("name", to_interned),
+    )),
+    "MenuTagRelation": Schema(MenuTag, (
+        Column("menu_item_id", to_int, aliases=("menuitemid", "menu_item_id")),
+        Column("tag_id", to_int),
+    )),
+}
+
+# 任意列が空のときの値
+DEFAULTS = {"price": 0, "latitude": None, "longitude": None, "weight": None}
+
+
+def normalize_header(header: Sequence[Any]) -> List[str]:
+    """列名をそろえる（前後の空白を除き、小文字、空白は _）。"""
+    return [str(name).strip().lower().replace(" ", "_") for name in header]
+
+
+def parse_rows(sheet_name: str, values: List[List]) -> Tuple[Tuple[NamedTuple, ...], int]:
+    """シートの生の値を (レコード, 読み飛ばした行数) にする。"""
+    schema = SCHEMAS[sheet_name]
+    if not values or not values[0]:
+        raise SchemaError(f"worksheet {sheet_name} has no header row")
+    header = normalize_header(values[0])
+    positions = {}
+    for i, name in enumerate(header):
+        positions.setdefault(name, i)
+
+    plan = []
+    for column in schema.columns:
+        indexes = [positions[name] for name in column.sources if name in positions]
+        if not indexes and column.required:
+            raise SchemaError(f"worksheet {sheet_name} is missing column {column.field!r}")
+        plan.append((column, indexes))
+
+    record_type = schema.record
+    records = []
+    skipped = 0
+    first_error = None
+    defaulted = 0
+    first_defaulted = None
+    for row_number, row in enumerate(values[1:], start=2):
+        fields = []
+        try:
+            for column, indexes in plan:
+                raw = None
+                for i in indexes:
+                    if i < len(row) and not _is_blank(row[i]):
+                        raw = row[i]
+                        break
+                if raw is None:
+                    if column.required:
+                        raise ValueError(f"{column.field} is empty")
+                    fields.append(DEFAULTS.get(column.field, ""))
+                elif column.required:
+                    fields.append(column.parse(raw))
+                else:
+                    # 任意列が読めないだけなら行は残し、空のときと同じ値にする（"1200円〜" の入浴料は 0 円）
+                    try:
+                        fields.append(column.parse(raw))
+                    except (TypeError, ValueError) as e:
+                        fields.append(DEFAULTS.get(column.field, ""))
+                        defaulted += 1
+                        if first_defaulted is None:
+                            first_defaulted = f"row {row_number}: {column.field}: {e}"
+        except (TypeError, ValueError) as e:
+            # 空行・名前の無い行は入力途中とみなして黙って飛ばす
+            if all(_is_blank(v) for v in row) or (raw is None and column.field in schema.skip_blank):
+                continue
+            skipped += 1
+            if first_error is None:
+                first_error = f"row {row_number}: {e}"
+            continue
+        records.append(record_type._make(fields))
+    if skipped:
+        logger.warning("worksheet %s: skipped %d invalid rows (first: %s)", sheet_name, skipped, first_error)
+    if defaulted:
+        logger.warning(
+            "worksheet %s: used defaults for %d unreadable optional values (first: %s)",
+            sheet_name, defaulted, first_defaulted,
+        )
+    return tuple(records), skipped
+
+
+def parse_sheets(values: Dict[str, List[List]]) -> Dict[str, Tuple[NamedTuple, ...]]:
+    return {name: parse_rows(name, rows)[0] for name, rows in values.items() if name in SCHEMAS}
@@ -0,0 +1,174 @@
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional, Sequence
+
+from sameshi import metrics
+from sameshi.cache import CacheBackend
+from sameshi.catalog import Catalog
+from sameshi.sheets import SHEET_NAMES, fetch_values, open_spreadsheet
+from sameshi.snapshot import SheetSnapshot, build_snapshot, pack_values, unpack_values, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+
+class RefreshingCatalog:
+    """stale-while-revalidate でシートの更新を取り込むカタログ。
+
+    get() は常に手元のスナップショットを即座に返す。check_interval 秒ごとに
+    Drive の modifiedTime を1回だけ確認し、変わっていればバックグラウンドで
+    全シートを取り直す。内容が変わったシートだけ型付きレコード（sameshi.records）に
+    変換し直し、新しいカタログを組み立ててから参照を丸ごと差し替える。
+
+    creds が None の場合はシートに一切アクセスしない（initial のみを配信する）。
+    persist_path を指定すると、取得したシートをローカルスナップショットとして書き出す。
+
+    shared（sameshi.cache の共有キャッシュ）を渡すと、取得したシートをそこにも置き、
+    起動時や更新時には同じ modifiedTime のものが既にあれば Google から取り直さずに使う。
+    レプリカが何台あってもシートのダウンロードは更新1回につきおおむね1回で済む。
+    """
+
+    def __init__(
+        self,
+        sheet_id: str,
+        creds,
+        check_interval: float = 60.0,
+        sheet_names: Sequence[str] = SHEET_NAMES,
+        clock: Callable[[], float] = time.monotonic,
+        initial: Optional[SheetSnapshot] = None,
+        persist_path: Optional[str] = None,
+        shared: Optional[CacheBackend] = None,
+    ):
+        self.sheet_id = sheet_id
+        self.check_interval = check_interval
+        self.sheet_names = tuple(sheet_names)
+        self._creds = creds
+        self._clock = clock
+        self._spreadsheet = None
+        # initial があればそれを即座に配信し、シートとの差分はバックグラウンドで取り込む
+        self._snapshot: Optional[SheetSnapshot] = initial
+        self.persist_path = persist_path
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_check = 0.0
+
+    @property
+    def snapshot(self) -> SheetSnapshot:
+        if self._snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    # 他のレプリカが作ったものがあればそれで起動し、更新の確認は次の間隔に回す
+                    snapshot = self._load_shared()
+                    if snapshot is None:
+                        if self.offline:
+                            raise RuntimeError("no sheet snapshot available and no credentials to load one")
+                        snapshot = self._build(self._get_modified_time(), None)
+                    self._snapshot = snapshot
+                    self._last_check = self._clock()
+        return self._snapshot
+
+    @property
+    def offline(self) -> bool:
+        return self._creds is None
+
+    def get(self) -> Catalog:
+        snapshot = self.snapshot
+        if not self.offline and self._clock() - self._last_check >= self.check_interval:
+            self.refresh_in_background()
+        return snapshot.catalog
+
+    def refresh_in_background(self) -> bool:
+        """更新確認をバックグラウンドで開始する。既に実行中なら何もしない。"""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            self._last_check = self._clock()
+        threading.Thread(target=self._refresh_worker, name="sameshi-sheet-refresh", daemon=True).start()
+        return True
+
+    def refresh(self) -> bool:
+        """同期的に更新を確認し、新しいスナップショットに差し替えたら True を返す。"""
+        current = self.snapshot
+        modified_time = self._get_modified_time()
+        self._last_check = self._clock()
+        if modified_time == current.modified_time:
+            return False
+        new = self._build(modified_time, current)
+        if new.digests == current.digests:
+            # 書式変更などで値は同じ: カタログは使い回し、確認時刻だけ進める
+            new = current._replace(modified_time=modified_time)
+            self._snapshot = new
+            return False
+        self._snapshot = new
+        return True
+
+    def _refresh_worker(self) -> None:
+        try:
+            if self.refresh():
+                logger.info("sheet snapshot refreshed: %s", self._snapshot.catalog.version)
+        except Exception:
+            # 失敗しても古いスナップショットのまま配信を続ける
+            logger.exception("sheet refresh failed; keep serving the previous snapshot")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _get_spreadsheet(self):
+        if self._spreadsheet is None:
+            self._spreadsheet = open_spreadsheet(self.sheet_id, self._creds)
+        return self._spreadsheet
+
+    def _get_modified_time(self) -> str:
+        metrics.count("drive.requests")
+        return self._get_spreadsheet().get_lastUpdateTime()
+
+    @property
+    def shared_key(self) -> str:
+        return f"snapshot:{self.sheet_id}"
+
+    def _read_shared(self):
+        """共有キャッシュの (生の値, modified_time)。無い・読めない・壊れているときは None。"""
+        if self.shared is None:
+            return None
+        try:
+            blob = self.shared.get(self.shared_key)
+            return None if blob is None else unpack_values(blob)
+        except Exception:
+            logger.warning("failed to read the shared sheet snapshot", exc_info=True)
+            return None
+
+    def _load_shared(self) -> Optional[SheetSnapshot]:
+        found = self._read_shared()
+        if found is None:
+            return None
+        values, modified_time = found
+        metrics.count("snapshot.shared_hit")
+        return build_snapshot(values, modified_time)
+
+    def _publish(self, values, modified_time: str) -> None:
+        if self.shared is None:
+            return
+        try:
+            self.shared.set(self.shared_key, pack_values(values, modified_time))
+        except Exception:
+            logger.warning("failed to publish the sheet snapshot to the shared cache", exc_info=True)
+
+    def _build(self, modified_time: str, previous: Optional[SheetSnapshot]) -> SheetSnapshot:
+        found = self._read_shared()
+        if found is not None and found[1] == modified_time:
+            # 他のレプリカが同じ版を取得済み
+            metrics.count("snapshot.shared_hit")
+            return build_snapshot(found[0], modified_time, previous)
+        values = fetch_values(self._get_spreadsheet(), self.sheet_names)
+        self._publish(values, modified_time)
+        snapshot = build_snapshot(values, modified_time, previous)
+        if self.persist_path:
+            try:
+                write_snapshot(self.persist_path, values, modified_time)
+            except (OSError, sqlite3.Error):
+                logger.exception("failed to persist sheet snapshot to %s", self.persist_path)
+        return snapshot
+
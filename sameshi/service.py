@@ -0,0 +1,222 @@
+"""カタログ・ガチャ・周辺検索をまとめた入口（Streamlit 非依存）。
+
+import しただけでは何も読み込まず、外部サービスにも接続しない。Google Maps の
+クライアントやキャッシュは最初に使うときに作る。Streamlit のページや CLI は
+SameshiService を1つ作って使い回す。
+"""
+import base64
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sameshi import metrics, places
+from sameshi.cache import CacheBackend, open_cache
+from sameshi.catalog import Catalog
+from sameshi.gacha import GachaEngine
+from sameshi.nearby import NearbyTable
+from sameshi.outbound import OutboundScheduler
+from sameshi.records import MenuItem, Sauna
+from sameshi.refresh import RefreshingCatalog
+from sameshi.sheets import SHEET_ID
+from sameshi.tags import TagFilter
+
+# Places の周辺検索・写真・シートのスナップショットのキャッシュの置き場所と保持期間。
+# cache_url（SAMESHI_CACHE_URL）を指定すればレプリカ間で共有する（sameshi.cache.open_cache）
+CACHE_DIR = ".cache"
+PLACES_CACHE_TTL = 24 * 3600
+PHOTO_CACHE_TTL = 30 * 24 * 3600
+# 期限切れ後も Google が使えないときの代わりとして残しておく期間
+PLACES_STALE_TTL = 7 * 24 * 3600
+PHOTO_STALE_TTL = 30 * 24 * 3600
+
+# シート更新の確認間隔（秒）
+SHEET_REFRESH_INTERVAL = 60
+
+# Places API 1回のタイムアウト（秒）
+GMAPS_TIMEOUT = 10
+
+# 周辺検索で辿るページ数（1ページ20件。2ページ目以降はトークン待ちで約2秒ずつ遅くなる）
+NEARBY_MAX_PAGES = 1
+
+
+def open_catalog_store(
+    sheet_id: str = SHEET_ID,
+    creds=None,
+    snapshot_path: Optional[str] = None,
+    check_interval: float = SHEET_REFRESH_INTERVAL,
+    shared: Optional[CacheBackend] = None,
+) -> RefreshingCatalog:
+    """スナップショットがあればそれを初期値にしたカタログを返す（シートはまだ読まない）。
+
+    creds が None ならシートには一切アクセスしない（shared に他のレプリカが置いたものは使う）。
+    """
+    from sameshi.snapshot import load_snapshot
+
+    initial = None
+    if snapshot_path and os.path.exists(snapshot_path):
+        initial = load_snapshot(snapshot_path)
+    return RefreshingCatalog(
+        sheet_id,
+        creds,
+        check_interval=check_interval,
+        initial=initial,
+        persist_path=snapshot_path,
+        shared=shared,
+    )
+
+
+def open_snapshot_cache(cache_url: Optional[str] = None, cache_dir: str = CACHE_DIR) -> CacheBackend:
+    """レプリカ間で共有するシートのスナップショットの置き場所（期限なし。版が変われば上書き）。"""
+    return open_cache(cache_url, "snapshots", ttl=None, max_entries=16, cache_dir=cache_dir)
+
+
+class SameshiService:
+    """1プロセスで共有するサービス。カタログの版ごとにガチャを1つ作り直す。
+
+    gmaps / photo_session を渡せば Google のクライアントの代わりに使う（ベンチマーク・テスト用）。
+    cache_url を渡すと周辺検索・写真のキャッシュを他のプロセスと共有する。
+    nearby_table（python -m sameshi.nearby refresh で作る表のパス）があれば、サウナの
+    周辺のお店はまずそこから読む。places_scheduler / photo_scheduler を渡すと Places・写真の
+    呼び出しはそれを通す（省略時は既定の速度制限のもの）。
+    """
+
+    def __init__(
+        self,
+        catalog_store: RefreshingCatalog,
+        api_key: Optional[str] = None,
+        cache_dir: str = CACHE_DIR,
+        nearby_max_pages: int = NEARBY_MAX_PAGES,
+        gmaps=None,
+        photo_session=None,
+        cache_url: Optional[str] = None,
+        nearby_table: Optional[str] = None,
+        places_scheduler: Optional[OutboundScheduler] = None,
+        photo_scheduler: Optional[OutboundScheduler] = None,
+    ):
+        self.catalog_store = catalog_store
+        self.api_key = api_key
+        self.cache_dir = cache_dir
+        self.cache_url = cache_url
+        self.nearby_table_path = nearby_table
+        self.places_scheduler = places_scheduler
+        self.photo_scheduler = photo_scheduler
+        self._nearby_table: Optional[NearbyTable] = None
+        self.nearby_max_pages = nearby_max_pages
+        self._gmaps = gmaps
+        self._photo_session = photo_session
+        self._lock = threading.Lock()
+        self._engine: Optional[GachaEngine] = None
+        self._places_cache: Optional[CacheBackend] = None
+        self._thumbnailer = None
+
+    # ------------------ カタログ・ガチャ ------------------
+    @property
+    def catalog(self) -> Catalog:
+        return self.catalog_store.get()
+
+    def gacha_engine(self, catalog: Optional[Catalog] = None) -> GachaEngine:
+        catalog = catalog or self.catalog
+        engine = self._engine
+        if engine is None or engine.version != catalog.version:
+            with self._lock:
+                engine = self._engine
+                if engine is None or engine.version != catalog.version:
+                    engine = self._engine = GachaEngine(catalog)
+        return engine
+
+    def pull_gacha(
+        self,
+        sauna_id,
+        catalog: Optional[Catalog] = None,
+        tag_filter: Optional[TagFilter] = None,
+        budget: Optional[int] = None,
+    ) -> List[MenuItem]:
+        """budget（円・入浴料込み）に収まる組み合わせが無ければ空のリスト。"""
+        return self.gacha_engine(catalog).pull(sauna_id, tag_filter=tag_filter, budget=budget)
+
+    # ------------------ 周辺検索 ------------------
+    @property
+    def gmaps(self):
+        if self._gmaps is None:
+            import googlemaps
+
+            with self._lock:
+                if self._gmaps is None:
+                    # クォータ超過・5xx の再試行は sameshi.outbound に任せる（クライアント内では待たない）
+                    self._gmaps = googlemaps.Client(
+                        key=self.api_key, timeout=GMAPS_TIMEOUT, retry_timeout=1, retry_over_query_limit=False
+                    )
+        return self._gmaps
+
+    @property
+    def places_cache(self) -> CacheBackend:
+        if self._places_cache is None:
+            with self._lock:
+                if self._places_cache is None:
+                    self._places_cache = open_cache(
+                        self.cache_url, "places", ttl=PLACES_CACHE_TTL, max_entries=5000, cache_dir=self.cache_dir,
+                        stale_ttl=PLACES_STALE_TTL,
+                    )
+        return self._places_cache
+
+    def find_nearby_good_food(self, lat, lng, radius: int = 200, skip_errors: bool = True) -> List[Dict]:
+        return places.find_nearby_good_food(
+            self.gmaps, lat, lng, radius=radius, cache=self.places_cache, max_pages=self.nearby_max_pages,
+            scheduler=self.places_scheduler, skip_errors=skip_errors,
+        )
+
+    @property
+    def nearby_table(self) -> Optional[NearbyTable]:
+        """事前計算の表（ファイルがまだ無ければ None。できた後の呼び出しで開く）。"""
+        if self._nearby_table is None and self.nearby_table_path and os.path.exists(self.nearby_table_path):
+            with self._lock:
+                if self._nearby_table is None:
+                    self._nearby_table = NearbyTable(self.nearby_table_path, readonly=True)
+        return self._nearby_table
+
+    def nearby_for_sauna(
+        self, sauna: Sauna, radius: int = 200, photos: bool = True
+    ) -> Tuple[List[Dict], Dict[str, Optional[str]]]:
+        """(店舗, photo_reference → base64)。事前計算の表にあればそれだけで返し、Google は呼ばない。
+
+        表に無い・座標が変わったサウナはその場で検索する。photos=False なら写真は取らない。
+        """
+        table = self.nearby_table
+        entry = table.lookup(sauna, radius) if table is not None else None
+        if entry is not None:
+            metrics.count("nearby.table_hit")
+            if not photos:
+                return entry.stores, {}
+            thumbnails = table.thumbnails(store.get("photo_reference") for store in entry.stores)
+            photos = {ref: base64.b64encode(jpeg).decode() for ref, jpeg in thumbnails.items()}
+            return entry.stores, photos
+        metrics.count("nearby.table_miss")
+        if sauna.latitude is None or sauna.longitude is None:
+            return [], {}
+        stores = self.find_nearby_good_food(sauna.latitude, sauna.longitude, radius=radius)
+        if not photos:
+            return stores, {}
+        return stores, self.get_photos_base64(store.get("photo_reference") for store in stores)
+
+    # ------------------ 写真 ------------------
+    @property
+    def thumbnailer(self):
+        if self._thumbnailer is None:
+            from sameshi.photos import PhotoThumbnailer
+
+            with self._lock:
+                if self._thumbnailer is None:
+                    cache = open_cache(
+                        self.cache_url, "photos", ttl=PHOTO_CACHE_TTL, max_entries=2000, cache_dir=self.cache_dir,
+                        stale_ttl=PHOTO_STALE_TTL,
+                    )
+                    self._thumbnailer = PhotoThumbnailer(
+                        self.api_key, cache=cache, session=self._photo_session, scheduler=self.photo_scheduler
+                    )
+        return self._thumbnailer
+
+    def get_photo_base64(self, photo_reference: str) -> Optional[str]:
+        return self.thumbnailer.get_base64(photo_reference)
+
+    def get_photos_base64(self, photo_references: Iterable[Optional[str]]) -> Dict[str, Optional[str]]:
+        return self.thumbnailer.get_many_base64(photo_references)
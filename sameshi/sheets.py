@@ -0,0 +1,51 @@
+"""Google Sheets の読み込み。gspread は実際に読み込むときに import する。"""
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence
+
+from sameshi import metrics
+
+if TYPE_CHECKING:
+    import gspread
+
+# --- スプレッドシートID ---
+SHEET_ID = "1c1WDtrWXvDyTVis_1wzyVzkWf2Hq7SxRKuGkrdN3K4M"
+
+# --- 読み込むワークシート ---
+SHEET_NAMES = ("Saunas", "Restaurants", "Menu", "MenuTags", "MenuTagRelation")
+
+SCOPES = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
+
+
+def service_account_credentials(info: Optional[Dict] = None, keyfile: Optional[str] = None):
+    """サービスアカウントの認証情報（info は JSON キーの中身、keyfile はそのファイル）。"""
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    if info is not None:
+        return ServiceAccountCredentials.from_json_keyfile_dict(info, SCOPES)
+    return ServiceAccountCredentials.from_json_keyfile_name(keyfile, SCOPES)
+
+
+def open_spreadsheet(sheet_id: str, creds) -> "gspread.Spreadsheet":
+    import gspread
+
+    client = gspread.authorize(creds)
+    return client.open_by_key(sheet_id)
+
+
+def fetch_values(
+    spreadsheet: "gspread.Spreadsheet",
+    sheet_names: Sequence[str] = SHEET_NAMES,
+) -> Dict[str, List[List]]:
+    """指定したワークシートの生の値を values:batchGet の1リクエストでまとめて取得する。"""
+    from gspread.utils import absolute_range_name
+
+    if not sheet_names:
+        return {}
+    metrics.count("sheets.requests")
+    with metrics.span("sheets.fetch"):
+        response = spreadsheet.values_batch_get([absolute_range_name(name) for name in sheet_names])
+    value_ranges = response.get("valueRanges", [])
+    return {
+        name: value_range.get("values", [])
+        for name, value_range in zip(sheet_names, value_ranges)
+    }
+
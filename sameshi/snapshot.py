@@ -0,0 +1,211 @@
+"""ワークシートのローカルスナップショット（SQLite）。
+
+Google Sheets に触れずに起動するための書き出し・読み込み。シートの生の値を
+そのまま保存し、読み込み時はライブ取得と同じ変換（sameshi.records）を通すので、
+スナップショット由来のカタログとシート由来のカタログは同じ version になる。
+
+    python -m sameshi.snapshot export snapshot.sqlite --credentials credentials.json
+    python -m sameshi.snapshot info snapshot.sqlite
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sameshi.catalog import Catalog
+from sameshi.records import parse_rows
+from sameshi.sheets import (
+    SHEET_ID,
+    SHEET_NAMES,
+    fetch_values,
+    open_spreadsheet,
+    service_account_credentials,
+)
+
+# スナップショットの形式を変えたら上げる
+SCHEMA_VERSION = 1
+
+
+class SheetSnapshot(NamedTuple):
+    modified_time: str
+    digests: Dict[str, str]
+    tables: Dict[str, Sequence]  # シート名 → 型付きレコード
+    catalog: Catalog
+
+
+def values_digest(values: List[List]) -> str:
+    payload = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def snapshot_version(digests: Dict[str, str]) -> str:
+    joined = "|".join(f"{name}:{digests[name]}" for name in sorted(digests))
+    return hashlib.sha1(joined.encode("utf-8")).hexdigest()[:16]
+
+
+def build_snapshot(
+    values: Dict[str, List[List]],
+    modified_time: str,
+    previous: Optional[SheetSnapshot] = None,
+) -> SheetSnapshot:
+    """生の値からスナップショットを作る。previous と内容が同じシートはレコードを使い回す。"""
+    digests = {name: values_digest(rows) for name, rows in values.items()}
+    tables = {}
+    for name, rows in values.items():
+        if previous is not None and previous.digests.get(name) == digests[name]:
+            tables[name] = previous.tables[name]
+        else:
+            tables[name], _ = parse_rows(name, rows)
+    catalog = Catalog.from_tables(tables, version=snapshot_version(digests))
+    return SheetSnapshot(modified_time, digests, tables, catalog)
+
+
+# ------------------ 書き出し ------------------
+def write_snapshot(path: str, values: Dict[str, List[List]], modified_time: str = "") -> None:
+    """一時ファイルに書いてから置き換えるので、読み手が書きかけを掴むことはない。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", suffix=".sqlite", dir=directory)
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+                CREATE TABLE sheets (
+                    name TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    row_count INTEGER NOT NULL,
+                    payload BLOB NOT NULL
+                );
+                """
+            )
+            conn.executemany(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                [
+                    ("schema_version", str(SCHEMA_VERSION)),
+                    ("modified_time", modified_time),
+                    ("exported_at", str(int(time.time()))),
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO sheets (name, digest, row_count, payload) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        name,
+                        values_digest(rows),
+                        max(len(rows) - 1, 0),
+                        zlib.compress(json.dumps(rows, ensure_ascii=False).encode("utf-8")),
+                    )
+                    for name, rows in values.items()
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+# ------------------ 読み込み ------------------
+def read_snapshot_values(path: str) -> Tuple[Dict[str, List[List]], Dict[str, str]]:
+    """(シート名 → 生の値, メタ情報) を返す。スキーマが違えば ValueError。"""
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    conn = sqlite3.connect(f"file:{os.path.abspath(path)}?mode=ro", uri=True)
+    try:
+        conn.execute("PRAGMA mmap_size = 268435456")
+        meta = dict(conn.execute("SELECT key, value FROM meta"))
+        if meta.get("schema_version") != str(SCHEMA_VERSION):
+            raise ValueError(
+                f"snapshot schema version {meta.get('schema_version')} is not supported "
+                f"(expected {SCHEMA_VERSION}): {path}"
+            )
+        values = {
+            name: json.loads(zlib.decompress(payload).decode("utf-8"))
+            for name, payload in conn.execute("SELECT name, payload FROM sheets")
+        }
+    finally:
+        conn.close()
+    missing = [name for name in SHEET_NAMES if name not in values]
+    if missing:
+        raise ValueError(f"snapshot is missing worksheets {missing}: {path}")
+    return values, meta
+
+
+# ------------------ 共有キャッシュ用 ------------------
+def pack_values(values: Dict[str, List[List]], modified_time: str = "") -> bytes:
+    """生の値を共有キャッシュ（sameshi.cache）に置く1つの bytes にする。"""
+    payload = {"schema_version": SCHEMA_VERSION, "modified_time": modified_time, "values": values}
+    return zlib.compress(json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack_values(blob: bytes) -> Tuple[Dict[str, List[List]], str]:
+    """pack_values の逆。(シート名 → 生の値, modified_time) を返す。形式が違えば ValueError。"""
+    try:
+        payload = json.loads(zlib.decompress(blob).decode("utf-8"))
+    except (zlib.error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError(f"broken snapshot blob: {e}") from None
+    if payload.get("schema_version") != SCHEMA_VERSION:
+        raise ValueError(f"snapshot schema version {payload.get('schema_version')} is not supported")
+    values = payload["values"]
+    missing = [name for name in SHEET_NAMES if name not in values]
+    if missing:
+        raise ValueError(f"snapshot blob is missing worksheets {missing}")
+    return values, payload.get("modified_time", "")
+
+
+def load_snapshot(path: str) -> SheetSnapshot:
+    values, meta = read_snapshot_values(path)
+    return build_snapshot(values, meta.get("modified_time", ""))
+
+
+def export_snapshot(sheet_id: str, creds, path: str) -> SheetSnapshot:
+    spreadsheet = open_spreadsheet(sheet_id, creds)
+    modified_time = spreadsheet.get_lastUpdateTime()
+    values = fetch_values(spreadsheet, SHEET_NAMES)
+    write_snapshot(path, values, modified_time)
+    return build_snapshot(values, modified_time)
+
+
+# ------------------ CLI ------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m sameshi.snapshot", description="ワークシートのローカルスナップショット")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="Google Sheets から書き出す")
+    export.add_argument("path")
+    export.add_argument("--credentials", default="credentials.json", help="サービスアカウントの JSON キー")
+    export.add_argument("--sheet-id", default=SHEET_ID)
+
+    info = sub.add_parser("info", help="スナップショットの中身を表示する")
+    info.add_argument("path")
+
+    args = parser.parse_args(argv)
+    if args.command == "export":
+        creds = service_account_credentials(keyfile=args.credentials)
+        snapshot = export_snapshot(args.sheet_id, creds, args.path)
+        print(f"exported {args.path} (version {snapshot.catalog.version}, modified {snapshot.modified_time})")
+    else:
+        values, meta = read_snapshot_values(args.path)
+        snapshot = build_snapshot(values, meta.get("modified_time", ""))
+        print(f"schema_version: {meta['schema_version']}")
+        print(f"modified_time:  {meta.get('modified_time', '')}")
+        print(f"version:        {snapshot.catalog.version}")
+        for name in SHEET_NAMES:
+            print(f"  {name}: {max(len(values[name]) - 1, 0)} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
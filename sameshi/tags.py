@@ -0,0 +1,196 @@
+"""タグの転置インデックスと、タグでの絞り込み（AND / OR / NOT）。
+
+MenuTags・MenuTagRelation シートから「タグ → メニュー」のビット集合（Python の int）を
+カタログ1版ごとに1回だけ作る。メニューのビット位置はサウナごとに連続するよう
+割り当ててあるので、あるサウナの候補との積はシフトとマスクだけで求まり、
+結果のビットはそのまま get_all_menu_items_for_sauna の並びの添字になる。
+
+絞り込みの書き方（区切りは空白かカンマ。先頭の # は無視）:
+
+    辛い ご当地        辛い AND ご当地
+    ご当地|限定        ご当地 OR 限定
+    -甘い / !甘い      NOT 甘い
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from sameshi.records import MenuItem
+
+if TYPE_CHECKING:
+    from sameshi.catalog import Catalog
+
+# 組み立て済みのビット集合を覚えておく絞り込み条件の数と、(サウナ, 条件) の組の数
+MASK_CACHE_SIZE = 256
+SAUNA_MASK_CACHE_SIZE = 4096
+
+_SEPARATORS = re.compile(r"[\s,、]+")
+
+
+class TagFilter(NamedTuple):
+    """clauses の各組（OR）をすべて満たし、excluded のどれも持たないメニュー。"""
+
+    clauses: Tuple[FrozenSet[str], ...] = ()
+    excluded: FrozenSet[str] = frozenset()
+
+    def __bool__(self) -> bool:
+        return bool(self.clauses or self.excluded)
+
+    @classmethod
+    def all_of(cls, names: Iterable[str]) -> "TagFilter":
+        return cls(tuple(frozenset([_clean(n)]) for n in names if _clean(n)))
+
+    def __str__(self) -> str:
+        terms = ["|".join(sorted(clause)) for clause in self.clauses]
+        terms += [f"-{name}" for name in sorted(self.excluded)]
+        return " ".join(terms)
+
+
+def _clean(name: str) -> str:
+    return name.strip().lstrip("#＃").strip()
+
+
+def parse_tag_filter(text: Optional[str]) -> TagFilter:
+    """"辛い ご当地|限定 -甘い" → 辛い AND (ご当地 OR 限定) AND NOT 甘い。"""
+    clauses = []
+    excluded = set()
+    for term in _SEPARATORS.split(text or ""):
+        if not term:
+            continue
+        if term[0] in "-!":
+            name = _clean(term[1:])
+            if name:
+                excluded.add(name)
+            continue
+        names = frozenset(_clean(n) for n in term.split("|") if _clean(n))
+        if names:
+            clauses.append(names)
+    # 同じ組が重複していても結果は同じなので、キャッシュのキーがぶれないよう正規化する
+    return TagFilter(tuple(sorted(set(clauses), key=sorted)), frozenset(excluded))
+
+
+class TagIndex:
+    """タグ名 → メニューのビット集合。カタログ1版ごとに作り、以降は読み取り専用。"""
+
+    def __init__(self, catalog: "Catalog"):
+        self.catalog = catalog
+        # ビット位置: サウナごとに get_all_menu_items_for_sauna の並びで連続させる
+        # （同じ店が複数のサウナに載っていれば、そのメニューは複数の位置を持つ）
+        self.ranges: Dict[int, Tuple[int, int]] = {}
+        positions: Dict[int, List[int]] = {}
+        items: List[MenuItem] = []
+        for sauna in catalog.saunas:
+            if sauna.id in self.ranges:
+                continue
+            start = len(items)
+            for item in catalog.get_all_menu_items_for_sauna(sauna.id):
+                positions.setdefault(item.id, []).append(len(items))
+                items.append(item)
+            self.ranges[sauna.id] = (start, len(items))
+        for item in catalog.menu_items:
+            if item.id not in positions:
+                positions[item.id] = [len(items)]
+                items.append(item)
+        self.items: Tuple[MenuItem, ...] = tuple(items)
+        self.size = len(items)
+        # メニュー ID → 代表のビット位置（複数あってもタグは同じなので1つで足りる）
+        self.positions: Dict[int, int] = {item_id: found[0] for item_id, found in positions.items()}
+
+        # ビット集合はバイト列で立ててから int にする（int のまま1ビットずつ立てると O(n^2)）
+        tag_name = {}
+        for t in catalog.tags:
+            tag_name.setdefault(t.id, t.name)
+        nbytes = (self.size + 7) // 8
+        buffers: Dict[str, bytearray] = {}
+        for rel in catalog.menu_item_tags:
+            name = tag_name.get(rel.tag_id)
+            if name is None:
+                continue
+            buffer = buffers.get(name)
+            if buffer is None:
+                buffer = buffers[name] = bytearray(nbytes)
+            for pos in positions.get(rel.menu_item_id, ()):
+                buffer[pos >> 3] |= 1 << (pos & 7)
+        self.postings: Dict[str, int] = {name: int.from_bytes(buffer, "little") for name, buffer in buffers.items()}
+        self._masks: "OrderedDict[TagFilter, int]" = OrderedDict()
+        self._sauna_masks: "OrderedDict[Tuple[int, TagFilter], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def tag_names(self) -> List[str]:
+        """メニューが1つ以上あるタグ（MenuTags シートの並び順）。"""
+        return list(dict.fromkeys(t.name for t in self.catalog.tags if self.postings.get(t.name)))
+
+    def mask(self, tag_filter: TagFilter) -> int:
+        """条件を満たすメニュー全体のビット集合（条件ごとにキャッシュする）。"""
+        with self._lock:
+            bits = self._masks.get(tag_filter)
+            if bits is not None:
+                self._masks.move_to_end(tag_filter)
+                return bits
+        bits = (1 << self.size) - 1
+        for clause in tag_filter.clauses:
+            any_bits = 0
+            for name in clause:
+                any_bits |= self.postings.get(name, 0)
+            bits &= any_bits
+            if not bits:
+                break
+        for name in tag_filter.excluded:
+            bits &= ~self.postings.get(name, 0)
+        with self._lock:
+            self._masks[tag_filter] = bits
+            while len(self._masks) > MASK_CACHE_SIZE:
+                self._masks.popitem(last=False)
+        return bits
+
+    def sauna_mask(self, sauna_id: int, tag_filter: TagFilter) -> int:
+        """そのサウナの候補のうち条件を満たすもの（ビット i = 候補の i 番目）。
+
+        全体のビット集合のシフトはカタログの大きさに比例するので、(サウナ, 条件) ごとにキャッシュする。
+        """
+        start, end = self.ranges.get(sauna_id, (0, 0))
+        if start == end:
+            return 0
+        key = (sauna_id, tag_filter)
+        with self._lock:
+            bits = self._sauna_masks.get(key)
+            if bits is not None:
+                self._sauna_masks.move_to_end(key)
+                return bits
+        bits = (self.mask(tag_filter) >> start) & ((1 << (end - start)) - 1)
+        with self._lock:
+            self._sauna_masks[key] = bits
+            while len(self._sauna_masks) > SAUNA_MASK_CACHE_SIZE:
+                self._sauna_masks.popitem(last=False)
+        return bits
+
+    def filter_sauna(self, sauna_id: int, tag_filter: TagFilter) -> List[MenuItem]:
+        start, _ = self.ranges.get(sauna_id, (0, 0))
+        return [self.items[start + i] for i in iter_bits(self.sauna_mask(sauna_id, tag_filter))]
+
+    def filter_items(self, menu_items: Sequence[MenuItem], tag_filter: TagFilter) -> List[MenuItem]:
+        """任意のメニューの並びを絞り込む（サウナ単位でないとき用。各メニューのビットを見るだけ）。"""
+        if not tag_filter:
+            return list(menu_items)
+        bits = self.mask(tag_filter)
+        # カタログに無いメニューはタグ無しと同じ扱い（除外だけの条件なら残る）
+        untagged = not tag_filter.clauses
+        kept = []
+        for item in menu_items:
+            pos = self.positions.get(item.id)
+            if pos is None:
+                if untagged:
+                    kept.append(item)
+            elif bits & (1 << pos):
+                kept.append(item)
+        return kept
+
+
+def iter_bits(bits: int) -> Iterable[int]:
+    """立っているビットの位置を小さい順に返す。"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
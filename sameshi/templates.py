@@ -0,0 +1,386 @@
+"""ページの HTML テンプレート（Streamlit 非依存）。
+
+テンプレートは import 時に1回だけ組み立て（CSS はコメントと空白を詰める）、
+結果の各セクションは1回の呼び出しで1つの HTML 文字列にする。ページ側は
+セクションごとに st.markdown を1回だけ呼べばよい。
+
+シート・Places 由来の文字列（メニュー名・店名・説明・タグ・URL）はすべてエスケープする。
+"""
+import re
+from functools import lru_cache
+from html import escape
+from string import Template
+from typing import Callable, Dict, Iterable, Optional, Sequence
+
+from sameshi.records import MenuItem, Sauna
+
+CATEGORY_ICONS = {
+    "main": "🍽️",
+    "drink": "🍺",
+}
+
+KEYWORD_EMOJIS = {
+    "ラーメン": "🍜",
+    "カレー": "🍛",
+    "牛丼": "🥩",
+    "ハンバーガー": "🍔",
+}
+
+# ガチャ結果は1品ずつ少し遅らせて表示する（秒）
+REVEAL_DELAY = 0.3
+
+_CSS_SOURCE = """
+    /* 全体のベースカラーをダーク系 */
+    .main {
+        background-color: #1e1e2d;
+        color: #e8d0a9;
+        font-family: 'Noto Sans JP', sans-serif;
+        padding: 0;
+        max-width: 100%;
+    }
+
+    /* ヘッダー部分: 赤茶色系 */
+    .passport-header {
+        background-color: #7d2a14;
+        color: #e8d0a9;
+        padding: 30px 20px;
+        text-align: center;
+        border-radius: 0;
+        margin-top: -80px;
+        margin-left: -80px;
+        margin-right: -80px;
+        position: relative;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.3);
+    }
+
+    /* タイトル(セリフ書体) */
+    .passport-title {
+        font-family: "Hiragino Mincho ProN", "Times New Roman", serif;
+        font-size: 42px;
+        font-weight: bold;
+        margin-bottom: 20px;
+        letter-spacing: 2px;
+        color: #e8d0a9;
+    }
+
+    /* SAMESHI PASSPORT: 枠線付き、セリフ系 */
+    .passport-en-title {
+        font-family: "Times New Roman", serif;
+        font-size: 20px;
+        letter-spacing: 2px;
+        display: inline-block;
+        padding: 5px 10px;
+        border: 1px solid #e8d0a9;
+        margin-top: 10px;
+        color: #e8d0a9;
+    }
+
+    /* ロゴセンタリング */
+    .centered-icon {
+        display: block;
+        margin: 0 auto 20px auto;
+        text-align: center;
+    }
+
+    /* セレクトボックスのラベル */
+    .selection-label {
+        font-size: 20px;
+        margin-bottom: 10px;
+        color: #e8d0a9;
+    }
+
+    /* セレクトボックス */
+    .stSelectbox > div > div {
+        background-color: #272731;
+        color: #e8d0a9;
+        border: 1px solid #e8d0a9;
+        border-radius: 0;
+        padding: 12px 14px;
+        font-size: 17px;
+        line-height: 1.8;
+        height: auto !important;
+        overflow: visible !important;
+        display: flex;
+        align-items: center;
+    }
+
+    /* ボタン(角丸なし、中央配置はHTML側でdiv包む) */
+    .stButton > button {
+        background-color: #7d2a14 !important;
+        color: #e8d0a9 !important;
+        font-weight: bold;
+        padding: 12px 40px;
+        border-radius: 0 !important;
+        border: none !important;
+        font-size: 18px !important;
+        margin-top: 15px;
+        transition: all 0.3s;
+    }
+    .stButton > button:hover {
+        background-color: #9e3418 !important;
+        box-shadow: 0 0 8px rgba(158, 52, 24, 0.3);
+    }
+
+    /* カード全体のスタイル */
+    .result-card {
+        background-color: #272731;
+        border: 1px solid #e8d0a9;
+        border-radius: 10px;
+        padding: 20px;
+        margin: 20px 0;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.2);
+    }
+
+    /* カードの中身（左に文字、右に写真） */
+    .card-body {
+        display: flex;
+        align-items: flex-start;
+        justify-content: space-between;
+    }
+    .card-text {
+        flex: 1;
+    }
+    .card-image {
+        width: 150px;
+        height: 150px;
+        object-fit: cover;
+        border-radius: 8px;
+        margin-left: 20px;
+    }
+    .card-image-empty {
+        background: #444;
+    }
+    .maps-link {
+        color: #e8d0a9;
+    }
+    .section-title {
+        color: #e8d0a9;
+        text-align: center;
+        margin-bottom: 20px;
+    }
+    .price-summary h3 {
+        color: #e8d0a9;
+        margin-bottom: 15px;
+    }
+    .price-summary p {
+        color: #e8d0a9;
+        font-size: 16px;
+    }
+    .price-summary .total {
+        font-size: 20px;
+        font-weight: bold;
+        margin-top: 10px;
+    }
+
+    /* メニュー名スタイル */
+    .menu-name {
+        font-size: 22px;
+        font-weight: bold;
+        color: #e8d0a9;
+        margin-top: 10px;
+    }
+
+    /* 料金スタイル */
+    .price {
+        font-size: 18px;
+        color: #e8d0a9;
+        margin-top: 5px;
+    }
+
+    /* 説明文スタイル */
+    .description {
+        font-size: 16px;
+        color: #e8d0a9;
+        margin-top: 10px;
+    }
+
+    /* タグスタイル */
+    .tags {
+        margin-top: 12px;
+        color: #7d2a14;
+    }
+
+    .tag {
+        background-color: #e8d0a9;
+        color: #7d2a14;
+        padding: 5px 10px;
+        border-radius: 20px;
+        display: inline-block;
+        margin-right: 5px;
+        font-size: 14px;
+        font-weight: bold;
+    }
+
+    /* セパレーター */
+    .separator {
+        border-top: 1px solid #e8d0a9;
+        margin: 30px 0;
+    }
+
+    /* フッタースタイル */
+    .footer {
+        text-align: center;
+        margin-top: 50px;
+        color: #aaaa99;
+        font-size: 14px;
+    }
+
+    /* 金額表示スタイル */
+    .price-summary {
+        background-color: #272731;
+        border: 1px solid #e8d0a9;
+        border-radius: 10px;
+        padding: 20px;
+        margin-top: 20px;
+    }
+
+    /* スタンプ風透かし: */
+    .stamp-watermark {
+        position: fixed;
+        bottom: -100px;
+        right: -100px;
+        transform: rotate(-10deg);
+        width: 400px;
+        height: 400px;
+        opacity: 0.05;
+        z-index: 0;
+    }
+
+    /* ガチャ結果の演出（サーバー側では待たず、ブラウザでアニメーションさせる） */
+    .gacha-card {
+        animation: gacha-reveal 0.6s ease-out both;
+    }
+    @keyframes gacha-reveal {
+        from {
+            opacity: 0;
+            transform: translateY(12px) scale(0.97);
+        }
+        to {
+            opacity: 1;
+            transform: none;
+        }
+    }
+
+    /* Made with Streamlitのフッター非表示 */
+    footer {
+        visibility: hidden;
+    }
+"""
+
+
+def minify_css(css: str) -> str:
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+
+
+PAGE_CSS = f"<style>{minify_css(_CSS_SOURCE)}</style>"
+
+# HTML ブロックの途中に空行があると Markdown として解釈されてしまうので、テンプレートは1行で書く
+HEADER = Template(
+    '<div class="stamp-watermark"><img src="$watermark_src" width="400" height="400" alt="スタンプ" /></div>'
+    '<div class="passport-header"><h1 class="passport-title">サ飯パスポート</h1>'
+    '<div class="centered-icon"><img src="$logo_src" width="195" height="195" alt="サ飯パスポートロゴ" /></div>'
+    '<div class="passport-en-title">SAMESHI PASSPORT</div></div>'
+    '<div style="height: 20px;"></div>'
+    '<p class="selection-label">サウナ施設を選ぶ</p>'
+)
+
+MENU_CARD = Template(
+    '<div class="result-card gacha-card" style="animation-delay: ${delay}s;"><div class="card-body"><div class="card-text">'
+    '<p class="menu-name">$icon $name</p><p class="price">￥$price</p>'
+    '<p class="description">$description</p><div class="tags">$tags</div>'
+    '</div>$image</div></div>'
+)
+
+TAG = Template('<span class="tag">#$name</span>')
+
+PRICE_SUMMARY = Template(
+    '<div class="price-summary"><h3>💰 合計金額</h3>'
+    '<p>サウナ入浴料: ￥$sauna_fee</p>'
+    '<p>サウナ飯（${count}品合計）: ￥$food_total</p>'
+    '<p class="total">合計: ￥$total</p></div>'
+)
+
+NEARBY_CARD = Template(
+    '<div class="result-card"><div class="card-body"><div class="card-text">'
+    '<p class="menu-name">$emoji $name（$keyword）</p><p class="price">評価: $rating $stars</p>'
+    '<a href="$maps_url" target="_blank" rel="noopener" class="maps-link">Googleマップで見る</a>'
+    '</div>$image</div></div>'
+)
+
+IMAGE = Template('<img class="card-image" src="$src" alt="" />')
+EMPTY_IMAGE = '<div class="card-image card-image-empty"></div>'
+
+GACHA_TITLE = '<div class="separator"></div><h2 class="section-title">サ飯ガチャ 結果</h2>'
+NEARBY_TITLE = '<h2 class="section-title">徒歩圏内の高評価なサ飯処</h2>'
+NO_NEARBY = "😢 該当エリアに評価3.5以上のお店が見つかりませんでした。"
+
+FOOTER = (
+    '<div class="footer"><p>このサイトは、有志により開発された非公式ファンサイトです。'
+    '<br>メニューは実際の取扱と異なることがあります。</p></div>'
+)
+
+
+def text(value) -> str:
+    """本文用のエスケープ。改行は <br> にする（空行で HTML ブロックが途切れないように）。"""
+    return escape(str(value)).replace("\r\n", "\n").replace("\n", "<br>")
+
+
+@lru_cache(maxsize=4)
+def page_header(logo_src: str, watermark_src: str) -> str:
+    """CSS・透かし・ヘッダー・サウナ選択の見出しをまとめた HTML（ロゴの URL ごとに1回だけ作る）。"""
+    return PAGE_CSS + HEADER.substitute(
+        logo_src=escape(logo_src), watermark_src=escape(watermark_src)
+    )
+
+
+def image_html(src: Optional[str], placeholder: bool = False) -> str:
+    if src:
+        return IMAGE.substitute(src=escape(src))
+    return EMPTY_IMAGE if placeholder else ""
+
+
+def gacha_results(
+    menus: Sequence[MenuItem],
+    sauna: Sauna,
+    tags_of: Callable[[int], Iterable[str]],
+    image_of: Callable[[str], Optional[str]],
+) -> str:
+    """ガチャ結果のセクション全体（見出し・カード・合計金額）。"""
+    parts = [GACHA_TITLE]
+    for i, menu in enumerate(menus):
+        parts.append(MENU_CARD.substitute(
+            delay=f"{i * REVEAL_DELAY:.1f}",
+            icon=CATEGORY_ICONS.get(menu.category, "🍽️"),
+            name=text(menu.name),
+            price=menu.price,
+            description=text(menu.description),
+            tags="".join(TAG.substitute(name=text(t)) for t in tags_of(menu.id)),
+            image=image_html(image_of(menu.image_file)),
+        ))
+    food_total = sum(menu.price for menu in menus)
+    parts.append(PRICE_SUMMARY.substitute(
+        sauna_fee=sauna.price,
+        count=len(menus),
+        food_total=food_total,
+        total=sauna.price + food_total,
+    ))
+    return "".join(parts)
+
+
+def nearby_cards(stores: Sequence[Dict], photos_base64: Dict[str, Optional[str]]) -> str:
+    """徒歩圏内のお店のカードをまとめた HTML。写真がない店は灰色の枠を出す。"""
+    parts = []
+    for store in stores:
+        photo = photos_base64.get(store.get("photo_reference"))
+        parts.append(NEARBY_CARD.substitute(
+            emoji=KEYWORD_EMOJIS.get(store["keyword"], "🍴"),
+            name=text(store["name"]),
+            keyword=text(store["keyword"]),
+            rating=text(store["rating"]),
+            stars="⭐" * int(round(store["rating"])),
+            maps_url=escape(store["maps_url"]),
+            image=image_html(f"data:image/jpeg;base64,{photo}" if photo else None, placeholder=True),
+        ))
+    return "".join(parts)
@@ -1,33 +1,21 @@
 import streamlit as st
+import os
 import random
-import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-
-# --- 認証 ---
-scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
-creds = ServiceAccountCredentials.from_json_keyfile_name('credentials.json', scope)
-
-# --- 共通読み込み関数 ---
-def load_sheet_as_df(sheet_id: str, sheet_name: str, creds) -> pd.DataFrame:
-    client = gspread.authorize(creds)
-    sheet = client.open_by_key(sheet_id).worksheet(sheet_name)
-    records = sheet.get_all_records()
-    return pd.DataFrame(records)
-
-# --- スプレッドシートID ---
-SHEET_ID = "1c1WDtrWXvDyTVis_1wzyVzkWf2Hq7SxRKuGkrdN3K4M"
-
-# --- 各シートを読み込む ---
-saunas_df = load_sheet_as_df(SHEET_ID, "Saunas", creds)
-restaurants_df = load_sheet_as_df(SHEET_ID, "Restaurants", creds)
-menu_items_df = load_sheet_as_df(SHEET_ID, "Menu", creds)
-tags_df = load_sheet_as_df(SHEET_ID, "MenuTags", creds)
-menu_item_tags_df = load_sheet_as_df(SHEET_ID, "MenuTagRelation", creds)
-
-# --- カラム名を小文字に統一（安全処理） ---
-for df in [saunas_df, restaurants_df, menu_items_df, tags_df, menu_item_tags_df]:
-    df.columns = df.columns.astype(str).str.strip().str.lower()
+from sameshi.service import open_catalog_store
+from sameshi.sheets import SHEET_ID, service_account_credentials
+
+# --- カタログを読み込む（sameshi パッケージの薄いフロントエンド） ---
+# SAMESHI_SNAPSHOT があればローカルスナップショットから、なければ1回の認証・1リクエストで取得
+SNAPSHOT_PATH = os.getenv("SAMESHI_SNAPSHOT")
+
+@st.cache_resource
+def get_catalog_store():
+    creds = None
+    if not (SNAPSHOT_PATH and os.path.exists(SNAPSHOT_PATH)):
+        creds = service_account_credentials(keyfile='credentials.json')
+    return open_catalog_store(SHEET_ID, creds, snapshot_path=SNAPSHOT_PATH)
+
+catalog = get_catalog_store().get()
 
 # --- セッションステート初期化 ---
 if "selected_sauna_id" not in st.session_state:
@@ -67,30 +55,30 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # --- ユーティリティ関数 ---
-def get_menus_by_sauna(sauna_id: int) -> pd.DataFrame:
-    related_restaurants = restaurants_df[restaurants_df["sauna_id"] == sauna_id]
-    rest_ids = related_restaurants["id"].tolist()
-    related_menus = menu_items_df[menu_items_df["restaurant_id"].isin(rest_ids)]
-    return related_menus
+def get_menus_by_sauna(sauna_id: int):
+    return catalog.get_all_menu_items_for_sauna(sauna_id)
+
+def sample_menus(menus):
+    return random.sample(menus, min(3, len(menus)))
 
 # --- UI開始 ---
 st.title("📖 サ飯パスポート - ガチャ")
 
 # --- サウナ選択 ---
-sauna_name_list = saunas_df["name"].tolist()
+sauna_name_list = [s.name for s in catalog.saunas]
 selected_sauna_name = st.selectbox("🧖 サウナを選んでください", sauna_name_list)
 
 # --- サウナID取得 & 保存 ---
-selected_sauna_row = saunas_df[saunas_df["name"] == selected_sauna_name]
-if not selected_sauna_row.empty:
-    sauna_id = int(selected_sauna_row.iloc[0]["id"])
+selected_sauna = catalog.get_sauna_by_name(selected_sauna_name)
+if selected_sauna is not None:
+    sauna_id = selected_sauna.id
     st.session_state.selected_sauna_id = sauna_id
 
 # --- ガチャを回すボタン ---
 if st.button("✨ ガチャを回す！"):
     menus = get_menus_by_sauna(sauna_id)
-    if not menus.empty:
-        st.session_state.selected_menus = menus.sample(n=min(3, len(menus))).to_dict(orient="records")
+    if menus:
+        st.session_state.selected_menus = sample_menus(menus)
 
 # --- 結果表示 ---
 if st.session_state.selected_menus:
@@ -100,14 +88,14 @@ if st.session_state.selected_menus:
     for menu in st.session_state.selected_menus:
         st.markdown(f"""
         <div class="card">
-            <img src="{menu.get('image_url', '')}" alt="menu image">
-            <h3>🍽️ {menu['name']} - ￥{menu['price']}</h3>
-            <p>{menu['description']}</p>
+            <img src="{menu.image_url}" alt="menu image">
+            <h3>🍽️ {menu.name} - ￥{menu.price}</h3>
+            <p>{menu.description}</p>
         </div>
         """, unsafe_allow_html=True)
-        total_price += int(menu['price'])
+        total_price += menu.price
 
-    entry_fee = int(selected_sauna_row.iloc[0]["price"])
+    entry_fee = selected_sauna.price
     total_price += entry_fee
 
     st.markdown("---")
@@ -120,7 +108,7 @@ if st.session_state.selected_menus:
     with col1:
         if st.button("🔁 もう一度ガチャを回す"):
             menus = get_menus_by_sauna(st.session_state.selected_sauna_id)
-            st.session_state.selected_menus = menus.sample(n=min(3, len(menus))).to_dict(orient="records")
+            st.session_state.selected_menus = sample_menus(menus)
 
     with col2:
         if st.button("⬅️ トップへ戻る"):
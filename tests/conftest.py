@@ -0,0 +1,42 @@
+import copy
+
+import pytest
+
+# 本番のシートと同じ列構成の小さなワークシート（1行目がヘッダー）
+SHEET_VALUES = {
+    "Saunas": [
+        ["id", "name", "latitude", "longitude", "entry_fee"],
+        [1, "サウナA", 35.0, 139.0, "1,000"],
+        [2, "サウナB", 35.1, 139.1, 800],
+    ],
+    "Restaurants": [
+        ["id", "sauna_id", "name"],
+        [1, 1, "食堂A"],
+        [2, 2, "食堂B"],
+    ],
+    "Menu": [
+        ["id", "restaurant_id", "name", "price", "description", "category", "image_file"],
+        [1, 1, "カレー", 900, "辛い", "main", "3curry.jpg"],
+        [2, 1, "ビール", 600, "生", "drink", "3superdry.jpg"],
+        [3, 1, "サワー", 500, "", "drink", "1lemonsour.png"],
+        [4, 2, "丼", 700, "", "main", ""],
+        [5, 2, "お茶", 200, "", "drink", ""],
+    ],
+    "MenuTags": [
+        ["id", "name"],
+        [1, "辛い"],
+        [2, "ご当地"],
+    ],
+    "MenuTagRelation": [
+        ["menuitemid", "tag_id"],
+        [2, 2],
+        [1, 2],
+        [1, 1],
+    ],
+}
+
+
+@pytest.fixture
+def sheet_values():
+    return copy.deepcopy(SHEET_VALUES)
+
@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from sameshi.api import create_app
+from sameshi.snapshot import write_snapshot
+
+
+@pytest.fixture
+def app(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values, modified_time="2024-01-01T00:00:00Z")
+    return create_app(snapshot_path=path, cache_dir=str(tmp_path / "cache"))
+
+
+def request(app, path, query="", headers=(), method="GET"):
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query.encode(),
+        "headers": [(k.encode(), v.encode()) for k, v in headers],
+    }
+    response = {"body": b""}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            response["status"] = message["status"]
+            response["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        else:
+            response["body"] += message.get("body", b"")
+
+    asyncio.run(app(scope, receive, send))
+    return response
+
+
+def body(response):
+    return json.loads(response["body"])
+
+
+def test_saunas_etag_and_not_modified(app):
+    first = request(app, "/saunas")
+    assert first["status"] == 200
+    assert [s["name"] for s in body(first)] == ["サウナA", "サウナB"]
+    etag = first["headers"]["etag"]
+
+    again = request(app, "/saunas", headers=[("if-none-match", f"W/{etag}")])
+    assert again["status"] == 304
+    assert again["body"] == b""
+    assert again["headers"]["etag"] == etag
+    assert request(app, "/saunas", headers=[("if-none-match", '"other"')])["status"] == 200
+
+
+def test_menus_and_tags(app):
+    menus = body(request(app, "/saunas/1/menus"))
+    assert [(m["name"], m["tags"]) for m in menus] == [("カレー", ["辛い", "ご当地"]), ("ビール", ["ご当地"]), ("サワー", [])]
+    assert body(request(app, "/tags")) == ["辛い", "ご当地"]
+
+
+@pytest.mark.parametrize("n", [1, 3])
+def test_gacha_always_returns_a_list_of_pulls(app, n):
+    response = request(app, "/saunas/1/gacha", f"n={n}")
+    assert response["status"] == 200
+    assert response["headers"]["cache-control"] == "no-store"
+    pulls = body(response)
+    assert len(pulls) == n
+    for pull in pulls:
+        assert sorted(m["category"] for m in pull) == ["drink", "drink", "main"]
+
+
+def test_gacha_with_tags_and_budget(app):
+    pulls = body(request(app, "/saunas/1/gacha", "tags=ご当地|辛い&n=5"))
+    assert all(m["name"] in ("カレー", "ビール") for pull in pulls for m in pull)
+    # 入浴料 1000 円 + カレー 900 円 + ビール 600 円 + サワー 500 円
+    assert request(app, "/saunas/1/gacha", "budget=3000")["status"] == 200
+    assert request(app, "/saunas/1/gacha", "budget=2999")["status"] == 422
+
+
+@pytest.mark.parametrize("path, query, status", [
+    ("/saunas/x/menus", "", 400),
+    ("/saunas/1/gacha", "n=0", 400),
+    ("/saunas/1/gacha", "n=101", 400),
+    ("/saunas/1/gacha", "budget=many", 400),
+    ("/saunas/1/nearby", "radius=5000", 400),
+    ("/saunas/9/menus", "", 404),
+    ("/nowhere", "", 404),
+])
+def test_error_statuses(app, path, query, status):
+    response = request(app, path, query)
+    assert response["status"] == status
+    assert "error" in body(response)
+
+
+def test_method_not_allowed(app):
+    assert request(app, "/saunas", method="POST")["status"] == 405
+
+
+def test_head_has_no_body(app):
+    response = request(app, "/saunas", method="HEAD")
+    assert response["status"] == 200
+    assert response["body"] == b""
+    assert int(response["headers"]["content-length"]) > 0
+
+
+def test_healthz(app):
+    response = request(app, "/healthz")
+    assert response["status"] == 200
+    assert body(response)["version"] == app.service.catalog.version
+
+
+def test_lifespan_prepares_the_catalog(app):
+    messages = iter([{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}])
+    sent = []
+
+    async def receive():
+        return next(messages)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    asyncio.run(app({"type": "lifespan"}, receive, send))
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert app._view is not None
+    assert app._view.catalog is app.service.catalog
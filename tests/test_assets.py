@@ -0,0 +1,95 @@
+import base64
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from sameshi import assets
+from sameshi.assets import AssetBuilder, ImageVariant, ThumbnailStore
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "logo.png"
+    Image.new("RGBA", (800, 600), (255, 120, 0, 255)).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    calls = []
+    render = assets.render_variant
+
+    def counting(variant):
+        calls.append(variant)
+        return render(variant)
+
+    monkeypatch.setattr(assets, "render_variant", counting)
+    return calls
+
+
+def test_build_writes_a_content_hashed_file(tmp_path, source):
+    asset = AssetBuilder(str(tmp_path / "static")).build("logo", ImageVariant(source, 390))
+    assert asset.filename.startswith("logo.") and asset.filename.endswith(".webp")
+    assert asset.url == f"app/static/{asset.filename}"
+    with Image.open(asset.path) as image:
+        assert (image.format, max(image.size)) == ("WEBP", 390)
+    assert asset.data_uri().startswith("data:image/webp;base64,")
+    assert base64.b64decode(asset.data_uri().split(",", 1)[1]) == open(asset.path, "rb").read()
+
+
+def test_manifest_skips_rebuilding_on_restart(tmp_path, source, renders):
+    static = str(tmp_path / "static")
+    first = AssetBuilder(static).build("logo", ImageVariant(source, 390))
+    second = AssetBuilder(static).build("logo", ImageVariant(source, 390))
+    assert second == first
+    assert len(renders) == 1
+
+
+def test_changed_parameters_build_a_new_file(tmp_path, source, renders):
+    builder = AssetBuilder(str(tmp_path / "static"))
+    small = builder.build("logo", ImageVariant(source, 100, format="JPEG", crop=True))
+    large = builder.build("logo", ImageVariant(source, 200, format="JPEG", crop=True))
+    assert small.filename != large.filename
+    with Image.open(io.BytesIO(open(small.path, "rb").read())) as image:
+        assert (image.format, image.size) == ("JPEG", (100, 100))
+    assert len(renders) == 2
+
+
+@pytest.fixture
+def image_dir(tmp_path):
+    directory = tmp_path / "images"
+    directory.mkdir()
+    Image.new("RGB", (640, 480), (10, 200, 30)).save(directory / "curry.jpg")
+    Image.new("RGB", (64, 64), (0, 0, 0)).save(directory / "pin_main.png")
+    return directory
+
+
+def test_thumbnail_store_memoizes_by_path_and_mtime(tmp_path, image_dir, renders):
+    store = ThumbnailStore(AssetBuilder(str(tmp_path / "static")), image_dir=str(image_dir))
+    src = store.get("curry.jpg")
+    assert src.startswith("app/static/menu-curry.")
+    assert store.get("curry.jpg") == src
+    assert len(renders) == 1
+    with Image.open(tmp_path / "static" / src.rsplit("/", 1)[1]) as image:
+        assert (image.format, image.size) == ("WEBP", (300, 300))
+
+    # 画像を差し替えると mtime が変わって作り直される
+    Image.new("RGB", (640, 480), (250, 250, 0)).save(image_dir / "curry.jpg")
+    stat = os.stat(image_dir / "curry.jpg")
+    os.utime(image_dir / "curry.jpg", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert store.get("curry.jpg") != src
+    assert len(renders) == 2
+
+
+@pytest.mark.parametrize("image_file", ["", "missing.jpg", "."])
+def test_thumbnail_store_without_an_image(tmp_path, image_dir, image_file):
+    store = ThumbnailStore(AssetBuilder(str(tmp_path / "static")), image_dir=str(image_dir))
+    assert store.get(image_file) is None
+
+
+def test_prepare_all_skips_map_pins(tmp_path, image_dir):
+    store = ThumbnailStore(AssetBuilder(str(tmp_path / "static")), image_dir=str(image_dir), to_src=lambda a: a.data_uri())
+    assert store.prepare_all() == 1
+    assert store.get("curry.jpg").startswith("data:image/webp;base64,")
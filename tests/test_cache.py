@@ -0,0 +1,218 @@
+import re
+
+import pytest
+
+from sameshi.cache import CacheBackend, RedisCache, SqliteTTLCache, open_cache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+class FakeRedis:
+    """RedisCache が使うコマンドだけを持つ redis.Redis の代わり（EX は clock で判定する）。"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.data = {}
+        self.closed = False
+
+    def _live(self, key):
+        key = key.decode("utf-8") if isinstance(key, bytes) else key
+        value, expires = self.data.get(key, (None, None))
+        if expires is not None and self.clock() >= expires:
+            del self.data[key]
+            return None
+        return value
+
+    def get(self, key):
+        return self._live(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = (value, None if ex is None else self.clock() + ex)
+
+    def delete(self, key):
+        self.data.pop(key.decode("utf-8") if isinstance(key, bytes) else key, None)
+
+    def scan_iter(self, match="*", count=None):
+        pattern = re.compile("".join(
+            "." + "*" if part == "*" else re.escape(part[-1]) for part in re.findall(r"\\.|\*|.", match)
+        ) + r"\Z", re.S)
+        for key in list(self.data):
+            if pattern.match(key) and self._live(key) is not None:
+                yield key.encode("utf-8")
+
+    def close(self):
+        self.closed = True
+
+
+def make_cache(tmp_path, clock, **kwargs):
+    return SqliteTTLCache(str(tmp_path / "cache.sqlite"), clock=clock, **kwargs)
+
+
+def test_set_and_get(tmp_path, clock):
+    cache = make_cache(tmp_path, clock)
+    assert cache.get("a") is None
+    cache.set("a", b"1")
+    cache.set_json("b", {"name": "ラーメン"})
+    assert cache.get("a") == b"1"
+    assert cache.get_json("b") == {"name": "ラーメン"}
+    assert len(cache) == 2
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, ttl=60)
+    cache.set("a", b"1")
+    clock.now += 60
+    assert cache.get("a") == b"1"
+    clock.now += 1
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, max_entries=2)
+    cache.set("a", b"1")
+    clock.now += 60
+    cache.set("b", b"2")
+    clock.now += 60
+    assert cache.get("a") == b"1"
+    clock.now += 60
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+    assert cache.get("c") == b"3"
+
+
+def test_reads_touch_the_access_time_at_most_once_per_interval(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, max_entries=2, touch_interval=60)
+    cache.set("a", b"1")
+    cache.set("b", b"2")
+    writes = cache._conn.total_changes
+    clock.now += 59
+    for _ in range(10):
+        assert cache.get("a") == b"1"
+    assert cache._conn.total_changes == writes
+    clock.now += 1
+    cache.get("a")
+    cache.get("a")
+    assert cache._conn.total_changes == writes + 1
+    # a は間隔を空けて読まれたので、追い出されるのは b
+    cache.set("c", b"3")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1"
+
+
+def test_backends_must_implement_the_interface():
+    class Partial(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_expired_entries_are_dropped_on_write(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, ttl=60)
+    cache.set("a", b"1")
+    clock.now += 120
+    cache.set("b", b"2")
+    assert len(cache) == 1
+
+
+def test_expired_entries_stay_readable_as_stale(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, ttl=60, stale_ttl=100)
+    cache.set_json("a", [1])
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get_stale_json("a") == [1]
+    assert dict(cache.items()) == {}
+    cache.set("b", b"2")
+    assert make_cache(tmp_path, clock, ttl=60, stale_ttl=100).get_stale_json("a") == [1]
+    clock.now += 100
+    assert cache.get_stale("a") is None
+    cache.set("c", b"3")
+    assert len(cache) == 2
+
+
+def test_entries_survive_a_restart(tmp_path, clock):
+    cache = make_cache(tmp_path, clock)
+    cache.set("a", b"1")
+    cache.close()
+    assert make_cache(tmp_path, clock).get("a") == b"1"
+
+
+def test_no_ttl_never_expires(tmp_path, clock):
+    cache = make_cache(tmp_path, clock, ttl=None)
+    cache.set("a", b"1")
+    clock.now += 10 ** 9
+    cache.set("b", b"2")
+    assert cache.get("a") == b"1"
+    assert dict(cache.items()) == {"a": b"1", "b": b"2"}
+
+
+def test_processes_share_one_file(tmp_path, clock):
+    writer = make_cache(tmp_path, clock)
+    reader = make_cache(tmp_path, clock)
+    writer.set_json("nearby:x", [1])
+    assert reader.get_json("nearby:x") == [1]
+    writer.delete("nearby:x")
+    assert reader.get("nearby:x") is None
+
+
+def test_redis_cache_namespaces_and_expiry(clock):
+    client = FakeRedis(clock)
+    cache = RedisCache("redis://unused", namespace="sameshi:places:", ttl=60, client=client)
+    other = RedisCache("redis://unused", namespace="sameshi:photos:", ttl=None, client=client)
+    cache.set_json("nearby:a", ["店"])
+    cache.set("nearby:b", b"2")
+    cache.set("photo:c", b"3")
+    other.set("nearby:a", b"other")
+    assert cache.get_json("nearby:a") == ["店"]
+    assert dict(cache.items("nearby:")) == {"nearby:a": "[\"店\"]".encode("utf-8"), "nearby:b": b"2"}
+    assert len(cache) == 3 and len(other) == 1
+    clock.now += 60
+    assert cache.get("nearby:a") is None
+    assert len(cache) == 0
+    assert other.get("nearby:a") == b"other"
+
+
+def test_redis_cache_keeps_expired_entries_for_stale_reads(clock):
+    cache = RedisCache("redis://unused", namespace="ns:", ttl=60, stale_ttl=100, client=FakeRedis(clock), clock=clock)
+    cache.set_json("a", [1])
+    clock.now += 61
+    assert cache.get("a") is None
+    assert cache.get_stale_json("a") == [1]
+    assert dict(cache.items()) == {}
+    clock.now += 100
+    assert cache.get_stale("a") is None
+
+
+def test_redis_cache_escapes_glob_characters_in_prefixes(clock):
+    cache = RedisCache("redis://unused", namespace="ns:", client=FakeRedis(clock))
+    cache.set("a*b", b"1")
+    cache.set("axb", b"2")
+    assert [key for key, _ in cache.items("a*")] == ["a*b"]
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_open_cache_picks_the_backend_from_the_url(tmp_path):
+    default = open_cache(None, "places", cache_dir=str(tmp_path / "default"))
+    shared = open_cache(f"sqlite:{tmp_path / 'shared'}", "photos", ttl=None)
+    assert isinstance(default, SqliteTTLCache) and default.path == str(tmp_path / "default" / "places.sqlite")
+    assert isinstance(shared, SqliteTTLCache) and shared.path == str(tmp_path / "shared" / "photos.sqlite")
+    assert shared.ttl is None
+    with pytest.raises(ValueError):
+        open_cache("memcached://localhost", "places")
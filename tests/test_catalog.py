@@ -0,0 +1,39 @@
+from sameshi.catalog import Catalog
+
+
+def names(rows):
+    return [row.name for row in rows]
+
+
+def test_sauna_lookups(sheet_values):
+    catalog = Catalog.from_values(sheet_values)
+    assert catalog.get_sauna(2).name == "サウナB"
+    assert catalog.get_sauna_by_name("サウナA").id == 1
+    assert catalog.get_sauna(9) is None
+    assert catalog.get_sauna_by_name("無い") is None
+
+
+def test_restaurant_and_menu_lookups(sheet_values):
+    catalog = Catalog.from_values(sheet_values)
+    assert names(catalog.get_restaurants_by_sauna(1)) == ["食堂A"]
+    assert names(catalog.get_menu_items_by_restaurant(1)) == ["カレー", "ビール", "サワー"]
+    assert names(catalog.get_all_menu_items_for_sauna(2)) == ["丼", "お茶"]
+    assert catalog.get_restaurants_by_sauna(9) == ()
+    assert catalog.get_all_menu_items_for_sauna(9) == ()
+
+
+def test_tags_follow_the_menu_tags_sheet_order(sheet_values):
+    catalog = Catalog.from_values(sheet_values)
+    assert catalog.get_tags_for_menu_item(1) == ("辛い", "ご当地")
+    assert catalog.get_tags_for_menu_item(2) == ("ご当地",)
+    assert catalog.get_tags_for_menu_item(3) == ()
+
+
+def test_relations_to_unknown_tags_are_ignored(sheet_values):
+    sheet_values["MenuTagRelation"].append([3, 99])
+    assert Catalog.from_values(sheet_values).get_tags_for_menu_item(3) == ()
+
+
+def test_saunas_without_a_name_are_skipped(sheet_values):
+    sheet_values["Saunas"].append([3, "  ", 35.2, 139.2, 500])
+    assert names(Catalog.from_values(sheet_values).saunas) == ["サウナA", "サウナB"]
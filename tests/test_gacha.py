@@ -0,0 +1,121 @@
+import itertools
+import random
+from collections import Counter
+
+import pytest
+
+from sameshi.gacha import AliasTable, Bucket, BudgetPlan, GachaEngine, get_random_menus_by_category
+from sameshi.records import MenuItem
+from sameshi.snapshot import build_snapshot
+
+
+def menu(id, category, price=500, rarity="", weight=None):
+    return MenuItem(id, 1, f"m{id}", price, "", category, "", "", rarity, weight)
+
+
+def test_alias_table_matches_weights():
+    weights = [1.0, 2.0, 7.0]
+    table = AliasTable(weights)
+    rng = random.Random(0)
+    counts = Counter(table.sample(rng) for _ in range(50000))
+    for i, w in enumerate(weights):
+        assert counts[i] / 50000 == pytest.approx(w / sum(weights), abs=0.01)
+
+
+@pytest.mark.parametrize("weights", [[], [0.0, 0.0]])
+def test_alias_table_rejects_empty_or_zero(weights):
+    with pytest.raises(ValueError):
+        AliasTable(weights)
+
+
+def test_bucket_draws_without_duplicates():
+    bucket = Bucket([menu(i, "drink", rarity=r) for i, r in enumerate(["n", "r", "sr", "ssr"])])
+    rng = random.Random(1)
+    for _ in range(1000):
+        picked = bucket.draw(2, rng)
+        assert len(picked) == 2
+        assert picked[0].id != picked[1].id
+
+
+def test_bucket_returns_everything_when_short():
+    items = [menu(1, "drink")]
+    assert Bucket(items).draw(2, random.Random(0)) == items
+
+
+def test_bucket_respects_weight_column():
+    bucket = Bucket([menu(1, "main", weight=9.0), menu(2, "main", weight=1.0)])
+    rng = random.Random(2)
+    counts = Counter(bucket.draw(1, rng)[0].id for _ in range(20000))
+    assert counts[1] / 20000 == pytest.approx(0.9, abs=0.02)
+
+
+def test_get_random_menus_by_category_shape():
+    items = [menu(1, "main"), menu(2, "main"), menu(3, "drink"), menu(4, "drink"), menu(5, "drink"), menu(6, "side")]
+    picked = get_random_menus_by_category(items, random.Random(3))
+    assert [m.category for m in picked] == ["main", "drink", "drink"]
+
+
+def test_engine_pulls_from_the_sauna_only(sheet_values):
+    catalog = build_snapshot(sheet_values, "").catalog
+    engine = GachaEngine(catalog, seed=0)
+    ids = {m.id for m in catalog.get_all_menu_items_for_sauna(1)}
+    for pull in engine.pull_many(1, 50):
+        assert {m.id for m in pull} <= ids
+        assert [m.category for m in pull] == ["main", "drink", "drink"]
+    assert GachaEngine(catalog, seed=5).pull_many(2, 3) == GachaEngine(catalog, seed=5).pull_many(2, 3)
+
+
+def budget_buckets(weighted=False):
+    mains = [menu(1, "main", 900, weight=2.0 if weighted else None), menu(2, "main", 700), menu(3, "main", 1500)]
+    drinks = [menu(4, "drink", 600), menu(5, "drink", 500), menu(6, "drink", 200), menu(7, "drink", 900)]
+    return {"main": Bucket(mains), "drink": Bucket(drinks)}
+
+
+def fitting_combos(buckets, budget, fee):
+    return [
+        (main.id, frozenset((a.id, b.id)))
+        for main in buckets["main"].items
+        for a, b in itertools.combinations(buckets["drink"].items, 2)
+        if fee + main.price + a.price + b.price <= budget
+    ]
+
+
+@pytest.mark.parametrize("budget", [1999, 2000, 2400, 3000, 5000])
+def test_budget_plan_counts_every_fitting_combo(budget):
+    buckets = budget_buckets()
+    plan = BudgetPlan(buckets, budget, fee=1000)
+    combos = fitting_combos(buckets, budget, 1000)
+    assert plan.total == len(combos)
+    assert bool(plan) == bool(combos)
+    assert plan.cheapest == 1000 + 700 + 200 + 500
+
+
+def test_budget_plan_draws_uniformly_within_budget():
+    buckets = budget_buckets()
+    plan = BudgetPlan(buckets, 3000, fee=1000)
+    combos = fitting_combos(buckets, 3000, 1000)
+    rng = random.Random(1)
+    counts = Counter()
+    for _ in range(20000):
+        pull = plan.draw(rng)
+        assert 1000 + sum(m.price for m in pull) <= 3000
+        main, *drinks = pull
+        counts[(main.id, frozenset(d.id for d in drinks))] += 1
+    assert set(counts) == set(combos)
+    for combo in combos:
+        assert counts[combo] / 20000 == pytest.approx(1 / len(combos), abs=0.015)
+
+
+def test_budget_plan_respects_weights():
+    plan = BudgetPlan(budget_buckets(weighted=True), 2300, fee=0)
+    rng = random.Random(2)
+    mains = Counter(plan.draw(rng)[0].id for _ in range(20000))
+    # main 900 円は 5 組・重み 2、700 円は 6 組・重み 1
+    assert mains[1] / mains[2] == pytest.approx(10 / 6, rel=0.08)
+
+
+def test_budget_plan_without_fitting_combo():
+    plan = BudgetPlan(budget_buckets(), 1000, fee=1000)
+    assert not plan
+    assert plan.draw(random.Random(0)) == []
+    assert plan.cheapest == 2400
@@ -0,0 +1,84 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from sameshi.cache import SqliteTTLCache
+from sameshi.catalog import Catalog
+from sameshi.geo import GridIndex, coordinates, haversine_many
+from sameshi.places import build_place_index
+
+
+def distance(lat1, lng1, lat2, lng2):
+    """検算用の素朴な haversine（m）。"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 6371000 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def random_points(rng, n, lat=35.68, lng=139.76, spread=0.2):
+    return [(lat + rng.uniform(-spread, spread), lng + rng.uniform(-spread, spread)) for _ in range(n)]
+
+
+def test_haversine_many_matches_the_scalar_formula():
+    rng = random.Random(0)
+    points = random_points(rng, 100, spread=5)
+    lats, lngs = zip(*points)
+    expected = [distance(35.0, 139.0, a, b) for a, b in points]
+    assert haversine_many(35.0, 139.0, lats, lngs) == pytest.approx(expected, rel=1e-9)
+    # 東京駅 → 大阪駅 ≒ 403km
+    assert float(haversine_many(35.6812, 139.7671, [34.7025], [135.4959])[0]) == pytest.approx(403_000, rel=0.01)
+
+
+def test_coordinates_skip_unusable_values():
+    rows = [{"latitude": 35, "longitude": "139.5"}, {"latitude": "", "longitude": 139}, {"latitude": float("nan"), "longitude": 1}, {}]
+    items, lats, lngs = coordinates(rows)
+    assert items == rows[:1]
+    assert lats.tolist() == [35.0] and lngs.tolist() == [139.5]
+
+
+@pytest.mark.parametrize("cell_size", [100.0, 500.0, 2000.0])
+@pytest.mark.parametrize("base_lat", [0.0, 35.68, 64.0])
+def test_grid_index_matches_brute_force(cell_size, base_lat):
+    rng = random.Random(int(cell_size) + int(base_lat))
+    points = random_points(rng, 400, lat=base_lat)
+    index = GridIndex(list(range(len(points))), *zip(*points), cell_size=cell_size)
+    for lat, lng in random_points(rng, 25, lat=base_lat, spread=0.25):
+        brute = sorted((distance(lat, lng, a, b), i) for i, (a, b) in enumerate(points))
+        for radius in (50.0, 800.0, 5000.0):
+            found = index.within(lat, lng, radius)
+            assert [i for i, _ in found] == [i for d, i in brute if d <= radius]
+            assert [d for _, d in found] == pytest.approx([d for d, _ in brute if d <= radius], rel=1e-9)
+        for k in (1, 7):
+            nearest = index.nearest(lat, lng, k)
+            assert [i for i, _ in nearest] == [i for _, i in brute[:k]]
+        limited = index.nearest(lat, lng, 50, max_distance=3000.0)
+        assert [i for i, _ in limited] == [i for d, i in brute[:50] if d <= 3000.0]
+
+
+def test_empty_grid_index():
+    index = GridIndex([], [], [])
+    assert len(index) == 0
+    assert index.within(35.0, 139.0, 1000) == []
+    assert index.nearest(35.0, 139.0, 3) == []
+    with pytest.raises(ValueError):
+        GridIndex([1], [35.0], np.array([]))
+
+
+def test_catalog_sauna_queries(sheet_values):
+    catalog = Catalog.from_values(sheet_values)
+    assert [(s.name, round(d)) for s, d in catalog.saunas_within(35.0, 139.0, 100)] == [("サウナA", 0)]
+    assert [s.name for s, _ in catalog.nearest_saunas(35.09, 139.09, k=2)] == ["サウナB", "サウナA"]
+
+
+def test_place_index_from_the_places_cache(tmp_path):
+    cache = SqliteTTLCache(str(tmp_path / "places.sqlite"))
+    near = {"place_id": "near", "name": "近い店", "rating": 4.1, "geometry": {"location": {"lat": 35.0005, "lng": 139.0}}}
+    far = {"place_id": "far", "name": "遠い店", "geometry": {"location": {"lat": 35.01, "lng": 139.0}}}
+    cache.set_json("nearby:a", [near, far])
+    cache.set_json("nearby:b", [near])
+    cache.set_json("photo:x", [])
+    index = build_place_index(cache)
+    assert len(index) == 2
+    assert [p["name"] for p, _ in index.within(35.0, 139.0, 200)] == ["近い店"]
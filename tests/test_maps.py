@@ -0,0 +1,36 @@
+import io
+
+from PIL import Image
+
+from sameshi.assets import DEFAULT_PIN, render_icon_atlas
+from sameshi.maps import SAUNA_TYPE, build_map_data
+
+
+def test_build_map_data_puts_the_sauna_first():
+    foods = [
+        {"name": "ラーメン屋", "keyword": "ラーメン", "rating": 4.2, "latitude": 35.001, "longitude": 139.0},
+        {"name": "定食屋", "keyword": "定食", "rating": None, "latitude": 35.002, "longitude": 139.001, "extra": 1},
+    ]
+    data = build_map_data(35.0, 139.0, foods)
+    assert list(data["type"]) == [SAUNA_TYPE, "ラーメン", "定食"]
+    assert list(data["icon"]) == ["sauna", "ramen", DEFAULT_PIN]
+    assert list(data["rating"]) == [0, 4.2, 0]
+    assert list(data["lat"]) == [35.0, 35.001, 35.002]
+
+
+def test_build_map_data_without_shops():
+    data = build_map_data(35.0, 139.0, [])
+    assert list(data["name"]) == ["サウナ"]
+
+
+def test_icon_atlas_draws_missing_pins(tmp_path):
+    pin = tmp_path / "pin.png"
+    Image.new("RGBA", (128, 128), (0, 0, 255, 255)).save(pin)
+    data, mapping = render_icon_atlas({"sauna": str(pin), "curry": str(tmp_path / "missing.png")}, size=32)
+    with Image.open(io.BytesIO(data)) as atlas:
+        assert atlas.size == (96, 32)
+        assert atlas.getpixel((16, 16)) == (0, 0, 255, 255)
+        # 見つからないピンと DEFAULT_PIN には赤い丸
+        assert atlas.getpixel((48, 16)) == atlas.getpixel((80, 16)) == (255, 0, 80, 255)
+    assert [m["x"] for m in mapping.values()] == [0, 32, 64]
+    assert list(mapping) == ["sauna", "curry", DEFAULT_PIN]
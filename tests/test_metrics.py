@@ -0,0 +1,149 @@
+import contextvars
+import json
+import logging
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from sameshi import metrics
+from sameshi.metrics import Registry, RunMetrics
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    registry = Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
+
+
+def isolated(fn):
+    """空のコンテキストで動かし、実行中の RunMetrics を持ち越さない。"""
+    return contextvars.Context().run(fn)
+
+
+def test_records_go_to_the_current_run_and_the_registry(registry):
+
+    def body():
+        run = metrics.start_run("page", "s1")
+        metrics.count("places.requests", 2)
+        metrics.count("photos.requests")
+        metrics.count("places.cache_hit")
+        with metrics.span("render.map"):
+            pass
+        return run
+
+    run = isolated(body)
+    assert run.counters == {"places.requests": 2, "photos.requests": 1, "places.cache_hit": 1}
+    assert run.outbound_requests() == 3
+    assert len(run.spans["render.map"]) == 1
+    assert registry.counters["places.requests"] == 2
+    assert registry.span_totals["render.map"][0] == 1
+
+
+def test_counts_without_a_run_only_reach_the_registry(registry):
+    isolated(lambda: metrics.count("sheets.requests"))
+    assert registry.counters["sheets.requests"] == 1
+
+
+def test_timed_records_a_span_even_on_error(registry):
+
+    @metrics.timed("catalog.get")
+    def boom():
+        raise RuntimeError("x")
+
+    def body():
+        with pytest.raises(RuntimeError):
+            boom()
+
+    isolated(body)
+    assert registry.span_totals["catalog.get"][0] == 1
+
+
+def test_submit_carries_the_run_into_worker_threads():
+    def body():
+        run = metrics.start_run()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            for future in [metrics.submit(pool, metrics.count, "photos.requests") for _ in range(8)]:
+                future.result()
+        return run
+
+    assert isolated(body).counters["photos.requests"] == 8
+
+
+def test_run_scope_nests_into_the_page_run(registry):
+    totals = {}
+
+    def body():
+        with metrics.run_scope("page", totals=totals) as page:
+            with metrics.run_scope("fragment", totals=totals) as inner:
+                assert inner is page
+                metrics.count("places.requests")
+        # ページの実行が終わった後のフラグメント単独の再実行は別の実行として数える
+        with metrics.run_scope("fragment", totals=totals) as fragment:
+            metrics.count("photos.requests")
+        return page, fragment
+
+    page, fragment = isolated(body)
+    assert page is not fragment and page.finished and fragment.finished
+    assert dict(registry.run_count) == {"page": 1, "fragment": 1}
+    assert totals == {"runs": 2, "places.requests": 1, "photos.requests": 1}
+
+
+def test_finish_run_logs_one_json_line_once(caplog):
+    def body():
+        run = metrics.start_run("page", "s1")
+        metrics.count("html.bytes", 120)
+        with caplog.at_level(logging.INFO, logger="sameshi.metrics"):
+            first = metrics.finish_run(run)
+            metrics.finish_run(run)
+        return first
+
+    record = isolated(body)
+    assert len(caplog.records) == 1
+    assert json.loads(caplog.records[0].getMessage()) == record
+    assert record["kind"] == "page" and record["counters"] == {"html.bytes": 120}
+
+
+def test_quantile():
+    values = [float(i) for i in range(1, 101)]
+    assert metrics.quantile(values, 0.5) == 51.0
+    assert metrics.quantile(values, 0.99) == 99.0
+    assert metrics.quantile([], 0.5) == 0.0
+
+
+def test_prometheus_text():
+    registry = Registry(window=4)
+    registry.count("places.requests", 3)
+    for seconds in (0.1, 0.2, 0.3, 0.4, 0.5):
+        registry.record_span("render.map", seconds)
+    run = RunMetrics("page")
+    run.count("html.bytes", 2048)
+    run.count("places.requests", 2)
+    run.duration = 0.25
+    registry.observe_run(run)
+
+    lines = registry.prometheus_text().splitlines()
+    assert "sameshi_places_requests_total 3" in lines
+    assert 'sameshi_runs_total{kind="page"} 1' in lines
+    # 分布は直近 window 件、回数と合計は累計
+    assert 'sameshi_span_seconds{span="render.map",quantile="0.5"} 0.400000' in lines
+    assert 'sameshi_span_seconds_count{span="render.map"} 5' in lines
+    assert 'sameshi_span_seconds_sum{span="render.map"} 1.500000' in lines
+    assert 'sameshi_page_html_bytes{quantile="0.99"} 2048' in lines
+    assert "sameshi_page_outbound_requests_sum 2" in lines
+
+
+def test_serve_prometheus():
+    registry = Registry()
+    registry.count("sheets.requests")
+    server = metrics.serve_prometheus(0, host="127.0.0.1", registry=registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(url + "/metrics") as response:
+            assert "sameshi_sheets_requests_total 1" in response.read().decode("utf-8")
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,164 @@
+import sqlite3
+
+import pytest
+
+from sameshi.catalog import Catalog
+from sameshi.nearby import SCHEMA_VERSION, NearbyTable, refresh_table
+from sameshi.records import Sauna
+from sameshi.service import SameshiService, open_catalog_store
+from sameshi.snapshot import write_snapshot
+from tests.test_places import FakeGoogleMaps
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeThumbnailer:
+    def get_many(self, refs):
+        return {ref: b"jpeg" for ref in refs if ref}
+
+
+class FakeService:
+    thumbnailer = FakeThumbnailer()
+
+    def __init__(self, fail=()):
+        self.calls = []
+        self.fail = set(fail)
+
+    def find_nearby_good_food(self, lat, lng, radius=200, skip_errors=True):
+        self.calls.append((lat, lng))
+        if lat in self.fail:
+            raise ConnectionError("places unavailable")
+        return [{"name": f"店 {lat}", "rating": 4.0, "photo_reference": f"ref-{lat}"}]
+
+
+def catalog_from(sheet_values):
+    return Catalog.from_values(sheet_values, version="v1")
+
+
+def test_refresh_and_read_back(tmp_path, sheet_values):
+    path = str(tmp_path / "nearby.sqlite")
+    catalog = catalog_from(sheet_values)
+    writer = NearbyTable(path)
+    stats = refresh_table(writer, catalog, FakeService())
+    assert (stats.checked, stats.refreshed, stats.removed, stats.failed, stats.generation) == (2, 2, 0, 0, 1)
+    writer.close()
+
+    reader = NearbyTable(path, readonly=True)
+    entry = reader.lookup(catalog.get_sauna(1))
+    assert entry.stores == [{"name": "店 35.0", "rating": 4.0, "photo_reference": "ref-35.0"}]
+    assert reader.thumbnails(["ref-35.0", "ref-9"]) == {"ref-35.0": b"jpeg"}
+    assert reader.meta()["catalog_version"] == "v1"
+    # 座標が変わったサウナの行は使わない
+    assert reader.lookup(Sauna(1, "サウナA", 36.0, 139.0, 1000)) is None
+
+
+def test_refresh_only_searches_stale_saunas(tmp_path, sheet_values):
+    clock = Clock()
+    table = NearbyTable(str(tmp_path / "nearby.sqlite"), clock=clock)
+    refresh_table(table, catalog_from(sheet_values), FakeService())
+
+    service = FakeService()
+    assert refresh_table(table, catalog_from(sheet_values), service).refreshed == 0
+    sheet_values["Saunas"][1][2] = 35.5
+    assert refresh_table(table, catalog_from(sheet_values), service).refreshed == 1
+    assert service.calls == [(35.5, 139.0)]
+    clock.now += 8 * 24 * 3600
+    assert refresh_table(table, catalog_from(sheet_values), service, limit=1).refreshed == 1
+    assert refresh_table(table, catalog_from(sheet_values), service, force=True).refreshed == 2
+
+
+def test_failed_saunas_keep_their_previous_rows(tmp_path, sheet_values):
+    table = NearbyTable(str(tmp_path / "nearby.sqlite"))
+    refresh_table(table, catalog_from(sheet_values), FakeService())
+    before = table.get(2)
+    stats = refresh_table(table, catalog_from(sheet_values), FakeService(fail={35.1}), force=True)
+    assert (stats.refreshed, stats.failed) == (1, 1)
+    assert table.get(2) == before
+
+
+def test_refresh_removes_saunas_dropped_from_the_catalog(tmp_path, sheet_values):
+    table = NearbyTable(str(tmp_path / "nearby.sqlite"))
+    refresh_table(table, catalog_from(sheet_values), FakeService())
+    del sheet_values["Saunas"][2]
+    stats = refresh_table(table, catalog_from(sheet_values), FakeService())
+    assert stats.removed == 1
+    assert table.get(2) is None
+    assert table.thumbnails(["ref-35.1"]) == {}
+    assert len(table) == 1
+
+
+def test_refresh_drops_thumbnails_no_longer_referenced(tmp_path, sheet_values):
+    table = NearbyTable(str(tmp_path / "nearby.sqlite"))
+    refresh_table(table, catalog_from(sheet_values), FakeService())
+    # 座標が変わって店が入れ替わっても、消える行は無い
+    sheet_values["Saunas"][1][2] = 35.5
+    stats = refresh_table(table, catalog_from(sheet_values), FakeService())
+    assert (stats.refreshed, stats.removed) == (1, 0)
+    assert table.thumbnails(["ref-35.0", "ref-35.5", "ref-35.1"]) == {"ref-35.5": b"jpeg", "ref-35.1": b"jpeg"}
+    assert table._conn.execute("SELECT COUNT(*) FROM thumbnails").fetchone()[0] == 2
+
+
+def test_writer_rebuilds_other_schema_version(tmp_path, sheet_values):
+    path = str(tmp_path / "nearby.sqlite")
+    writer = NearbyTable(path)
+    refresh_table(writer, catalog_from(sheet_values), FakeService())
+    writer._conn.execute("UPDATE meta SET value = 'old' WHERE key = 'schema_version'")
+    writer._conn.commit()
+    writer.close()
+    assert len(NearbyTable(path)) == 0
+    assert NearbyTable(path, readonly=True).meta()["schema_version"] == str(SCHEMA_VERSION)
+
+
+def test_reader_ignores_other_schema_version_without_dropping(tmp_path, sheet_values):
+    path = str(tmp_path / "nearby.sqlite")
+    writer = NearbyTable(path)
+    refresh_table(writer, catalog_from(sheet_values), FakeService())
+    writer._conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'", (str(SCHEMA_VERSION + 1),))
+    writer._conn.commit()
+
+    reader = NearbyTable(path, readonly=True)
+    assert reader.get(1) is None
+    assert reader.thumbnails(["ref-35.0"]) == {}
+    assert len(reader) == 0
+    with pytest.raises(RuntimeError):
+        reader.remove_except([])
+    # 読み取り側は表を消さない
+    with sqlite3.connect(path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM nearby").fetchone()[0] == 2
+
+
+def test_refresh_removes_saunas_that_lost_their_coordinates(tmp_path, sheet_values):
+    table = NearbyTable(str(tmp_path / "nearby.sqlite"))
+    refresh_table(table, catalog_from(sheet_values), FakeService())
+    sheet_values["Saunas"][2][2] = ""
+    stats = refresh_table(table, catalog_from(sheet_values), FakeService())
+    assert stats.removed == 1
+    assert table.get(2) is None
+    assert table.get(1) is not None
+    assert table.thumbnails(["ref-35.1"]) == {}
+
+
+def test_service_serves_the_table_without_calling_google(tmp_path, sheet_values):
+    snapshot_path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(snapshot_path, sheet_values)
+    table_path = str(tmp_path / "nearby.sqlite")
+    refresh_table(NearbyTable(table_path), catalog_from(sheet_values), FakeService())
+
+    gmaps = FakeGoogleMaps({})
+    service = SameshiService(
+        open_catalog_store("sheet", None, snapshot_path=snapshot_path),
+        cache_dir=str(tmp_path / "cache"), gmaps=gmaps, nearby_table=table_path,
+    )
+    stores, photos = service.nearby_for_sauna(service.catalog.get_sauna(1))
+    assert [s["name"] for s in stores] == ["店 35.0"]
+    assert photos == {"ref-35.0": "anBlZw=="}
+    assert not gmaps.calls
+    moved = Sauna(1, "サウナA", 36.0, 139.0, 1000)
+    assert service.nearby_for_sauna(moved, photos=False) == ([], {})
+    assert gmaps.calls
@@ -0,0 +1,130 @@
+import threading
+import time
+
+import pytest
+
+from sameshi import metrics
+from sameshi.outbound import OutboundScheduler, Retryable, Throttled
+
+
+def make_scheduler(**kwargs):
+    kwargs.setdefault("rate", 1e9)
+    kwargs.setdefault("burst", 10 ** 9)
+    return OutboundScheduler("test", sleep=lambda s: None, **kwargs)
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    scheduler = OutboundScheduler("test_singleflight", rate=1e9, burst=10 ** 9, sleep=lambda s: None)
+    coalesced = metrics.REGISTRY.counters["test_singleflight.coalesced"]
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.call("key", fn))) for _ in range(5)]
+    threads[0].start()
+    assert started.wait(5)
+    for t in threads[1:]:
+        t.start()
+    # 後続の4本が実行中の呼び出しを待ち始めてから leader を終わらせる
+    deadline = time.monotonic() + 5
+    while metrics.REGISTRY.counters["test_singleflight.coalesced"] < coalesced + 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_throttled_serves_last_good_without_retrying():
+    scheduler = make_scheduler(retries=3)
+    assert scheduler.call("key", lambda: "fresh") == "fresh"
+    calls = []
+
+    def over_quota():
+        calls.append(1)
+        raise Throttled("OVER_QUERY_LIMIT")
+
+    assert scheduler.call("key", over_quota) == "fresh"
+    assert len(calls) == 1
+
+
+def test_throttled_without_last_good_raises():
+    scheduler = make_scheduler(retries=3)
+    calls = []
+
+    def over_quota():
+        calls.append(1)
+        raise Throttled("OVER_QUERY_LIMIT")
+
+    with pytest.raises(Throttled):
+        scheduler.call("key", over_quota)
+    assert len(calls) == 1
+
+
+def test_retryable_errors_are_retried():
+    scheduler = make_scheduler(retries=2)
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) < 3:
+            raise Retryable("503")
+        return "ok"
+
+    assert scheduler.call("key", flaky) == "ok"
+    assert len(calls) == 3
+
+
+def test_retries_give_up_and_fall_back():
+    scheduler = make_scheduler(retries=2)
+    scheduler.call("key", lambda: "old")
+    calls = []
+
+    def down():
+        calls.append(1)
+        raise Retryable("503")
+
+    assert scheduler.call("key", down) == "old"
+    assert len(calls) == 3
+
+
+def test_stale_loader_covers_a_fresh_process():
+    scheduler = make_scheduler(retries=0)
+
+    def down():
+        raise Retryable("503")
+
+    # このプロセスでは一度も成功していないので、呼び出し側の古い結果を使う
+    assert scheduler.call("key", down, stale=lambda: "expired") == "expired"
+    with pytest.raises(Retryable):
+        scheduler.call("key", down, stale=lambda: None)
+    assert scheduler.call("key", lambda: "fresh", stale=lambda: "expired") == "fresh"
+    assert scheduler.call("key", down, stale=lambda: "expired") == "fresh"
+
+
+def test_other_errors_are_not_retried():
+    scheduler = make_scheduler(retries=2)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise KeyError("bug")
+
+    with pytest.raises(KeyError):
+        scheduler.call("key", broken)
+    assert len(calls) == 1
+
+
+def test_empty_bucket_is_throttled():
+    scheduler = make_scheduler(rate=1e-9, burst=1, max_wait=0)
+    assert scheduler.call("a", lambda: 1) == 1
+    with pytest.raises(Throttled):
+        scheduler.call("b", lambda: 2)
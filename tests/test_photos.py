@@ -0,0 +1,110 @@
+import base64
+import io
+import threading
+
+import pytest
+import requests
+from PIL import Image
+
+from sameshi.cache import SqliteTTLCache
+from sameshi.outbound import OutboundScheduler
+from sameshi.photos import PhotoThumbnailer, make_thumbnail
+
+
+def png(width=640, height=480, color=(200, 80, 40)):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(out, format="PNG")
+    return out.getvalue()
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b""):
+        self.status_code = status_code
+        self.content = content
+
+
+class FakeSession:
+    """photo_reference ごとに決めた応答を返す requests.Session の代わり。"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.urls = []
+        self._lock = threading.Lock()
+
+    def get(self, url, timeout=None):
+        with self._lock:
+            self.urls.append(url)
+        ref = url.split("photoreference=")[1].split("&")[0]
+        response = self.responses[ref]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def open_jpeg(data):
+    image = Image.open(io.BytesIO(data))
+    return image.format, image.size
+
+
+def test_make_thumbnail_crops_to_a_square_jpeg():
+    assert open_jpeg(make_thumbnail(png(640, 480))) == ("JPEG", (300, 300))
+    assert open_jpeg(make_thumbnail(png(50, 80), size=40)) == ("JPEG", (40, 40))
+
+
+@pytest.fixture
+def session():
+    return FakeSession({
+        "ok": FakeResponse(200, png()),
+        "missing": FakeResponse(404),
+        "broken": FakeResponse(200, b"not an image"),
+        "timeout": requests.ConnectTimeout("slow"),
+    })
+
+
+def test_thumbnails_are_cached_by_photo_reference(tmp_path, session):
+    cache = SqliteTTLCache(str(tmp_path / "photos.sqlite"))
+    thumbnailer = PhotoThumbnailer("KEY", cache=cache, session=session)
+    first = thumbnailer.get_thumbnail("ok")
+    assert open_jpeg(first) == ("JPEG", (300, 300))
+    assert thumbnailer.get_thumbnail("ok") == first
+    assert len(session.urls) == 1
+    assert "key=KEY" in session.urls[0]
+
+
+@pytest.mark.parametrize("ref", ["missing", "broken", "timeout"])
+def test_failed_photos_are_none_and_not_cached(tmp_path, session, ref):
+    cache = SqliteTTLCache(str(tmp_path / "photos.sqlite"))
+    thumbnailer = PhotoThumbnailer("KEY", cache=cache, session=session)
+    assert thumbnailer.get_thumbnail(ref) is None
+    assert len(cache) == 0
+
+
+def test_expired_thumbnails_are_served_when_the_photo_api_is_down(tmp_path, session):
+    now = [1000.0]
+    path = str(tmp_path / "photos.sqlite")
+    cache = SqliteTTLCache(path, ttl=60, stale_ttl=3600, clock=lambda: now[0])
+    first = PhotoThumbnailer("KEY", cache=cache, session=session).get_thumbnail("ok")
+    now[0] += 120
+    session.responses["ok"] = FakeResponse(503)
+    # 再起動後の新しい PhotoThumbnailer でも、期限切れのサムネイルで代用する
+    scheduler = OutboundScheduler("test_photos_stale", rate=1e9, burst=10 ** 9, retries=0)
+    cache = SqliteTTLCache(path, ttl=60, stale_ttl=3600, clock=lambda: now[0])
+    assert PhotoThumbnailer("KEY", cache=cache, session=session, scheduler=scheduler).get_thumbnail("ok") == first
+    assert len(session.urls) == 2
+
+
+def test_get_many_base64_dedupes_and_skips_empty_references(session):
+    thumbnailer = PhotoThumbnailer("KEY", session=session)
+    photos = thumbnailer.get_many_base64(["ok", None, "missing", "ok", ""])
+    assert list(photos) == ["ok", "missing"]
+    assert open_jpeg(base64.b64decode(photos["ok"])) == ("JPEG", (300, 300))
+    assert photos["missing"] is None
+    assert len(session.urls) == 2
+
+
+def test_get_many_returns_the_same_thumbnails_as_bytes(session):
+    thumbnailer = PhotoThumbnailer("KEY", session=session)
+    raw = thumbnailer.get_many(["ok", "missing", "ok"])
+    assert list(raw) == ["ok", "missing"]
+    assert raw["missing"] is None
+    assert thumbnailer.get_many_base64(["ok"]) == {"ok": base64.b64encode(raw["ok"]).decode()}
@@ -0,0 +1,118 @@
+from collections import Counter
+
+import pytest
+
+from sameshi.cache import SqliteTTLCache
+from sameshi import places
+from sameshi.outbound import OutboundScheduler, Retryable
+from sameshi.places import cached_places_nearby, find_nearby_good_food, places_cache_key
+
+SAUNA = (35.0, 139.0)
+
+
+def place(place_id, rating, lat=35.0005, lng=139.0, photo="ref"):
+    result = {"place_id": place_id, "name": place_id, "rating": rating, "geometry": {"location": {"lat": lat, "lng": lng}}}
+    if photo:
+        result["photos"] = [{"photo_reference": photo}]
+    return result
+
+
+class FakeGoogleMaps:
+    """places_nearby だけを持つ googlemaps.Client の代わり。
+
+    results はキーワード → 結果のリスト、またはページ（結果のリスト）のタプル。
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = Counter()
+
+    def places_nearby(self, location=None, radius=None, keyword=None, language=None, page_token=None):
+        if page_token is not None:
+            keyword, page = page_token.split("#")
+            page = int(page)
+        else:
+            page = 0
+        self.calls[keyword] += 1
+        pages = self.results.get(keyword, [])
+        if not isinstance(pages, tuple):
+            pages = (pages,)
+        response = {"results": pages[page] if page < len(pages) else []}
+        if page + 1 < len(pages):
+            response["next_page_token"] = f"{keyword}#{page + 1}"
+        return response
+
+
+def test_cache_key_rounds_the_location():
+    assert places_cache_key((35.000001, 139.0), 200, "カレー", "ja") == places_cache_key((35.00004, 139.0), 200, "カレー", "ja")
+    assert places_cache_key((35.0, 139.0), 200, "カレー", "ja") != places_cache_key((35.0, 139.0), 300, "カレー", "ja")
+
+
+def test_cached_places_nearby_calls_google_once(tmp_path):
+    gmaps = FakeGoogleMaps({"カレー": [place("c1", 4.0)]})
+    cache = SqliteTTLCache(str(tmp_path / "places.sqlite"))
+    first = cached_places_nearby(gmaps, SAUNA, 200, "カレー", cache=cache)
+    second = cached_places_nearby(gmaps, (35.00001, 139.0), 200, "カレー", cache=cache)
+    assert first == second == [place("c1", 4.0)]
+    assert gmaps.calls["カレー"] == 1
+
+
+def test_expired_results_are_served_when_google_fails_after_a_restart(tmp_path):
+    now = [1000.0]
+    path = str(tmp_path / "places.sqlite")
+    cache = SqliteTTLCache(path, ttl=60, stale_ttl=3600, clock=lambda: now[0])
+    gmaps = FakeGoogleMaps({"カレー": [place("c1", 4.0)]})
+    assert cached_places_nearby(gmaps, SAUNA, 200, "カレー", cache=cache) == [place("c1", 4.0)]
+    cache.close()
+
+    class Down:
+        def places_nearby(self, **kwargs):
+            raise Retryable("503")
+
+    # 再起動後（新しいスケジューラー）・期限切れでも、Google が落ちていれば前回の結果を返す
+    now[0] += 120
+    cache = SqliteTTLCache(path, ttl=60, stale_ttl=3600, clock=lambda: now[0])
+    scheduler = OutboundScheduler("test_places_stale", rate=1e9, burst=10 ** 9, retries=0)
+    assert cached_places_nearby(Down(), SAUNA, 200, "カレー", cache=cache, scheduler=scheduler) == [place("c1", 4.0)]
+    now[0] += 3600
+    with pytest.raises(Retryable):
+        cached_places_nearby(Down(), SAUNA, 200, "カレー", cache=cache, scheduler=scheduler)
+
+
+def test_find_nearby_good_food_filters_by_rating_and_distance():
+    gmaps = FakeGoogleMaps({
+        "ラーメン": [place("good", 4.2), place("low", 3.4)],
+        # 緯度 0.01 度 ≒ 1.1km 先は半径の外
+        "カレー": [place("far", 4.8, lat=35.01), place("nophoto", 3.5, photo=None)],
+    })
+    stores = find_nearby_good_food(gmaps, *SAUNA, radius=200)
+    assert [(s["name"], s["keyword"]) for s in stores] == [("good", "ラーメン"), ("nophoto", "カレー")]
+    assert stores[0]["maps_url"] == "https://www.google.com/maps/place/?q=place_id:good"
+    assert [s["photo_reference"] for s in stores] == ["ref", None]
+    assert all("photo_url" not in s for s in stores)
+
+
+@pytest.fixture
+def no_page_delay(monkeypatch):
+    monkeypatch.setattr(places, "NEXT_PAGE_DELAY", 0)
+
+
+def test_pagination_follows_next_page_token(tmp_path, no_page_delay):
+    gmaps = FakeGoogleMaps({"カレー": ([place("p1", 4.0)], [place("p2", 4.0)], [place("p3", 4.0)])})
+    cache = SqliteTTLCache(str(tmp_path / "places.sqlite"))
+    assert [p["place_id"] for p in cached_places_nearby(gmaps, SAUNA, 200, "カレー", cache=cache)] == ["p1"]
+    assert [p["place_id"] for p in cached_places_nearby(gmaps, SAUNA, 200, "カレー", cache=cache, max_pages=2)] == ["p1", "p2"]
+    # ページ数ごとに別のキャッシュ
+    assert gmaps.calls["カレー"] == 3
+    cached_places_nearby(gmaps, SAUNA, 200, "カレー", cache=cache, max_pages=2)
+    assert gmaps.calls["カレー"] == 3
+
+
+def test_places_found_by_several_keywords_are_kept_once(no_page_delay):
+    gmaps = FakeGoogleMaps({
+        "ラーメン": [place("both", 4.0)],
+        "カレー": [place("both", 4.0), place("curry", 4.0)],
+    })
+    stores = find_nearby_good_food(gmaps, *SAUNA, radius=200)
+    assert [(s["name"], s["keyword"]) for s in stores] == [("both", "ラーメン"), ("curry", "カレー")]
+    assert sum(gmaps.calls.values()) == len(places.KEYWORDS)
@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+
+from sameshi.catalog import Catalog
+from sameshi.records import DEFAULTS, MenuItem, Sauna, SchemaError, parse_rows, parse_sheets, to_yen
+
+
+@pytest.mark.parametrize("raw, yen", [("1,000", 1000), ("￥1,200", 1200), ("800円", 800), (1500.0, 1500), (700, 700)])
+def test_to_yen(raw, yen):
+    assert to_yen(raw) == yen
+
+
+def test_parse_saunas():
+    rows, skipped = parse_rows("Saunas", [
+        ["ID", "Name", "Latitude", "Longitude", "Entry Fee"],
+        ["1", " サウナA ", "35.5", "139.5", "1,000"],
+        [2, "サウナB", "", "", ""],
+    ])
+    assert skipped == 0
+    assert rows == (Sauna(1, "サウナA", 35.5, 139.5, 1000), Sauna(2, "サウナB", None, None, 0))
+
+
+def test_unreadable_optional_columns_keep_the_row(caplog):
+    with caplog.at_level(logging.WARNING, logger="sameshi.records"):
+        rows, skipped = parse_rows("Saunas", [
+            ["id", "name", "latitude", "longitude", "entry_fee"],
+            [1, "サウナA", 35.0, 139.0, "1200円〜"],
+            [2, "サウナB", "東京", 139.1, 900],
+        ])
+    assert skipped == 0
+    assert rows[0] == Sauna(1, "サウナA", 35.0, 139.0, DEFAULTS["price"])
+    assert rows[1] == Sauna(2, "サウナB", None, 139.1, 900)
+    assert "used defaults for 2 unreadable optional values" in caplog.text
+
+
+def test_sauna_with_non_numeric_fee_stays_in_catalog(sheet_values):
+    sheet_values["Saunas"][1][4] = "1200円〜"
+    catalog = Catalog.from_tables(parse_sheets(sheet_values))
+    sauna = catalog.get_sauna(1)
+    assert sauna is not None
+    assert sauna.price == 0
+
+
+def test_unreadable_required_column_skips_the_row():
+    rows, skipped = parse_rows("Menu", [
+        ["id", "restaurant_id", "name", "price", "weight"],
+        [1, 1, "カレー", "時価", ""],
+        [2, 1, "ビール", 600, "重い"],
+        ["", "", "", "", ""],
+    ])
+    assert skipped == 1
+    assert rows == (MenuItem(2, 1, "ビール", 600, weight=None),)
+
+
+def test_rows_without_a_name_are_skipped_silently():
+    rows, skipped = parse_rows("Saunas", [["id", "name"], [1, "サウナA"], [2, ""]])
+    assert skipped == 0
+    assert [r.id for r in rows] == [1]
+
+
+def test_missing_required_column():
+    with pytest.raises(SchemaError, match="missing column 'price'"):
+        parse_rows("Menu", [["id", "restaurant_id", "name"], [1, 1, "カレー"]])
+
+
+def test_menu_tag_relation_alias():
+    rows, _ = parse_rows("MenuTagRelation", [["MenuItemId", "tag_id"], [3, 1]])
+    assert rows[0].menu_item_id == 3
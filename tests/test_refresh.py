@@ -0,0 +1,185 @@
+import threading
+
+import pytest
+
+from sameshi.cache import SqliteTTLCache
+from sameshi.refresh import RefreshingCatalog
+from sameshi.snapshot import build_snapshot, load_snapshot
+
+
+class FakeSpreadsheet:
+    """modifiedTime と values_batch_get だけを持つ gspread.Spreadsheet の代わり。"""
+
+    def __init__(self, values, modified_time="t1"):
+        self.values = values
+        self.modified_time = modified_time
+        self.fetches = 0
+        self.fail = False
+        self.gate = None
+
+    def get_lastUpdateTime(self):
+        return self.modified_time
+
+    def values_batch_get(self, ranges):
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail:
+            raise ConnectionError("sheets unavailable")
+        self.fetches += 1
+        names = [r.split("!")[0].strip("'") for r in ranges]
+        return {"valueRanges": [{"values": self.values[name]} for name in names]}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def spreadsheet(sheet_values):
+    return FakeSpreadsheet(sheet_values)
+
+
+def make_store(spreadsheet, clock=None, **kwargs):
+    store = RefreshingCatalog("sheet", object(), check_interval=60, clock=clock or Clock(), **kwargs)
+    store._spreadsheet = spreadsheet
+    return store
+
+
+def wait_for_refresh(store):
+    for thread in threading.enumerate():
+        if thread.name == "sameshi-sheet-refresh":
+            thread.join(5)
+
+
+def test_get_serves_the_snapshot_until_the_interval_passes(spreadsheet):
+    clock = Clock()
+    store = make_store(spreadsheet, clock)
+    catalog = store.get()
+    clock.now = 59
+    assert store.get() is catalog
+    assert spreadsheet.fetches == 1
+
+
+def test_unchanged_modified_time_skips_the_fetch(spreadsheet):
+    store = make_store(spreadsheet)
+    store.get()
+    assert store.refresh() is False
+    assert spreadsheet.fetches == 1
+
+
+def test_only_changed_worksheets_are_rebuilt(spreadsheet):
+    store = make_store(spreadsheet)
+    before = store.snapshot
+    spreadsheet.values["Menu"][1][3] = 950
+    spreadsheet.modified_time = "t2"
+    assert store.refresh() is True
+    after = store.snapshot
+    assert after.catalog is not before.catalog
+    assert after.catalog.version != before.catalog.version
+    assert after.tables["Menu"] is not before.tables["Menu"]
+    assert after.tables["Saunas"] is before.tables["Saunas"]
+    assert after.catalog.get_menu_items_by_restaurant(1)[0].price == 950
+
+
+def test_same_values_keep_the_catalog(spreadsheet):
+    store = make_store(spreadsheet)
+    catalog = store.get()
+    tables = store.snapshot.tables
+    spreadsheet.modified_time = "t2"
+    assert store.refresh() is False
+    assert store.get() is catalog
+    assert all(store.snapshot.tables[name] is tables[name] for name in tables)
+    assert store.snapshot.modified_time == "t2"
+
+
+def test_reader_keeps_the_old_snapshot_while_refreshing(spreadsheet):
+    clock = Clock()
+    store = make_store(spreadsheet, clock)
+    old = store.get()
+    spreadsheet.values["Saunas"][1][1] = "サウナZ"
+    spreadsheet.modified_time = "t2"
+    spreadsheet.gate = threading.Event()
+    clock.now = 60
+    assert store.get() is old
+    assert store.get() is old
+    spreadsheet.gate.set()
+    wait_for_refresh(store)
+    assert store.get().get_sauna(1).name == "サウナZ"
+    # 更新中に来た読み手は取り直しを重ねて起こさない
+    assert spreadsheet.fetches == 2
+
+
+def test_failed_refresh_keeps_the_last_good_snapshot(spreadsheet):
+    clock = Clock()
+    store = make_store(spreadsheet, clock)
+    old = store.get()
+    spreadsheet.modified_time = "t2"
+    spreadsheet.fail = True
+    clock.now = 60
+    assert store.refresh_in_background() is True
+    wait_for_refresh(store)
+    assert store.get() is old
+    with pytest.raises(ConnectionError):
+        store.refresh()
+    assert store.get() is old
+
+
+def test_offline_store_serves_the_initial_snapshot_only(sheet_values):
+    initial = build_snapshot(sheet_values, "t0")
+    clock = Clock()
+    store = RefreshingCatalog("sheet", None, initial=initial, clock=clock)
+    assert store.offline
+    clock.now = 3600
+    assert store.get() is initial.catalog
+    assert store._spreadsheet is None
+    with pytest.raises(RuntimeError):
+        RefreshingCatalog("sheet", None).get()
+
+
+def test_fetched_values_are_persisted(spreadsheet, tmp_path):
+    path = str(tmp_path / "snapshot.sqlite")
+    store = make_store(spreadsheet, persist_path=path)
+    catalog = store.get()
+    assert load_snapshot(path).catalog.version == catalog.version
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return SqliteTTLCache(str(tmp_path / "shared.sqlite"), ttl=None)
+
+
+def test_replica_starts_from_the_shared_snapshot(spreadsheet, shared):
+    first = make_store(spreadsheet, shared=shared)
+    catalog = first.get()
+    assert spreadsheet.fetches == 1
+
+    # 2台目は Sheets にも Drive にも触れずに同じ版で起動する
+    second = RefreshingCatalog("sheet", object(), shared=shared)
+    assert second.get().version == catalog.version
+    assert second._spreadsheet is None
+    offline = RefreshingCatalog("sheet", None, shared=shared)
+    assert offline.get().version == catalog.version
+
+
+def test_refresh_reuses_a_snapshot_another_replica_fetched(spreadsheet, shared):
+    first = make_store(spreadsheet, shared=shared)
+    second = make_store(spreadsheet, shared=shared)
+    second.get()
+    spreadsheet.values["Menu"][1][3] = 950
+    spreadsheet.modified_time = "t2"
+    assert first.refresh() is True
+    assert spreadsheet.fetches == 2
+    assert second.refresh() is True
+    assert spreadsheet.fetches == 2
+    assert second.get().version == first.get().version
+
+
+def test_broken_shared_snapshot_falls_back_to_sheets(spreadsheet, shared):
+    shared.set("snapshot:sheet", b"broken")
+    store = make_store(spreadsheet, shared=shared)
+    assert store.get().get_sauna(1).name == "サウナA"
+    assert spreadsheet.fetches == 1
@@ -0,0 +1,45 @@
+import subprocess
+import sys
+
+from sameshi.service import SameshiService, open_catalog_store
+from sameshi.snapshot import write_snapshot
+from tests.test_places import FakeGoogleMaps, place
+
+
+def test_import_does_not_load_google_clients():
+    code = "import sys, sameshi.service; print(sorted(m for m in ('googlemaps', 'gspread', 'oauth2client', 'pydeck', 'PIL') if m in sys.modules))"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert out.strip() == "[]"
+
+
+def test_offline_store_serves_the_snapshot(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values)
+    store = open_catalog_store("sheet", None, snapshot_path=path)
+    assert store.get().get_sauna(1).name == "サウナA"
+
+
+def test_gacha_engine_follows_the_catalog_version(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values)
+    service = SameshiService(open_catalog_store("sheet", None, snapshot_path=path), cache_dir=str(tmp_path))
+    engine = service.gacha_engine()
+    assert service.gacha_engine() is engine
+    assert [m.category for m in service.pull_gacha(1)] == ["main", "drink", "drink"]
+
+    sheet_values["Menu"][1][2] = "別メニュー"
+    write_snapshot(path, sheet_values)
+    updated = open_catalog_store("sheet", None, snapshot_path=path).get()
+    assert service.gacha_engine(updated) is not engine
+    assert service.gacha_engine(updated).version == updated.version
+
+
+def test_find_nearby_uses_the_injected_client_and_disk_cache(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values)
+    gmaps = FakeGoogleMaps({"ラーメン": [place("r1", 4.2)]})
+    service = SameshiService(open_catalog_store("sheet", None, snapshot_path=path), cache_dir=str(tmp_path), gmaps=gmaps)
+    assert [s["name"] for s in service.find_nearby_good_food(35.0, 139.0)] == ["r1"]
+    service.find_nearby_good_food(35.0, 139.0)
+    assert gmaps.calls["ラーメン"] == 1
+    assert (tmp_path / "places.sqlite").exists()
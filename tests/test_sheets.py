@@ -0,0 +1,28 @@
+from sameshi.sheets import SHEET_NAMES, fetch_values
+
+
+class FakeSpreadsheet:
+    """values_batch_get だけを持つ gspread.Spreadsheet の代わり。"""
+
+    def __init__(self, values):
+        self.values = values
+        self.requests = []
+
+    def values_batch_get(self, ranges):
+        self.requests.append(list(ranges))
+        names = [r.split("!")[0].strip("'") for r in ranges]
+        return {"valueRanges": [{"values": self.values[name]} for name in names]}
+
+
+def test_fetch_values_uses_one_batch_request(sheet_values):
+    spreadsheet = FakeSpreadsheet(sheet_values)
+    values = fetch_values(spreadsheet)
+    assert len(spreadsheet.requests) == 1
+    assert list(values) == list(SHEET_NAMES)
+    assert values == sheet_values
+
+
+def test_fetch_values_with_no_names():
+    spreadsheet = FakeSpreadsheet({})
+    assert fetch_values(spreadsheet, ()) == {}
+    assert spreadsheet.requests == []
@@ -0,0 +1,77 @@
+import sqlite3
+import zlib
+
+import pytest
+
+from sameshi import snapshot
+from sameshi.snapshot import build_snapshot, load_snapshot, pack_values, read_snapshot_values, unpack_values, write_snapshot
+
+
+def test_write_and_load_round_trip(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values, modified_time="2024-01-01T00:00:00Z")
+
+    loaded = load_snapshot(path)
+    live = build_snapshot(sheet_values, "2024-01-01T00:00:00Z")
+    assert loaded.modified_time == "2024-01-01T00:00:00Z"
+    # スナップショット由来とシート由来のカタログは同じ版になる
+    assert loaded.catalog.version == live.catalog.version
+    assert [s.name for s in loaded.catalog.saunas] == ["サウナA", "サウナB"]
+    assert read_snapshot_values(path)[0] == sheet_values
+
+
+def test_write_replaces_the_previous_file(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values, modified_time="t1")
+    sheet_values["Saunas"][1][1] = "サウナZ"
+    write_snapshot(path, sheet_values, modified_time="t2")
+    assert load_snapshot(path).catalog.get_sauna(1).name == "サウナZ"
+    assert [p.name for p in tmp_path.iterdir()] == ["snapshot.sqlite"]
+
+
+def test_build_reuses_unchanged_tables(sheet_values):
+    first = build_snapshot(sheet_values, "t1")
+    sheet_values["Menu"][1][3] = 950
+    second = build_snapshot(sheet_values, "t2", first)
+    assert second.tables["Saunas"] is first.tables["Saunas"]
+    assert second.tables["Menu"] is not first.tables["Menu"]
+    assert second.catalog.version != first.catalog.version
+
+
+def test_load_rejects_other_schema_version(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    write_snapshot(path, sheet_values)
+    conn = sqlite3.connect(path)
+    conn.execute("UPDATE meta SET value = ? WHERE key = 'schema_version'", (str(snapshot.SCHEMA_VERSION + 1),))
+    conn.commit()
+    conn.close()
+
+    with pytest.raises(ValueError, match="schema version"):
+        load_snapshot(path)
+
+
+def test_load_rejects_missing_worksheet(tmp_path, sheet_values):
+    path = str(tmp_path / "snapshot.sqlite")
+    del sheet_values["MenuTags"]
+    write_snapshot(path, sheet_values)
+    with pytest.raises(ValueError, match="missing worksheets"):
+        load_snapshot(path)
+
+
+def test_load_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_snapshot(str(tmp_path / "missing.sqlite"))
+
+
+def test_pack_and_unpack_values(sheet_values):
+    assert unpack_values(pack_values(sheet_values, "t1")) == (sheet_values, "t1")
+
+
+def test_unpack_rejects_broken_or_foreign_blobs(sheet_values):
+    with pytest.raises(ValueError, match="broken"):
+        unpack_values(b"not zlib")
+    with pytest.raises(ValueError, match="schema version"):
+        unpack_values(zlib.compress(b'{"schema_version": 0, "values": {}}'))
+    del sheet_values["Menu"]
+    with pytest.raises(ValueError, match="missing worksheets"):
+        unpack_values(pack_values(sheet_values))
@@ -0,0 +1,86 @@
+import itertools
+
+import pytest
+
+from sameshi import tags
+from sameshi.catalog import Catalog
+from sameshi.records import MenuItem
+from sameshi.tags import TagFilter, TagIndex, iter_bits, parse_tag_filter
+
+
+@pytest.fixture
+def catalog(sheet_values):
+    return Catalog.from_values(sheet_values)
+
+
+def names(items):
+    return [item.name for item in items]
+
+
+def test_parse_tag_filter():
+    assert parse_tag_filter("#辛い ご当地|限定 -甘い !苦い") == TagFilter(
+        (frozenset({"ご当地", "限定"}), frozenset({"辛い"})), frozenset({"甘い", "苦い"})
+    )
+    assert parse_tag_filter("ご当地、辛い") == parse_tag_filter("辛い ご当地 辛い")
+    assert not parse_tag_filter("  ")
+    assert str(parse_tag_filter("限定|ご当地 -甘い")) == "ご当地|限定 -甘い"
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("辛い", ["カレー"]),
+    ("ご当地", ["カレー", "ビール"]),
+    ("辛い ご当地", ["カレー"]),
+    ("辛い|ご当地", ["カレー", "ビール"]),
+    ("ご当地 -辛い", ["ビール"]),
+    ("-ご当地", ["サワー"]),
+    ("無いタグ", []),
+])
+def test_filter_sauna(catalog, text, expected):
+    assert names(catalog.tag_index.filter_sauna(1, parse_tag_filter(text))) == expected
+
+
+def test_filter_items_matches_filter_sauna(catalog):
+    index = catalog.tag_index
+    terms = ["辛い", "ご当地", "-辛い", "-ご当地", "辛い|ご当地", "無いタグ"]
+    menu_items = list(catalog.menu_items)
+    for n in range(3):
+        for combo in itertools.combinations(terms, n):
+            tag_filter = parse_tag_filter(" ".join(combo))
+            for sauna in catalog.saunas:
+                assert index.filter_items(catalog.get_all_menu_items_for_sauna(sauna.id), tag_filter) == \
+                    index.filter_sauna(sauna.id, tag_filter)
+            expected = [
+                item for item in menu_items
+                if all(set(catalog.get_tags_for_menu_item(item.id)) & c for c in tag_filter.clauses)
+                and not set(catalog.get_tags_for_menu_item(item.id)) & tag_filter.excluded
+            ]
+            assert index.filter_items(menu_items, tag_filter) == expected
+
+
+def test_filter_items_with_unknown_items(catalog):
+    stranger = MenuItem(99, 1, "知らない", 100, "main")
+    assert catalog.tag_index.filter_items([stranger], parse_tag_filter("-辛い")) == [stranger]
+    assert catalog.tag_index.filter_items([stranger], parse_tag_filter("辛い")) == []
+
+
+def test_sauna_masks_are_cached_per_sauna_and_filter(catalog, monkeypatch):
+    monkeypatch.setattr(tags, "SAUNA_MASK_CACHE_SIZE", 2)
+    index = TagIndex(catalog)
+    spicy, local = parse_tag_filter("辛い"), parse_tag_filter("ご当地")
+    assert index.sauna_mask(1, spicy) == 0b001
+    assert index.sauna_mask(1, local) == 0b011
+    assert list(index._sauna_masks) == [(1, spicy), (1, local)]
+    # 全体のビット集合を作り直さずに返す
+    index._masks.clear()
+    assert index.sauna_mask(1, spicy) == 0b001
+    assert not index._masks
+    index.sauna_mask(2, spicy)
+    assert list(index._sauna_masks) == [(1, spicy), (2, spicy)]
+    assert index.sauna_mask(99, spicy) == 0
+
+
+def test_tag_names_and_ranges(catalog):
+    index = TagIndex(catalog)
+    assert index.tag_names == ["辛い", "ご当地"]
+    assert index.ranges == {1: (0, 3), 2: (3, 5)}
+    assert list(iter_bits(0b10110)) == [1, 2, 4]
@@ -0,0 +1,54 @@
+from sameshi import templates
+from sameshi.records import MenuItem, Sauna
+
+SAUNA = Sauna(1, "サウナA", 35.0, 139.0, 1000)
+
+EVIL = '<script>alert("x")</script>'
+
+
+def test_gacha_results_escape_sheet_strings():
+    menus = [
+        MenuItem(1, 1, EVIL, 900, "1行目\n\n<b>2行目</b>", "main", "curry.jpg"),
+        MenuItem(2, 1, "ビール & 枝豆", 600, "", "drink", ""),
+    ]
+    markup = templates.gacha_results(
+        menus,
+        SAUNA,
+        tags_of=lambda menu_id: ['"><img src=x onerror=alert(1)>'] if menu_id == 1 else [],
+        image_of=lambda name: f"/static/{name}?a=1&b=2" if name else None,
+    )
+    assert "<script>" not in markup and "<img src=x" not in markup
+    assert "&lt;script&gt;alert(&quot;x&quot;)&lt;/script&gt;" in markup
+    assert "#&quot;&gt;&lt;img src=x onerror=alert(1)&gt;" in markup
+    # 空行で Markdown の HTML ブロックが途切れないように改行は <br> にする
+    assert "1行目<br><br>&lt;b&gt;2行目&lt;/b&gt;" in markup and "\n" not in markup
+    assert "ビール &amp; 枝豆" in markup
+    assert 'src="/static/curry.jpg?a=1&amp;b=2"' in markup
+    assert markup.count('class="card-image"') == 1
+    assert "サウナ入浴料: ￥1000" in markup and "合計: ￥2500" in markup
+    assert 'animation-delay: 0.3s;' in markup
+
+
+def test_nearby_cards_escape_places_strings():
+    stores = [
+        {"name": "<i>店</i>", "keyword": "カレー", "rating": 4.4, "photo_reference": "p1",
+         "maps_url": 'https://maps.example/?q="><script>'},
+        {"name": "二軒目", "keyword": "謎", "rating": 3.6, "photo_reference": None, "maps_url": "https://maps.example/"},
+    ]
+    markup = templates.nearby_cards(stores, {"p1": "QUJD"})
+    assert "<i>" not in markup and "&lt;i&gt;店&lt;/i&gt;" in markup
+    assert 'href="https://maps.example/?q=&quot;&gt;&lt;script&gt;"' in markup
+    assert "🍛" in markup and "🍴" in markup and "⭐" * 4 in markup
+    assert 'src="data:image/jpeg;base64,QUJD"' in markup
+    assert templates.EMPTY_IMAGE in markup
+
+
+def test_page_header_escapes_urls_and_is_built_once():
+    header = templates.page_header('/static/logo.png?"x', "/static/stamp.png")
+    assert 'src="/static/logo.png?&quot;x"' in header
+    assert header.startswith("<style>") and "/*" not in header
+    assert templates.page_header('/static/logo.png?"x', "/static/stamp.png") is header
+
+
+def test_minify_css():
+    assert templates.minify_css("/* c */\n.a {\n  color: red;\n}\n") == ".a{color:red;}"